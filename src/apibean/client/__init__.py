@@ -1,17 +1,115 @@
-import httpx
+"""The ready-to-use objects of apibean: `space`, `curli`, `agent`, `tools`, `acurli` and
+`aagent`. They are built on first access (and the engine imported then), so that
+importing `apibean.client` stays cheap for the short-lived processes.
+"""
+
+import os
+import threading
+
+STORE_PATH = os.environ.get("APIBEAN_STORE_PATH")
+
+_ENGINE_NAMES = frozenset(["Agent", "Curli", "Store", "Tools", "AsyncAgent", "AsyncCurli",
+        "AsyncPooledInvoker", "PersistentStore"])
+
+class _LazyStore:
+    """A store of Space, built on first access and then set on the class in place
+    of this descriptor: a PersistentStore when STORE_PATH is set, a Store otherwise.
+    """
+
+    def __init__(self, profile, namespace):
+        self._profile = profile
+        self._namespace = namespace
+
+    def __set_name__(self, owner, name):
+        self._owner = owner
+        self._name = name
+
+    def __get__(self, instance, owner = None):
+        with _lock:
+            store = self._owner.__dict__[self._name]
+            if store is self:
+                from .engine import PersistentStore, Store
+                if STORE_PATH:
+                    store = PersistentStore(STORE_PATH, profile = self._profile, namespace = self._namespace)
+                else:
+                    store = Store(profile = self._profile)
+                setattr(self._owner, self._name, store)
+        return store
 
-from .engine import Agent, Curli, Store, Tools
 
 class Space:
-    account = Store(profile = "anon")
-    session = Store(profile = "main")
-
-space = Space()
-curli = Curli(httpx, session_store=space.session, account_store=space.account)
-agent = Agent(curli)
-tools = Tools()
-
-curli.default(headers={
-    "accept": "application/json",
-    "Content-Type": "application/json",
-})
+    account = _LazyStore(profile = "anon", namespace = "account")
+    session = _LazyStore(profile = "main", namespace = "session")
+
+
+def _build_curli():
+    import httpx
+    from .engine import Curli
+    space = _get("space")
+    curli = Curli(httpx, session_store=space.session, account_store=space.account)
+    curli.default(headers={
+        "accept": "application/json",
+        "Content-Type": "application/json",
+    })
+    return curli
+
+
+def _build_agent():
+    from .engine import Agent
+    return Agent(_get("curli"))
+
+
+def _build_tools():
+    from .engine import Tools
+    return Tools()
+
+
+def _build_acurli():
+    from .engine import AsyncCurli, AsyncPooledInvoker
+    space = _get("space")
+    # the session defaults are shared with curli, which sets them
+    _get("curli")
+    # its clients are kept per event loop, so acurli serves successive asyncio.run() calls
+    return AsyncCurli(AsyncPooledInvoker(), session_store=space.session, account_store=space.account)
+
+
+def _build_aagent():
+    from .engine import AsyncAgent
+    return AsyncAgent(_get("acurli"))
+
+
+_BUILDERS = {
+    "space": Space,
+    "curli": _build_curli,
+    "agent": _build_agent,
+    "tools": _build_tools,
+    "acurli": _build_acurli,
+    "aagent": _build_aagent,
+}
+
+_lock = threading.RLock()
+
+__all__ = ["STORE_PATH", "Space", "space", "curli", "agent", "tools", "acurli", "aagent",
+        "Agent", "AsyncAgent", "AsyncCurli", "AsyncPooledInvoker", "Curli", "PersistentStore", "Store", "Tools"]
+
+def _get(name):
+    value = globals().get(name)
+    if value is None:
+        with _lock:
+            value = globals().get(name)
+            if value is None:
+                value = globals()[name] = _BUILDERS[name]()
+    return value
+
+
+def __getattr__(name):
+    if name in _BUILDERS:
+        return _get(name)
+    if name in _ENGINE_NAMES:
+        from . import engine
+        return getattr(engine, name)
+    raise AttributeError(f"module { __name__!r} has no attribute { name!r}")
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(__all__))
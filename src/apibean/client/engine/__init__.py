@@ -1,5 +1,57 @@
-from ._agent import Agent
-from ._curli import Curli
-from ._helpers import ResponseWrapper
-from ._store import Store
-from ._tools import Tools
+"""The engine of apibean.client. The public names are imported from their modules on
+first access, so that importing one of them does not import the whole engine
+(and `httpx`) upfront.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "._agent": ["Agent"],
+    "._async_agent": ["AsyncAgent"],
+    "._async_curli": ["AsyncCurli"],
+    "._cache": ["AsyncCachingInvoker", "CachingInvoker", "ResponseCache"],
+    "._cassette": ["AsyncCassetteInvoker", "Cassette", "CassetteInvoker", "CassetteMissError"],
+    "._coalesce": ["AsyncCoalescingInvoker", "CoalescingInvoker"],
+    "._curli": ["Curli"],
+    "._helpers": ["ResponseWrapper", "use_fast_json"],
+    "._instrument": ["Instrumentation", "LatencyAggregator", "RequestTiming"],
+    "._invokers": ["AsyncPooledInvoker", "PooledInvoker"],
+    "._limits": ["AsyncThrottlingInvoker", "InFlightLimit", "LimitRule", "RateLimiter", "ThrottlingInvoker",
+            "TokenBucket"],
+    "._loadgen": ["LoadReport", "LoadRunner", "VirtualUser"],
+    "._paging": ["Pagination"],
+    "._persistent": ["PersistentStore"],
+    "._pool": ["AccountContext", "AccountPool"],
+    "._policies": ["CircuitBreaker", "CircuitOpenError", "RetryPolicy",
+            "AsyncRetryingInvoker", "RetryingInvoker"],
+    "._reqlog": ["RequestLog"],
+    "._store": ["Store"],
+    "._streaming": ["aiter_file_chunks", "iter_file_chunks"],
+    "._token": ["TokenKeeper"],
+    "._tools": ["Tools"],
+}
+
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+
+# spelled out for the linters and `import *`, it must list the names of _EXPORTS
+__all__ = [
+    "AccountContext", "AccountPool", "Agent", "aiter_file_chunks", "AsyncAgent", "AsyncCachingInvoker",
+    "AsyncCassetteInvoker", "AsyncCoalescingInvoker", "AsyncCurli", "AsyncPooledInvoker",
+    "AsyncRetryingInvoker", "AsyncThrottlingInvoker", "CachingInvoker", "Cassette", "CassetteInvoker",
+    "CassetteMissError", "CircuitBreaker", "CircuitOpenError", "CoalescingInvoker", "Curli",
+    "InFlightLimit", "Instrumentation", "iter_file_chunks", "LatencyAggregator", "LimitRule",
+    "LoadReport", "LoadRunner", "Pagination", "PersistentStore", "PooledInvoker", "RateLimiter",
+    "RequestLog", "RequestTiming", "ResponseCache", "ResponseWrapper", "RetryingInvoker", "RetryPolicy",
+    "Store", "ThrottlingInvoker", "TokenBucket", "TokenKeeper", "Tools", "use_fast_json", "VirtualUser",
+]
+
+def __getattr__(name):
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError(f"module { __name__!r} has no attribute { name!r}")
+    value = globals()[name] = getattr(importlib.import_module(module, __name__), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(__all__))
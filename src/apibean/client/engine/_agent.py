@@ -1,5 +1,7 @@
 from typing import Self
 
+import warnings
+
 from ._consts import JF_BASE_URL
 from ._consts import JF_USERNAME
 from ._consts import JF_PASSWORD
@@ -12,6 +14,7 @@ from ._consts import JF_EXPIRATION
 
 from ._curli import Curli
 from ._decorators import deprecated
+from ._token import TokenKeeper
 from ._utils import to_datetime, get_now
 
 class Agent:
@@ -35,6 +38,7 @@ class Agent:
 
     def __init__(self, curli):
         self._curli = curli
+        self._expirations = dict()
 
     def as_account(self, *args, **kwargs) -> Self:
         self._curli.as_account(*args, **kwargs)
@@ -44,6 +48,9 @@ class Agent:
         self._curli.in_session(*args, **kwargs)
         return self
 
+    def using(self, account = None, session = None):
+        return self._curli.using(account=account, session=session)
+
     @property
     def _account(self):
         return getattr(self._curli, "_account")
@@ -61,16 +68,57 @@ class Agent:
     def is_still_valid(self):
         if not self.is_authenticated():
             return None
-        expires = to_datetime(self._account.get(JF_EXPIRATION))
+        expires = self.get_expiration()
         if expires <= get_now():
             return False
         return True
 
+    def get_expiration(self):
+        """Returns the expiration of the access_token of the current account as a
+        datetime. The parsed value is cached per account profile and re-parsed only
+        when the stored expiration changes.
+        """
+        expiration = self._account.get(JF_EXPIRATION)
+        if expiration is None:
+            return None
+        profile = self._account.profile
+        cached = self._expirations.get(profile)
+        if cached is not None and cached[0] == expiration:
+            return cached[1]
+        expires = to_datetime(expiration)
+        self._expirations[profile] = (expiration, expires)
+        return expires
+
+    def enable_auto_refresh(self, skew: float = 30.0, retry_on_401: bool = True,
+            url: str = "auth/refresh-token", failure_backoff: float = 5.0) -> Self:
+        """Lets the bound Curli object refresh the access_token `skew` seconds before
+        it expires, and optionally retry once a request rejected with 401. After a
+        failed refresh, no other one is tried for `failure_backoff` seconds.
+        """
+        self._curli.token_keeper = TokenKeeper(self, skew=skew, retry_on_401=retry_on_401, url=url,
+                failure_backoff=failure_backoff)
+        return self
+
+    def disable_auto_refresh(self) -> Self:
+        self._curli.token_keeper = None
+        return self
+
     @deprecated
     def auth(self, *args, **kwargs):
         return self.login(*args, **kwargs)
 
     def login(self, username = None, password = None, json = None, url:str = "auth/login", **kwargs):
+        r = self._send(self._login_request(username, password, json, url, kwargs))
+        return self._capture_account(r)
+
+    def _send(self, spec):
+        method, url, kwargs = _unsummarized(spec)
+        return self._curli.request(method, url, **kwargs)
+
+    def _login_request(self, username, password, json, url, kwargs) -> tuple:
+        """Builds the `(method, url, kwargs)` request spec of a login, shared by Agent and
+        AsyncAgent (the same builders exist for the other operations).
+        """
         body = json if isinstance(json, dict) else dict()
 
         if username:
@@ -81,8 +129,9 @@ class Agent:
         kwargs = dict(filter(lambda item: item[0] != 'json', kwargs.items()))
         kwargs.update(access_token=None)
 
-        r = self._curli.post(url, json = body, **kwargs)
+        return ("POST", url, dict(kwargs, json=body))
 
+    def _capture_account(self, r):
         if r.is_success:
             self.as_account(**self._extract_cached(r))
 
@@ -105,11 +154,16 @@ class Agent:
             raise RuntimeError(f"{ field_name } is empty")
 
     def change_password(self, current_password, new_password, url:str = "auth/change-password", **kwargs):
-        return self._curli.post(url,
-                json=dict(current_password=current_password, new_password=new_password),
-                **kwargs)
+        return self._send(self._change_password_request(current_password, new_password, url, kwargs))
+
+    def _change_password_request(self, current_password, new_password, url, kwargs) -> tuple:
+        return ("POST", url, dict(kwargs,
+                json=dict(current_password=current_password, new_password=new_password)))
 
     def refresh_token(self, url:str = "auth/refresh-token", **kwargs):
+        return self._capture_account(self._send(self._refresh_token_request(url, kwargs)))
+
+    def _refresh_token_request(self, url, kwargs) -> tuple:
         email = self._account.get(JF_EMAIL)
         if not email:
             raise RuntimeError(f"{ JF_EMAIL } not found")
@@ -118,15 +172,12 @@ class Agent:
         if not refresh_token:
             raise RuntimeError(f"{ JF_REFRESH_TOKEN } not found")
 
-        r = self._curli.post(url, json=dict(email=email, refresh_token=refresh_token), **kwargs)
-
-        if r.is_success:
-            self.as_account(**self._extract_cached(r))
-
-        return r
+        return ("POST", url, dict(kwargs, json=dict(email=email, refresh_token=refresh_token)))
 
     def logout(self, url:str = "auth/logout", **kwargs):
-        r = self._curli.get(url, **kwargs)
+        return self._clear_access_token(self._send(("GET", url, kwargs)))
+
+    def _clear_access_token(self, r):
         if r.is_success:
             self.as_account(access_token = None)
         return r
@@ -134,13 +185,147 @@ class Agent:
     def activate_user_id(self, user_id, password = None, url:str = "auth/activate", **kwargs):
         """Any user excepts anon & root could use this API to activate his account
         """
-        backup_profile = self._account.profile
-        user_response = self._curli.as_account("root").get("user/" + user_id)
-        self._curli.as_account(backup_profile)
+        with self._curli.using(account="root"):
+            user_response = self._send(self._user_request(user_id))
         activation_code = user_response.json().get(JF_ACTIVATION_CODE)
         return self.activate(activation_code, password, url=url, **kwargs)
 
+    def _user_request(self, user_id) -> tuple:
+        return ("GET", "user/" + user_id, dict())
+
     def activate(self, activation_code, password = None, url:str = "auth/activate", **kwargs):
-        r = self._curli.post(url, json = dict(activation_code=activation_code, password=password),
-                access_token=None, **kwargs)
-        return r
+        return self._send(self._activate_request(activation_code, password, url, kwargs))
+
+    def _activate_request(self, activation_code, password, url, kwargs) -> tuple:
+        return ("POST", url, dict(kwargs, json=dict(activation_code=activation_code, password=password),
+                access_token=None))
+
+    def activate_many(self, user_ids, password = None, concurrency: int = 10, root_profile: str = "root",
+            url:str = "auth/activate", list_url: str|None = None,
+            list_max_pages: int = 100, **kwargs) -> dict:
+        """Activates many users concurrently and returns the activation response (or the
+        error) of each user id, see `activate_many_iter()` for the arguments.
+        """
+        return dict(self.activate_many_iter(user_ids, password, concurrency=concurrency,
+                root_profile=root_profile, url=url, list_url=list_url,
+                list_max_pages=list_max_pages, **kwargs))
+
+    def activate_many_iter(self, user_ids, password = None, concurrency: int = 10, root_profile: str = "root",
+            url:str = "auth/activate", list_url: str|None = None,
+            list_max_pages: int = 100, **kwargs):
+        """Activates many users concurrently, with `batch_iter()` and `concurrency` workers.
+        `user_ids` is a list of ids (all of the users get `password`) or a
+        `{ user_id: password }` dict.
+
+        The activation codes are fetched one by one with the `root_profile` account.
+        With `list_url` (e.g. "user"), they are first fetched in bulk by paging
+        through that endpoint, up to `list_max_pages` pages; the users missing from
+        the listing are then fetched one by one, and so are all of them when the
+        listing fails (with a `RuntimeWarning`).
+
+        Yields `(user_id, response_or_error)` pairs as soon as the activations
+        complete. When an activation response carries the tokens of the user, they
+        are captured into the account profile named after the user id.
+        """
+        passwords = _passwords_of(user_ids, password)
+        codes, errors = dict(), dict()
+        if list_url:
+            try:
+                with self._curli.using(account=root_profile):
+                    for user in self._curli.paginate(list_url, max_pages=list_max_pages):
+                        if _pick_activation_code(user, passwords, codes):
+                            break
+            except Exception as error:
+                # the users which have not been picked are fetched one by one
+                _warn_listing_failed(list_url, error)
+        missing = [user_id for user_id in passwords if user_id not in codes]
+        if missing:
+            with self._curli.using(account=root_profile):
+                for index, r in self._curli.batch_iter([_unsummarized(self._user_request(user_id))
+                        for user_id in missing], concurrency=concurrency, fail_fast=False):
+                    self._read_activation_code(missing[index], r, codes, errors)
+        yield from errors.items()
+
+        user_ids = list(codes)
+        specs = [_unsummarized(self._activate_request(codes[user_id], passwords[user_id], url, kwargs))
+                for user_id in user_ids]
+        for index, r in self._curli.batch_iter(specs, concurrency=concurrency, fail_fast=False):
+            if not isinstance(r, Exception):
+                self._capture_tokens(r, user_ids[index])
+            yield user_ids[index], r
+
+    def login_many(self, credentials: dict, concurrency: int = 10, **kwargs) -> dict:
+        """Logs in many accounts concurrently and returns the login response (or the
+        error) of each account profile, see `login_many_iter()` for the arguments.
+        """
+        return dict(self.login_many_iter(credentials, concurrency=concurrency, **kwargs))
+
+    def login_many_iter(self, credentials: dict, concurrency: int = 10, **kwargs):
+        """Logs in many accounts concurrently, with `batch_iter()` and `concurrency` workers.
+        `credentials` maps each account profile to the keyword arguments of `login()`
+        (username, password, ...), the tokens are captured into that profile.
+
+        Yields `(profile, response_or_error)` pairs as soon as the logins complete.
+        """
+        profiles = list(credentials)
+        specs = [_unsummarized(self._login_many_request(dict(kwargs, **credentials[profile])))
+                for profile in profiles]
+        for index, r in self._curli.batch_iter(specs, concurrency=concurrency, fail_fast=False):
+            if not isinstance(r, Exception):
+                self._capture_tokens(r, profiles[index])
+            yield profiles[index], r
+
+    def _login_many_request(self, params) -> tuple:
+        json = params.pop("json", None)
+        # the json body of the shared keyword arguments is completed per account
+        return self._login_request(params.pop("username", None), params.pop("password", None),
+                dict(json) if isinstance(json, dict) else json, params.pop("url", "auth/login"), params)
+
+    def _read_activation_code(self, user_id, user_response, codes, errors):
+        if isinstance(user_response, Exception):
+            errors[user_id] = user_response
+            return
+        try:
+            codes[user_id] = self._fetch_activation_code(user_response, user_id)
+        except (RuntimeError, ValueError) as error:
+            errors[user_id] = error
+
+    def _fetch_activation_code(self, user_response, user_id):
+        if not user_response.is_success:
+            raise RuntimeError(f"The user { user_id } could not be fetched"
+                    f" (status { user_response.status_code })")
+        return user_response.json().get(JF_ACTIVATION_CODE)
+
+    def _capture_tokens(self, r, profile):
+        body = r.json() if r.is_success else None
+        if isinstance(body, dict) and body.get(JF_ACCESS_TOKEN):
+            with self._curli.using(account=profile):
+                self.as_account(**self._extract_cached(r))
+
+
+def _warn_listing_failed(list_url, error):
+    warnings.warn(f"The listing of { list_url } has failed ({ repr(error) }),"
+            " the activation codes are fetched one by one", RuntimeWarning, stacklevel=3)
+
+
+def _unsummarized(spec) -> tuple:
+    """Returns a request spec of the Agent sent with `summarize=False`: its response
+    is read whole (tokens, activation code), even when the Curli object summarizes
+    the responses.
+    """
+    method, url, kwargs = spec
+    return (method, url, dict(kwargs, summarize=False))
+
+
+def _passwords_of(user_ids, password) -> dict:
+    return user_ids if isinstance(user_ids, dict) else dict.fromkeys(user_ids, password)
+
+
+def _pick_activation_code(user, passwords, codes) -> bool:
+    """Picks the activation code of a user of a listing when it is wanted, returns
+    whether all of the wanted codes have been picked.
+    """
+    user_id = user.get(JF_ID) if isinstance(user, dict) else None
+    if user_id in passwords and user.get(JF_ACTIVATION_CODE):
+        codes[user_id] = user[JF_ACTIVATION_CODE]
+    return len(codes) == len(passwords)
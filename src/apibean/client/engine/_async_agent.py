@@ -0,0 +1,100 @@
+from ._consts import JF_ACTIVATION_CODE
+
+from ._agent import Agent, _passwords_of, _pick_activation_code, _unsummarized, _warn_listing_failed
+from ._async_curli import AsyncCurli
+
+class AsyncAgent(Agent):
+    """The asynchronous variant of Agent, it must be bound to an AsyncCurli object.
+    The authentication operations are coroutines, while the account state checks
+    (`is_authenticated`, `is_still_valid`) remain synchronous.
+    """
+
+    def __init__(self, curli: AsyncCurli):
+        super().__init__(curli)
+
+    async def login(self, username = None, password = None, json = None, url:str = "auth/login", **kwargs):
+        r = await self._send(self._login_request(username, password, json, url, kwargs))
+        return self._capture_account(r)
+
+    async def _send(self, spec):
+        method, url, kwargs = _unsummarized(spec)
+        return await self._curli.request(method, url, **kwargs)
+
+    async def change_password(self, current_password, new_password, url:str = "auth/change-password", **kwargs):
+        return await self._send(self._change_password_request(current_password, new_password, url, kwargs))
+
+    async def refresh_token(self, url:str = "auth/refresh-token", **kwargs):
+        return self._capture_account(await self._send(self._refresh_token_request(url, kwargs)))
+
+    async def logout(self, url:str = "auth/logout", **kwargs):
+        return self._clear_access_token(await self._send(("GET", url, kwargs)))
+
+    async def activate_user_id(self, user_id, password = None, url:str = "auth/activate", **kwargs):
+        """Any user excepts anon & root could use this API to activate his account
+        """
+        with self._curli.using(account="root"):
+            user_response = await self._send(self._user_request(user_id))
+        activation_code = user_response.json().get(JF_ACTIVATION_CODE)
+        return await self.activate(activation_code, password, url=url, **kwargs)
+
+    async def activate(self, activation_code, password = None, url:str = "auth/activate", **kwargs):
+        return await self._send(self._activate_request(activation_code, password, url, kwargs))
+
+    async def activate_many(self, user_ids, password = None, concurrency: int = 100, root_profile: str = "root",
+            url:str = "auth/activate", list_url: str|None = None,
+            list_max_pages: int = 100, **kwargs) -> dict:
+        """The asynchronous variant of `Agent.activate_many()`."""
+        return {user_id: r async for user_id, r in self.activate_many_iter(user_ids, password,
+                concurrency=concurrency, root_profile=root_profile, url=url, list_url=list_url,
+                list_max_pages=list_max_pages, **kwargs)}
+
+    async def activate_many_iter(self, user_ids, password = None, concurrency: int = 100,
+            root_profile: str = "root", url:str = "auth/activate", list_url: str|None = None,
+            list_max_pages: int = 100, **kwargs):
+        """The asynchronous variant of `Agent.activate_many_iter()`, used with `async for`."""
+        passwords = _passwords_of(user_ids, password)
+        codes, errors = dict(), dict()
+        if list_url:
+            try:
+                with self._curli.using(account=root_profile):
+                    users = self._curli.paginate(list_url, max_pages=list_max_pages)
+                    try:
+                        async for user in users:
+                            if _pick_activation_code(user, passwords, codes):
+                                break
+                    finally:
+                        await users.aclose()
+            except Exception as error:
+                # the users which have not been picked are fetched one by one
+                _warn_listing_failed(list_url, error)
+        missing = [user_id for user_id in passwords if user_id not in codes]
+        if missing:
+            with self._curli.using(account=root_profile):
+                async for index, r in self._curli.batch_iter([_unsummarized(self._user_request(user_id))
+                        for user_id in missing], concurrency=concurrency, fail_fast=False):
+                    self._read_activation_code(missing[index], r, codes, errors)
+        for user_id, error in errors.items():
+            yield user_id, error
+
+        user_ids = list(codes)
+        specs = [_unsummarized(self._activate_request(codes[user_id], passwords[user_id], url, kwargs))
+                for user_id in user_ids]
+        async for index, r in self._curli.batch_iter(specs, concurrency=concurrency, fail_fast=False):
+            if not isinstance(r, Exception):
+                self._capture_tokens(r, user_ids[index])
+            yield user_ids[index], r
+
+    async def login_many(self, credentials: dict, concurrency: int = 100, **kwargs) -> dict:
+        """The asynchronous variant of `Agent.login_many()`."""
+        return {profile: r async for profile, r in self.login_many_iter(credentials,
+                concurrency=concurrency, **kwargs)}
+
+    async def login_many_iter(self, credentials: dict, concurrency: int = 100, **kwargs):
+        """The asynchronous variant of `Agent.login_many_iter()`, used with `async for`."""
+        profiles = list(credentials)
+        specs = [_unsummarized(self._login_many_request(dict(kwargs, **credentials[profile])))
+                for profile in profiles]
+        async for index, r in self._curli.batch_iter(specs, concurrency=concurrency, fail_fast=False):
+            if not isinstance(r, Exception):
+                self._capture_tokens(r, profiles[index])
+            yield profiles[index], r
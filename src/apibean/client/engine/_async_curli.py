@@ -0,0 +1,273 @@
+import asyncio
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+import functools
+from typing import Self
+import urllib.parse
+
+from ._consts import JF_ACCESS_TOKEN
+from ._batch import normalize_request_spec
+from ._cache import AsyncCachingInvoker, ResponseCache
+from ._cassette import AsyncCassetteInvoker, Cassette
+from ._coalesce import AsyncCoalescingInvoker
+from ._curli import Curli, _extract_bearer_token
+from ._helpers import fill_ids_map
+from ._invokers import AsyncPooledInvoker
+from ._limits import AsyncThrottlingInvoker, RateLimiter
+from ._paging import Pagination
+from ._policies import AsyncRetryingInvoker
+from ._streaming import DEFAULT_CHUNK_SIZE, aiter_file_chunks
+
+class AsyncCurli(Curli):
+    """The asynchronous variant of Curli. It shares the session/account handling
+    and the request building of Curli, but its verb methods are coroutines and
+    the invoker is an `AsyncPooledInvoker` (or any object exposing the same
+    coroutine methods, such as an `httpx.AsyncClient`).
+    """
+
+    def pooled(self, **kwargs) -> Self:
+        """Replaces the current invoker with a new AsyncPooledInvoker. Call `aclose()`
+        beforehand to release the connections of the previous one.
+        """
+        self._invoker = AsyncPooledInvoker(**kwargs)
+        return self
+
+    def with_retry(self, policy = None, breaker = None) -> Self:
+        self._invoker = AsyncRetryingInvoker(self._invoker, policy=policy, breaker=breaker)
+        return self
+
+    def with_cache(self, cache: ResponseCache|None = None, **kwargs) -> ResponseCache:
+        if cache is None:
+            cache = ResponseCache(**kwargs)
+        self._invoker = AsyncCachingInvoker(self._invoker, cache, scope_of=lambda: self._account.profile)
+        return cache
+
+    def with_cassette(self, cassette: Cassette|str, mode: str = "replay", **kwargs) -> Cassette:
+        if not isinstance(cassette, Cassette):
+            cassette = Cassette(cassette)
+        self._invoker = AsyncCassetteInvoker(self._invoker, cassette, mode=mode, **kwargs)
+        return cassette
+
+    def with_limits(self, limiter: RateLimiter|None = None) -> RateLimiter:
+        if limiter is None:
+            limiter = RateLimiter()
+        self._invoker = AsyncThrottlingInvoker(self._invoker, limiter, scope_of=lambda: self._account.profile)
+        return limiter
+
+    def coalesced(self) -> AsyncCoalescingInvoker:
+        self._invoker = AsyncCoalescingInvoker(self._invoker, scope_of=lambda: self._account.profile)
+        return self._invoker
+
+    def close(self):
+        raise RuntimeError("AsyncCurli must be closed with 'await curli.aclose()'")
+
+    async def aclose(self):
+        aclose = getattr(self._invoker, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
+    def __enter__(self):
+        raise RuntimeError("AsyncCurli must be used with 'async with'")
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _ensure_fresh_token(self, kwargs):
+        # the token is refreshed (awaited) in _send() before building the request
+        pass
+
+    async def _send(self, method, call, url, *args, summarize: bool = True, **kwargs):
+        instrumentation = self._instrumentation
+        timing = instrumentation.start(method, url) if instrumentation is not None else None
+
+        if self._token_keeper is not None and JF_ACCESS_TOKEN not in kwargs:
+            await self._token_keeper.aensure_fresh()
+        request_url, request_args, request_kwargs = self._build_request(url, *args, **kwargs)
+        if timing is not None:
+            instrumentation.before(timing, request_url, request_kwargs, is_async=True)
+
+        try:
+            response = await call(request_url, *request_args, **request_kwargs)
+            if self._should_retry_unauthorized(response, kwargs):
+                rejected_token = _extract_bearer_token(request_kwargs["headers"])
+                await self._token_keeper.aensure_fresh(stale_token=rejected_token)
+                if self._account[JF_ACCESS_TOKEN] != rejected_token:
+                    request_url, request_args, request_kwargs = self._rebuild_request(url, args, kwargs, request_kwargs)
+                    response = await call(request_url, *request_args, **request_kwargs)
+        except Exception as error:
+            if timing is not None:
+                instrumentation.finish(timing, error=error)
+            raise
+
+        wrapper = self._wrap_response(response, timing)
+        if timing is not None:
+            instrumentation.finish(timing, response=wrapper)
+        if self._request_log is not None:
+            self._request_log.log(wrapper)
+        if summarize and self._summary_fields is not None:
+            wrapper.summarize(*self._summary_fields)
+        return wrapper
+
+    async def request(self, method, url, *args, **kwargs):
+        return await self._send(method, functools.partial(self._invoker.request, method), url, *args, **kwargs)
+
+    async def get(self, url, *args, **kwargs):
+        return await self._send("GET", self._invoker.get, url, *args, **kwargs)
+
+    async def head(self, url, *args, **kwargs):
+        return await self._send("HEAD", self._invoker.head, url, *args, **kwargs)
+
+    async def options(self, url, *args, **kwargs):
+        return await self._send("OPTIONS", self._invoker.options, url, *args, **kwargs)
+
+    async def post(self, url, *args, **kwargs):
+        return await self._send("POST", self._invoker.post, url, *args, **kwargs)
+
+    async def put(self, url, *args, **kwargs):
+        return await self._send("PUT", self._invoker.put, url, *args, **kwargs)
+
+    async def patch(self, url, *args, **kwargs):
+        return await self._send("PATCH", self._invoker.patch, url, *args, **kwargs)
+
+    async def delete(self, url, *args, **kwargs):
+        return await self._send("DELETE", self._invoker.delete, url, *args, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method, url, *args, **kwargs):
+        """The asynchronous variant of `Curli.stream()`, used with `async with` and the
+        `aiter_bytes()`, `aiter_lines()`, `aiter_json_records()` or `ato_file()`
+        methods of the yielded response.
+        """
+        instrumentation = self._instrumentation
+        timing = instrumentation.start(method, url) if instrumentation is not None else None
+
+        if self._token_keeper is not None and JF_ACCESS_TOKEN not in kwargs:
+            await self._token_keeper.aensure_fresh()
+        request_url, request_args, request_kwargs = self._build_request(url, *args, **kwargs)
+        if timing is not None:
+            instrumentation.before(timing, request_url, request_kwargs, is_async=True)
+
+        async with AsyncExitStack() as stack:
+            # only the errors of the request itself are recorded, not those raised in the block
+            try:
+                response = await stack.enter_async_context(
+                        self._invoker.stream(method, request_url, *request_args, **request_kwargs))
+            except Exception as error:
+                if timing is not None:
+                    instrumentation.finish(timing, error=error)
+                raise
+            wrapper = self._wrap_response(response, timing)
+            if self._request_log is not None:
+                self._request_log.log(wrapper)
+            try:
+                yield wrapper
+            finally:
+                if timing is not None:
+                    instrumentation.finish(timing, response=wrapper)
+
+    async def upload(self, url, source, method = "POST", chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs):
+        return await self.request(method, url, content=aiter_file_chunks(source, chunk_size), **kwargs)
+
+    async def paginate(self, url, params = None, prefetch: int = 2, field_name: str = "founds",
+            page_size: int = 100, page_param: str = "page", size_param: str|None = "size",
+            first_page: int = 1, offset_param: str|None = None, max_pages: int|None = None, **kwargs):
+        """The asynchronous variant of `Curli.paginate()`, used with `async for`: the
+        next `prefetch` pages are fetched by concurrent tasks.
+        """
+        pagination = Pagination(params, field_name=field_name, page_size=page_size, page_param=page_param,
+                size_param=size_param, first_page=first_page, offset_param=offset_param, max_pages=max_pages)
+        numbers = pagination.numbers()
+        pending = deque()
+
+        def fetch_next():
+            number = next(numbers, None)
+            if number is not None:
+                # the pages are not summarized, their items are read
+                task = asyncio.ensure_future(self._send("GET", self._invoker.get, url,
+                        params=pagination.params_of(number), summarize=False, **kwargs))
+                pending.append((number, task))
+
+        try:
+            for _ in range(1 + max(0, prefetch)):
+                fetch_next()
+            while pending:
+                number, task = pending.popleft()
+                items = pagination.items_of(number, await task)
+                if pagination.is_repeated(items):
+                    items = []
+                if pagination.is_last(items):
+                    for _, task in pending:
+                        task.cancel()
+                    pending.clear()
+                else:
+                    fetch_next()
+                for item in items:
+                    yield item
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def capture_paged_id_refs(self, url, name_of_id_refs: str|None = None, name_of_key_field = "email",
+            **kwargs):
+        if name_of_id_refs is None:
+            name_of_id_refs = f"{ urllib.parse.urlsplit(url).path.split('/')[-1] }_ids_of"
+        if name_of_id_refs not in self._session:
+            self._session[name_of_id_refs] = dict()
+        ids_map = self._session[name_of_id_refs]
+        async for item in self.paginate(url, **kwargs):
+            fill_ids_map((item,), name_of_key_field, ids_map)
+        self._session.touch()
+        return ids_map
+
+    async def batch(self, requests, concurrency: int = 100, timeout: float|None = None,
+            fail_fast: bool = True) -> list:
+        """Sends a list of requests concurrently on the event loop, with at most
+        `concurrency` requests in flight, and returns the wrapped responses in the
+        order of the requests. See `Curli.batch()` for the other arguments.
+        """
+        requests = list(requests)
+        results = [None] * len(requests)
+        async for index, result in self.batch_iter(requests, concurrency=concurrency,
+                timeout=timeout, fail_fast=fail_fast):
+            results[index] = result
+        return results
+
+    async def batch_iter(self, requests, concurrency: int = 100, timeout: float|None = None,
+            fail_fast: bool = True):
+        """Same as `batch()`, but yields `(index, response_or_error)` pairs as soon
+        as the requests complete.
+        """
+        specs = [normalize_request_spec(spec) for spec in requests]
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _send(index, method, url, kwargs):
+            async with semaphore:
+                try:
+                    return index, await self.request(method, url, **kwargs), None
+                except Exception as error:
+                    return index, None, error
+
+        tasks = [asyncio.ensure_future(_send(index, method, url, kwargs))
+                for index, (method, url, kwargs) in enumerate(specs)]
+        yielded = set()
+        try:
+            for next_completed in asyncio.as_completed(tasks, timeout=timeout):
+                try:
+                    index, result, error = await next_completed
+                except TimeoutError as timeout_error:
+                    if fail_fast:
+                        raise
+                    for index in range(len(tasks)):
+                        if index not in yielded:
+                            yield index, timeout_error
+                    break
+                if error is not None and fail_fast:
+                    raise error
+                yielded.add(index)
+                yield index, (result if error is None else error)
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,22 @@
+def normalize_request_spec(spec) -> tuple[str, str, dict]:
+    """Converts a request spec of a batch into a `(method, url, kwargs)` tuple.
+
+    A request spec can be:
+    - a string: the url of a GET request.
+    - a tuple or a list: `(method, url)` or `(method, url, kwargs)`.
+    - a dict: `{"method": ..., "url": ..., **kwargs}`, the method defaults to GET.
+    """
+    if isinstance(spec, str):
+        return ("GET", spec, dict())
+    if isinstance(spec, dict):
+        kwargs = dict(spec)
+        method = kwargs.pop("method", "GET")
+        if "url" not in kwargs:
+            raise ValueError(f"The request spec { spec } does not contain the [url] field.")
+        url = kwargs.pop("url")
+        return (method, url, kwargs)
+    if isinstance(spec, (tuple, list)) and len(spec) in (2, 3):
+        method, url = spec[0], spec[1]
+        kwargs = dict(spec[2]) if len(spec) == 3 and spec[2] else dict()
+        return (method, url, kwargs)
+    raise ValueError(f"Invalid request spec: { spec !r}")
@@ -0,0 +1,358 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from ._utils import decoded_headers, get_now
+
+CACHEABLE_METHODS = frozenset(["GET", "HEAD"])
+# the request headers identifying the credentials a response has been served for
+CREDENTIAL_HEADERS = frozenset(["authorization", "cookie", "x-api-key"])
+CACHE_FILE_VERSION = 1
+
+class CachedEntry:
+    __slots__ = ("status_code", "headers", "content", "stored_at", "expires_at", "etag", "last_modified",
+            "must_revalidate")
+
+    def __init__(self, response: httpx.Response, ttl: float|None):
+        self.status_code = response.status_code
+        self.headers = decoded_headers(response.headers)
+        self.content = response.content
+        self.etag = response.headers.get("etag")
+        self.last_modified = response.headers.get("last-modified")
+        self.refresh(response, ttl)
+
+    def refresh(self, response, ttl):
+        directives = _parse_cache_control(response.headers.get("cache-control"))
+        self.must_revalidate = "no-cache" in directives
+        self.stored_at = time.monotonic()
+        max_age = _parse_max_age(directives)
+        if max_age is None:
+            max_age = _parse_expires(response.headers)
+        if max_age is None:
+            max_age = ttl
+        self.expires_at = None if max_age is None else self.stored_at + max_age
+
+    def is_fresh(self) -> bool:
+        if self.must_revalidate:
+            return False
+        return self.expires_at is None or time.monotonic() < self.expires_at
+
+    def can_revalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def to_response(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(self.status_code, headers=self.headers, content=self.content,
+                request=request, extensions={"apibean_cache": "hit"})
+
+    def to_dict(self, clock_offset: float) -> dict:
+        """Returns the entry as a JSON-serializable dict, with the monotonic times
+        converted to wall-clock times by adding `clock_offset`.
+        """
+        return dict(status_code=self.status_code, headers=self.headers,
+                content=base64.b64encode(self.content).decode("ascii"),
+                stored_at=self.stored_at + clock_offset,
+                expires_at=None if self.expires_at is None else self.expires_at + clock_offset,
+                etag=self.etag, last_modified=self.last_modified, must_revalidate=self.must_revalidate)
+
+    @classmethod
+    def from_dict(cls, data: dict, clock_offset: float) -> "CachedEntry":
+        entry = cls.__new__(cls)
+        entry.status_code = int(data["status_code"])
+        entry.headers = [(str(key), str(value)) for key, value in data["headers"]]
+        entry.content = base64.b64decode(data["content"])
+        entry.stored_at = float(data["stored_at"]) - clock_offset
+        expires_at = data.get("expires_at")
+        entry.expires_at = None if expires_at is None else float(expires_at) - clock_offset
+        entry.etag = data.get("etag")
+        entry.last_modified = data.get("last_modified")
+        entry.must_revalidate = bool(data.get("must_revalidate"))
+        return entry
+
+
+class ResponseCache:
+    """A bounded, LRU cache of the responses of the safe requests (GET and HEAD).
+
+    - The entries expire after `ttl` seconds (never when None), unless the response
+      carries `Cache-Control: max-age` or `Expires`, which take precedence.
+      `Cache-Control: no-store` responses are not cached, `no-cache` ones are
+      revalidated every time.
+    - The stale entries having an `ETag` or a `Last-Modified` header are revalidated
+      with `If-None-Match` / `If-Modified-Since`, a 304 response renews them.
+    - The entries are keyed by the method, the URL, a scope (the account profile
+      for Curli) and a digest of the credentials of the request (its
+      `Authorization`, `Cookie` and `X-Api-Key` headers), so the responses of an
+      account are never served to another one, nor after a change of token.
+    - With `path`, the entries are loaded from that JSON file and written back by
+      `save()` (and `close()`). A file which cannot be read is ignored and
+      replaced on the next save.
+    - The `stats` are the numbers of hits, misses, revalidations and evictions.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float|None = 60.0, path: str|None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict(hits=0, misses=0, revalidations=0, evictions=0)
+        if path and os.path.exists(path):
+            self.load()
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats, entries=len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key_of(self, method, url, params = None, scope = None, headers = None):
+        return (scope, method.upper(), str(httpx.URL(str(url), params=params)), _credentials_of(headers))
+
+    def lookup(self, key) -> CachedEntry|None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def store(self, key, response: httpx.Response):
+        directives = _parse_cache_control(response.headers.get("cache-control"))
+        if response.status_code != 200 or "no-store" in directives:
+            return None
+        entry = CachedEntry(response, self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return entry
+
+    def renew(self, entry: CachedEntry, response: httpx.Response):
+        entry.refresh(response, self.ttl)
+
+    def invalidate(self, url = None, scope = None):
+        """Drops the entries of the given URL (in all scopes when `scope` is None),
+        or all of the entries when `url` is None.
+        """
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+                return
+            url = str(httpx.URL(str(url)).copy_with(query=None))
+            for key in [key for key in self._entries
+                    if key[2].split("?", 1)[0] == url and (scope is None or key[0] == scope)]:
+                del self._entries[key]
+
+    def load(self):
+        clock_offset = time.time() - time.monotonic()
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") != CACHE_FILE_VERSION:
+                return
+            entries = [(tuple(item["key"]), CachedEntry.from_dict(item, clock_offset))
+                    for item in data["entries"]]
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            # a cache is disposable: an unreadable (or older) file is not loaded
+            return
+        with self._lock:
+            self._entries = OrderedDict(entries)
+
+    def save(self):
+        if not self.path:
+            return
+        clock_offset = time.time() - time.monotonic()
+        with self._lock:
+            entries = list(self._entries.items())
+        data = dict(version=CACHE_FILE_VERSION,
+                entries=[dict(entry.to_dict(clock_offset), key=list(key)) for key, entry in entries])
+        temp_path = f"{ self.path }.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        self.save()
+
+
+class CachingInvoker:
+    """Wraps an invoker of Curli with a ResponseCache. The GET and HEAD requests are
+    served from the cache (or revalidated), while the other requests invalidate
+    the cached entries of their URL.
+    """
+
+    def __init__(self, invoker, cache: ResponseCache, scope_of = None):
+        self._invoker = invoker
+        self._cache = cache
+        self._scope_of = scope_of
+
+    @property
+    def invoker(self):
+        return self._invoker
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def _prepare(self, method, url, kwargs):
+        """Returns the cache key, the cached entry and the kwargs of the request to send."""
+        scope = self._scope_of() if self._scope_of is not None else None
+        key = self._cache.key_of(method, url, kwargs.get("params"), scope, kwargs.get("headers"))
+        entry = self._cache.lookup(key)
+        if entry is None or entry.is_fresh() or not entry.can_revalidate():
+            return key, entry, kwargs
+        headers = dict(kwargs.get("headers") or {})
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return key, entry, dict(kwargs, headers=headers)
+
+    def _hit(self, method, url, kwargs, entry):
+        request = httpx.Request(method, url, params=kwargs.get("params"), headers=kwargs.get("headers"))
+        return entry.to_response(request)
+
+    def _complete(self, method, url, kwargs, key, entry, response):
+        cache = self._cache
+        if entry is not None and response.status_code == 304:
+            cache.count("revalidations")
+            cache.renew(entry, response)
+            return self._hit(method, url, kwargs, entry)
+        cache.count("misses")
+        cache.store(key, response)
+        return response
+
+    def _cached_call(self, method, url, kwargs, call):
+        key, entry, request_kwargs = self._prepare(method, url, kwargs)
+        if entry is not None and entry.is_fresh():
+            self._cache.count("hits")
+            return self._hit(method, url, kwargs, entry)
+        if entry is not None and request_kwargs is kwargs:
+            entry = None
+        response = call(request_kwargs)
+        return self._complete(method, url, kwargs, key, entry, response)
+
+    def _uncached_call(self, url, call):
+        response = call()
+        self._cache.invalidate(url)
+        return response
+
+    def request(self, method, url, *args, **kwargs):
+        if method.upper() in CACHEABLE_METHODS:
+            return self._cached_call(method.upper(), url, kwargs,
+                    lambda kw: self._invoker.request(method, url, *args, **kw))
+        return self._uncached_call(url, lambda: self._invoker.request(method, url, *args, **kwargs))
+
+    def get(self, url, *args, **kwargs):
+        return self._cached_call("GET", url, kwargs, lambda kw: self._invoker.get(url, *args, **kw))
+
+    def head(self, url, *args, **kwargs):
+        return self._cached_call("HEAD", url, kwargs, lambda kw: self._invoker.head(url, *args, **kw))
+
+    def options(self, url, *args, **kwargs):
+        return self._invoker.options(url, *args, **kwargs)
+
+    def post(self, url, *args, **kwargs):
+        return self._uncached_call(url, lambda: self._invoker.post(url, *args, **kwargs))
+
+    def put(self, url, *args, **kwargs):
+        return self._uncached_call(url, lambda: self._invoker.put(url, *args, **kwargs))
+
+    def patch(self, url, *args, **kwargs):
+        return self._uncached_call(url, lambda: self._invoker.patch(url, *args, **kwargs))
+
+    def delete(self, url, *args, **kwargs):
+        return self._uncached_call(url, lambda: self._invoker.delete(url, *args, **kwargs))
+
+    def stream(self, method, url, *args, **kwargs):
+        return self._invoker.stream(method, url, *args, **kwargs)
+
+    def close(self):
+        self._cache.close()
+        close = getattr(self._invoker, "close", None)
+        if callable(close):
+            close()
+
+
+class AsyncCachingInvoker(CachingInvoker):
+    """The asynchronous variant of CachingInvoker, wrapping an asynchronous invoker."""
+
+    async def _cached_call(self, method, url, kwargs, call):
+        key, entry, request_kwargs = self._prepare(method, url, kwargs)
+        if entry is not None and entry.is_fresh():
+            self._cache.count("hits")
+            return self._hit(method, url, kwargs, entry)
+        if entry is not None and request_kwargs is kwargs:
+            entry = None
+        response = await call(request_kwargs)
+        return self._complete(method, url, kwargs, key, entry, response)
+
+    async def _uncached_call(self, url, call):
+        response = await call()
+        self._cache.invalidate(url)
+        return response
+
+    async def options(self, url, *args, **kwargs):
+        return await self._invoker.options(url, *args, **kwargs)
+
+    def close(self):
+        raise RuntimeError("AsyncCachingInvoker must be closed with 'await invoker.aclose()'")
+
+    async def aclose(self):
+        self._cache.close()
+        aclose = getattr(self._invoker, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
+
+def _credentials_of(headers) -> str|None:
+    if not headers:
+        return None
+    if isinstance(headers, httpx.Headers):
+        items = headers.multi_items()
+    else:
+        items = headers.items() if hasattr(headers, "items") else headers
+    credentials = sorted(f"{ key.lower() }: { value }" for key, value in items
+            if key.lower() in CREDENTIAL_HEADERS)
+    if not credentials:
+        return None
+    # only a digest is kept in the keys, which are saved to disk
+    return hashlib.sha256("\n".join(credentials).encode("utf-8")).hexdigest()
+
+
+def _parse_cache_control(value) -> dict:
+    directives = dict()
+    for directive in (value or "").split(","):
+        name, _, argument = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"')
+    return directives
+
+
+def _parse_max_age(directives) -> float|None:
+    try:
+        return max(0.0, float(directives["max-age"]))
+    except (KeyError, ValueError):
+        return None
+
+
+def _parse_expires(headers) -> float|None:
+    expires = headers.get("expires")
+    if not expires:
+        return None
+    try:
+        return max(0.0, (parsedate_to_datetime(expires) - get_now()).total_seconds())
+    except (TypeError, ValueError):
+        return 0.0
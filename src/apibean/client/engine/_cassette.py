@@ -0,0 +1,301 @@
+import asyncio
+import base64
+import hashlib
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+
+import httpx
+
+from ._utils import decoded_headers
+
+CASSETTE_MAGIC = b"APIBEAN-CASSETTE-2\n"
+CASSETTE_MODES = frozenset(["record", "replay", "auto"])
+
+_FRAME_HEADER = struct.Struct(">II")
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when the cassette holds no response for a request."""
+
+    def __init__(self, key):
+        super().__init__(f"The cassette has no response for { key[0] } { key[1] }")
+        self.key = key
+
+
+class Cassette:
+    """An on-disk, append-only recording of request/response pairs.
+
+    The requests are keyed by their method, their normalized URL (with sorted
+    query parameters) and the hash of their body, so that the random
+    `X-Request-Id` of Curli never prevents a match; the `match_headers` are
+    added to the key when given (e.g. `("authorization",)`).
+
+    The file is a sequence of frames (key and response, as JSON documents with a
+    base64-encoded body), indexed when the cassette is opened and read through
+    a memory map, so that a response is decoded only when it is replayed. The
+    responses recorded several times for the same key are replayed in the same
+    order, the last one being repeated.
+    """
+
+    def __init__(self, path: str, match_headers = ()):
+        self.path = path
+        self.match_headers = tuple(name.lower() for name in match_headers)
+        self._index = dict()
+        self._replayed = dict()
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._size = 0
+        self._stats = dict(recorded=0, replayed=0, misses=0)
+        self._open()
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats, keys=len(self._index))
+
+    def __len__(self):
+        return sum(len(frames) for frames in self._index.values())
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def _open(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, "wb") as file:
+                file.write(CASSETTE_MAGIC)
+        self._file = open(self.path, "r+b")
+        if self._file.read(len(CASSETTE_MAGIC)) != CASSETTE_MAGIC:
+            self._file.close()
+            raise ValueError(f"{ self.path } is not a cassette file")
+        self._remap()
+        offset = len(CASSETTE_MAGIC)
+        while offset + _FRAME_HEADER.size <= self._size:
+            key_size, payload_size = _FRAME_HEADER.unpack_from(self._map, offset)
+            end = offset + _FRAME_HEADER.size + key_size + payload_size
+            if end > self._size:
+                # a truncated frame (interrupted recording) is ignored
+                break
+            key = _load_key(self._map[offset + _FRAME_HEADER.size:offset + _FRAME_HEADER.size + key_size])
+            self._index.setdefault(key, []).append((end - payload_size, payload_size))
+            offset = end
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def key_of(self, method, url, kwargs) -> tuple:
+        return self.key_of_request(_build_request(method, url, kwargs))
+
+    def key_of_request(self, request: httpx.Request) -> tuple:
+        url = request.url
+        if url.query:
+            url = url.copy_with(params=sorted(url.params.multi_items()))
+        try:
+            body_hash = hashlib.sha256(request.content).hexdigest()
+        except httpx.RequestNotRead:
+            # a streamed body is not read to compute the key
+            body_hash = "stream"
+        headers = tuple((name, request.headers.get(name)) for name in self.match_headers)
+        return (request.method, str(url), body_hash, headers)
+
+    def record(self, key, response: httpx.Response):
+        key_bytes = json.dumps(key).encode()
+        payload = json.dumps(dict(status_code=response.status_code,
+                headers=decoded_headers(response.headers),
+                content=base64.b64encode(response.content).decode("ascii"))).encode()
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(_FRAME_HEADER.pack(len(key_bytes), len(payload)) + key_bytes + payload)
+            self._file.flush()
+            self._index.setdefault(key, []).append((offset + _FRAME_HEADER.size + len(key_bytes), len(payload)))
+            self._stats["recorded"] += 1
+
+    def replay(self, key, request: httpx.Request) -> httpx.Response|None:
+        with self._lock:
+            frames = self._index.get(key)
+            if not frames:
+                self._stats["misses"] += 1
+                return None
+            position = self._replayed.get(key, 0)
+            self._replayed[key] = position + 1
+            offset, size = frames[min(position, len(frames) - 1)]
+            if offset + size > self._size:
+                self._remap()
+            payload = self._map[offset:offset + size]
+            self._stats["replayed"] += 1
+        payload = json.loads(payload)
+        return httpx.Response(payload["status_code"], headers=[tuple(header) for header in payload["headers"]],
+                content=base64.b64decode(payload["content"]), request=request,
+                extensions={"apibean_cassette": "replay"})
+
+    def rewind(self):
+        """Replays the recorded responses from the first one again."""
+        with self._lock:
+            self._replayed.clear()
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CassetteInvoker:
+    """Wraps an invoker of Curli with a Cassette.
+
+    - In `record` mode, the requests are sent and their responses recorded.
+    - In `replay` mode, the responses are served from the cassette without any
+      network access, a request missing from it raises CassetteMissError.
+    - In `auto` mode, the requests missing from the cassette are sent and
+      recorded, the other ones are replayed.
+
+    The replayed responses can be delayed by `latency` seconds (a number or a
+    `(min, max)` range) and replaced, at the `error_rate` ratio, by an
+    `error_status` response (or the `error` exception raised), to rehearse a
+    slow or failing backend.
+
+    The streamed requests (`Curli.stream()`) bypass the
+    cassette: they are sent to the wrapped invoker, without being recorded,
+    in every mode (so replay mode does not make them offline).
+    """
+
+    def __init__(self, invoker, cassette: Cassette, mode: str = "replay",
+            latency: float|tuple = 0.0, error_rate: float = 0.0, error_status: int = 503,
+            error: Exception|None = None, sleep = time.sleep):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"The mode must be one of { sorted(CASSETTE_MODES) }")
+        self._invoker = invoker
+        self._cassette = cassette
+        self.mode = mode
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error = error
+        self._sleep = sleep
+
+    @property
+    def invoker(self):
+        return self._invoker
+
+    @property
+    def cassette(self):
+        return self._cassette
+
+    def _delay(self) -> float:
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            return random.uniform(*latency)
+        return latency or 0.0
+
+    def _replay(self, request, key):
+        if self.error_rate and random.random() < self.error_rate:
+            if self.error is not None:
+                raise self.error
+            return httpx.Response(self.error_status, request=request, extensions={"apibean_cassette": "fault"})
+        response = self._cassette.replay(key, request)
+        if response is None and self.mode == "replay":
+            raise CassetteMissError(key)
+        return response
+
+    def _play(self, method, url, kwargs, call):
+        request = _build_request(method, url, kwargs)
+        key = self._cassette.key_of_request(request)
+        if self.mode != "record":
+            response = self._replay(request, key)
+            if response is not None:
+                delay = self._delay()
+                if delay:
+                    self._sleep(delay)
+                return response
+        response = call()
+        self._cassette.record(key, response)
+        return response
+
+    def request(self, method, url, *args, **kwargs):
+        return self._play(method.upper(), url, kwargs, lambda: self._invoker.request(method, url, *args, **kwargs))
+
+    def get(self, url, *args, **kwargs):
+        return self._play("GET", url, kwargs, lambda: self._invoker.get(url, *args, **kwargs))
+
+    def head(self, url, *args, **kwargs):
+        return self._play("HEAD", url, kwargs, lambda: self._invoker.head(url, *args, **kwargs))
+
+    def options(self, url, *args, **kwargs):
+        return self._play("OPTIONS", url, kwargs, lambda: self._invoker.options(url, *args, **kwargs))
+
+    def post(self, url, *args, **kwargs):
+        return self._play("POST", url, kwargs, lambda: self._invoker.post(url, *args, **kwargs))
+
+    def put(self, url, *args, **kwargs):
+        return self._play("PUT", url, kwargs, lambda: self._invoker.put(url, *args, **kwargs))
+
+    def patch(self, url, *args, **kwargs):
+        return self._play("PATCH", url, kwargs, lambda: self._invoker.patch(url, *args, **kwargs))
+
+    def delete(self, url, *args, **kwargs):
+        return self._play("DELETE", url, kwargs, lambda: self._invoker.delete(url, *args, **kwargs))
+
+    def stream(self, method, url, *args, **kwargs):
+        # not recorded nor replayed, a streamed body is read by the caller
+        return self._invoker.stream(method, url, *args, **kwargs)
+
+    def close(self):
+        self._cassette.close()
+        close = getattr(self._invoker, "close", None)
+        if callable(close):
+            close()
+
+
+class AsyncCassetteInvoker(CassetteInvoker):
+    """The asynchronous variant of CassetteInvoker, wrapping an asynchronous invoker."""
+
+    def __init__(self, invoker, cassette: Cassette, mode: str = "replay",
+            latency: float|tuple = 0.0, error_rate: float = 0.0, error_status: int = 503,
+            error: Exception|None = None, sleep = asyncio.sleep):
+        super().__init__(invoker, cassette, mode=mode, latency=latency, error_rate=error_rate,
+                error_status=error_status, error=error, sleep=sleep)
+
+    async def _play(self, method, url, kwargs, call):
+        request = _build_request(method, url, kwargs)
+        key = self._cassette.key_of_request(request)
+        if self.mode != "record":
+            response = self._replay(request, key)
+            if response is not None:
+                delay = self._delay()
+                if delay:
+                    await self._sleep(delay)
+                return response
+        response = await call()
+        self._cassette.record(key, response)
+        return response
+
+    def close(self):
+        raise RuntimeError("AsyncCassetteInvoker must be closed with 'await invoker.aclose()'")
+
+    async def aclose(self):
+        self._cassette.close()
+        aclose = getattr(self._invoker, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
+
+def _build_request(method, url, kwargs) -> httpx.Request:
+    return httpx.Request(method, url, params=kwargs.get("params"), headers=kwargs.get("headers"),
+            content=kwargs.get("content"), data=kwargs.get("data"), files=kwargs.get("files"),
+            json=kwargs.get("json"))
+
+
+def _load_key(key_bytes) -> tuple:
+    """Loads a key saved as JSON, its lists being turned back into the tuples of `key_of_request()`."""
+    method, url, body_hash, headers = json.loads(key_bytes)
+    return (method, url, body_hash, tuple(tuple(header) for header in headers))
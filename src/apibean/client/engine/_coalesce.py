@@ -0,0 +1,173 @@
+import asyncio
+import threading
+
+import httpx
+
+from ._consts import HK_REQUEST_ID
+from ._utils import decoded_headers
+
+COALESCED_METHODS = frozenset(["GET", "HEAD"])
+
+class _Flight:
+    __slots__ = ("done", "response", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+        self.followers = 0
+
+
+class CoalescingInvoker:
+    """Wraps an invoker of Curli so that the identical safe requests (GET and HEAD)
+    sent concurrently share a single call: the first one (the leader) is sent, the
+    other ones (the followers) wait for its response (or its error).
+
+    The requests are identical when they have the same method, URL, query
+    parameters and headers (except `X-Request-Id`), in the same scope (the
+    account profile for Curli). Every follower gets its own copy of the
+    response, marked with the `apibean_coalesced` extension.
+
+    The `stats` are the numbers of sent (leaders) and coalesced requests.
+    """
+
+    def __init__(self, invoker, scope_of = None):
+        self._invoker = invoker
+        self._scope_of = scope_of
+        self._flights = dict()
+        self._lock = threading.Lock()
+        self._stats = dict(leaders=0, coalesced=0)
+
+    @property
+    def invoker(self):
+        return self._invoker
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats, in_flight=len(self._flights))
+
+    def reset_stats(self):
+        # reset in place, the stats are shared with the rescoped copies
+        with self._lock:
+            self._stats.update(leaders=0, coalesced=0)
+
+    def key_of(self, method, url, kwargs):
+        scope = self._scope_of() if self._scope_of is not None else None
+        headers = kwargs.get("headers") or {}
+        return (scope, method.upper(), str(httpx.URL(str(url), params=kwargs.get("params"))),
+                tuple(sorted((key.lower(), str(value)) for key, value in headers.items()
+                        if key.lower() != HK_REQUEST_ID)))
+
+    def _coalesced_call(self, method, url, kwargs, call):
+        key = self.key_of(method, url, kwargs)
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["leaders"] += 1
+            else:
+                flight.followers += 1
+                self._stats["coalesced"] += 1
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return _copy_response(flight.response)
+        try:
+            flight.response = call()
+            return flight.response
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def request(self, method, url, *args, **kwargs):
+        if method.upper() in COALESCED_METHODS:
+            return self._coalesced_call(method, url, kwargs,
+                    lambda: self._invoker.request(method, url, *args, **kwargs))
+        return self._invoker.request(method, url, *args, **kwargs)
+
+    def get(self, url, *args, **kwargs):
+        return self._coalesced_call("GET", url, kwargs, lambda: self._invoker.get(url, *args, **kwargs))
+
+    def head(self, url, *args, **kwargs):
+        return self._coalesced_call("HEAD", url, kwargs, lambda: self._invoker.head(url, *args, **kwargs))
+
+    def options(self, url, *args, **kwargs):
+        return self._invoker.options(url, *args, **kwargs)
+
+    def post(self, url, *args, **kwargs):
+        return self._invoker.post(url, *args, **kwargs)
+
+    def put(self, url, *args, **kwargs):
+        return self._invoker.put(url, *args, **kwargs)
+
+    def patch(self, url, *args, **kwargs):
+        return self._invoker.patch(url, *args, **kwargs)
+
+    def delete(self, url, *args, **kwargs):
+        return self._invoker.delete(url, *args, **kwargs)
+
+    def stream(self, method, url, *args, **kwargs):
+        return self._invoker.stream(method, url, *args, **kwargs)
+
+    def close(self):
+        close = getattr(self._invoker, "close", None)
+        if callable(close):
+            close()
+
+
+class AsyncCoalescingInvoker(CoalescingInvoker):
+    """The asynchronous variant of CoalescingInvoker, wrapping an asynchronous invoker.
+    The followers await the task of the leader, so that the cancellation of one
+    caller does not cancel the shared call.
+    """
+
+    async def _coalesced_call(self, method, url, kwargs, call):
+        key = self.key_of(method, url, kwargs)
+        task = self._flights.get(key)
+        if task is None:
+            task = self._flights[key] = asyncio.ensure_future(call())
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+            self._stats["leaders"] += 1
+            return await asyncio.shield(task)
+        self._stats["coalesced"] += 1
+        return _copy_response(await asyncio.shield(task))
+
+    async def request(self, method, url, *args, **kwargs):
+        if method.upper() in COALESCED_METHODS:
+            return await self._coalesced_call(method, url, kwargs,
+                    lambda: self._invoker.request(method, url, *args, **kwargs))
+        return await self._invoker.request(method, url, *args, **kwargs)
+
+    async def options(self, url, *args, **kwargs):
+        return await self._invoker.options(url, *args, **kwargs)
+
+    async def post(self, url, *args, **kwargs):
+        return await self._invoker.post(url, *args, **kwargs)
+
+    async def put(self, url, *args, **kwargs):
+        return await self._invoker.put(url, *args, **kwargs)
+
+    async def patch(self, url, *args, **kwargs):
+        return await self._invoker.patch(url, *args, **kwargs)
+
+    async def delete(self, url, *args, **kwargs):
+        return await self._invoker.delete(url, *args, **kwargs)
+
+    def close(self):
+        raise RuntimeError("AsyncCoalescingInvoker must be closed with 'await invoker.aclose()'")
+
+    async def aclose(self):
+        aclose = getattr(self._invoker, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
+
+def _copy_response(response: httpx.Response) -> httpx.Response:
+    return httpx.Response(response.status_code, headers=decoded_headers(response.headers),
+            content=response.content, request=response.request, extensions={"apibean_coalesced": True})
@@ -1,3 +1,9 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+import contextvars
+import functools
+import inspect
 from typing import Self
 from uuid import uuid4
 import urllib.parse
@@ -6,9 +12,20 @@ from ._consts import JF_BASE_URL
 from ._consts import JF_ACCESS_TOKEN
 from ._consts import HK_AUTHORIZATION
 from ._consts import HK_REQUEST_ID
+from ._batch import normalize_request_spec
+from ._cache import CachingInvoker, ResponseCache
+from ._cassette import Cassette, CassetteInvoker
+from ._coalesce import CoalescingInvoker
 from ._decorators import deprecated
-from ._helpers import ResponseWrapper
+from ._helpers import ResponseWrapper, fill_ids_map
+from ._instrument import Instrumentation
+from ._invokers import PooledInvoker
+from ._limits import RateLimiter, ThrottlingInvoker
+from ._paging import Pagination
+from ._policies import RetryingInvoker, _is_replayable
+from ._reqlog import RequestLog
 from ._store import Store
+from ._streaming import DEFAULT_CHUNK_SIZE, iter_file_chunks
 from ._utils import normalize_header
 
 class Curli:
@@ -17,6 +34,11 @@ class Curli:
         self._invoker = invoker
         self._session = session_store
         self._account = account_store
+        self._token_keeper = None
+        self._templates = dict()
+        self._instrumentation = None
+        self._summary_fields = None
+        self._request_log = None
 
     @property
     def invoker(self):
@@ -26,6 +48,144 @@ class Curli:
     def invoker(self, value):
         self._invoker = value
 
+    @property
+    def token_keeper(self):
+        return self._token_keeper
+
+    @token_keeper.setter
+    def token_keeper(self, value):
+        self._token_keeper = value
+
+    def pooled(self, **kwargs) -> Self:
+        """Replaces the current invoker with a PooledInvoker, which keeps one
+        keep-alive `httpx.Client` per base URL. The keyword arguments are passed
+        to the PooledInvoker constructor (limits, keep-alive expiry, http2, ...).
+        """
+        self.close()
+        self._invoker = PooledInvoker(**kwargs)
+        return self
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, value):
+        self._instrumentation = value
+
+    def instrument(self, aggregator = None, trace: bool|None = None, **kwargs) -> Instrumentation:
+        """Enables the instrumentation of the requests and returns it, to register the
+        pre/post-request hooks and to read the latency report of its aggregator.
+
+        The per-phase timings (connect, tls, send, wait, download) are collected
+        with the httpx `trace` extension, which requires a client based invoker
+        (e.g. `pooled()`), so by default it is disabled on the `httpx` module.
+        """
+        if trace is None:
+            trace = not _is_module_invoker(self._invoker)
+        self._instrumentation = Instrumentation(aggregator=aggregator, trace=trace, **kwargs)
+        return self._instrumentation
+
+    def uninstrument(self) -> Self:
+        self._instrumentation = None
+        return self
+
+    @property
+    def request_log(self):
+        return self._request_log
+
+    def log_requests(self, target, **kwargs) -> RequestLog:
+        """Logs the sent requests (redacted) into a RequestLog written from a background
+        thread, and returns it. The `target` is a RequestLog, or a path or a file
+        object to build one with the keyword arguments (format, compress, ...).
+        """
+        self.unlog_requests()
+        self._request_log = target if isinstance(target, RequestLog) else RequestLog(target, **kwargs)
+        return self._request_log
+
+    def unlog_requests(self) -> Self:
+        """Stops logging the requests, the pending records are written and the log closed."""
+        request_log, self._request_log = self._request_log, None
+        if request_log is not None:
+            request_log.close()
+        return self
+
+    def summarized(self, *field_names) -> Self:
+        """Summarizes the responses as soon as they are received: only the given fields
+        of their JSON bodies are kept (see `ResponseWrapper.summarize()`), to hold
+        a large number of responses (e.g. in a batch) with little memory.
+
+        A call given `summarize=False` keeps its whole response, e.g. to capture the
+        ids of its items. The calls of the Agent (login, refresh, ...) and the pages
+        of `paginate()` are never summarized.
+        """
+        self._summary_fields = field_names
+        return self
+
+    def unsummarized(self) -> Self:
+        self._summary_fields = None
+        return self
+
+    def with_retry(self, policy = None, breaker = None) -> Self:
+        """Wraps the current invoker with a RetryingInvoker, which applies the given
+        RetryPolicy (a default one if omitted) and the optional CircuitBreaker.
+        """
+        self._invoker = RetryingInvoker(self._invoker, policy=policy, breaker=breaker)
+        return self
+
+    def with_cache(self, cache: ResponseCache|None = None, **kwargs) -> ResponseCache:
+        """Wraps the current invoker with a CachingInvoker and returns its ResponseCache
+        (a new one built from the keyword arguments if omitted). The responses are
+        cached per account profile and access token.
+        """
+        if cache is None:
+            cache = ResponseCache(**kwargs)
+        self._invoker = CachingInvoker(self._invoker, cache, scope_of=lambda: self._account.profile)
+        return cache
+
+    def with_cassette(self, cassette: Cassette|str, mode: str = "replay", **kwargs) -> Cassette:
+        """Wraps the current invoker with a CassetteInvoker and returns its Cassette (opened
+        from the given path if needed), to record the responses (`mode="record"`),
+        to replay them offline (`mode="replay"`) or both (`mode="auto"`). The keyword
+        arguments (latency, error_rate, ...) are passed to the CassetteInvoker.
+        """
+        if not isinstance(cassette, Cassette):
+            cassette = Cassette(cassette)
+        self._invoker = CassetteInvoker(self._invoker, cassette, mode=mode, **kwargs)
+        return cassette
+
+    def with_limits(self, limiter: RateLimiter|None = None) -> RateLimiter:
+        """Wraps the current invoker with a ThrottlingInvoker and returns its RateLimiter
+        (a new one if omitted), to add the rate and concurrency limits per base URL,
+        path prefix and account profile:
+
+            limiter = curli.with_limits()
+            limiter.limit(rate=50, max_in_flight=10, path_prefix="/user", per_profile=True)
+        """
+        if limiter is None:
+            limiter = RateLimiter()
+        self._invoker = ThrottlingInvoker(self._invoker, limiter, scope_of=lambda: self._account.profile)
+        return limiter
+
+    def coalesced(self) -> CoalescingInvoker:
+        """Wraps the current invoker with a CoalescingInvoker and returns it (to read its
+        `stats`): the identical GET/HEAD requests sent concurrently by the threads
+        of an account share a single call.
+        """
+        self._invoker = CoalescingInvoker(self._invoker, scope_of=lambda: self._account.profile)
+        return self._invoker
+
+    def close(self):
+        close = getattr(self._invoker, "close", None)
+        if callable(close):
+            close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     @deprecated
     def globals(self, **kwargs) -> Self:
         return self.default(**kwargs)
@@ -53,62 +213,334 @@ class Curli:
 
         return self
 
-    def _build_request(self, url, *args, headers = None, **kwargs):
-        base_url = kwargs.get(JF_BASE_URL, self._session[JF_BASE_URL])
-        if not url.startswith('http') and base_url:
-            url = urllib.parse.urljoin(base_url + '/', url.lstrip('/'))
+    @contextmanager
+    def using(self, account = None, session = None):
+        """Selects the account and/or session profiles for the current context (thread or
+        asyncio task) only, so that a Curli object can be shared without locks:
 
-        if not isinstance(headers, dict):
-            headers = {}
+            with curli.using(account="root"):
+                curli.get("user/" + user_id)
+        """
+        with ExitStack() as stack:
+            if account is not None:
+                stack.enter_context(self._account.using(account))
+            if session is not None:
+                stack.enter_context(self._session.using(session))
+            yield self
 
-        # normalize request headers and apply default header values
-        headers = normalize_header(headers, HK_REQUEST_ID)
+    def _get_request_template(self):
+        """Returns the precompiled static parts of the requests (base URL prefix and
+        default headers) of the current session/account profiles. The template is
+        compiled again only when one of the stores has changed.
+        """
+        key = (self._session.profile, self._account.profile)
+        version = (self._session.version, self._account.version)
+        cached = self._templates.get(key)
+        if cached is None or cached[0] != version:
+            cached = self._templates[key] = (version, _RequestTemplate(
+                    self._session[JF_BASE_URL],
+                    self._session['headers'],
+                    self._account[JF_ACCESS_TOKEN]))
+        return cached[1]
 
-        session_headers = self._session['headers']
-        if isinstance(session_headers, dict):
-            headers = {**session_headers, **headers}
+    def _build_request(self, url, *args, headers = None, **kwargs):
+        self._ensure_fresh_token(kwargs)
+
+        template = self._get_request_template()
+
+        if not url.startswith('http'):
+            if JF_BASE_URL in kwargs:
+                base_url = kwargs[JF_BASE_URL]
+                if base_url:
+                    url = urllib.parse.urljoin(base_url + '/', url.lstrip('/'))
+            elif template.url_prefix:
+                url = template.join_url(url)
 
-        access_token = kwargs.get(JF_ACCESS_TOKEN, self._account[JF_ACCESS_TOKEN])
-        if access_token and isinstance(access_token, str):
-            headers = {HK_AUTHORIZATION: f"Bearer {access_token}", **headers}
         if JF_ACCESS_TOKEN in kwargs:
-            del kwargs[JF_ACCESS_TOKEN]
+            default_headers = template.headers_with_token(kwargs.pop(JF_ACCESS_TOKEN))
+        else:
+            default_headers = template.headers
 
-        headers = {HK_REQUEST_ID: str(uuid4()), **headers}
+        # normalize request headers and apply default header values
+        if isinstance(headers, dict) and headers:
+            headers = {HK_REQUEST_ID: str(uuid4()), **default_headers,
+                    **normalize_header(headers, HK_REQUEST_ID)}
+        else:
+            headers = {HK_REQUEST_ID: str(uuid4()), **default_headers}
 
         return (url, args, dict(kwargs, headers=headers))
 
-    def _wrap_response(self, response):
-        return ResponseWrapper(response, session_store=self._session, account_store=self._account)
+    def _ensure_fresh_token(self, kwargs):
+        if self._token_keeper is not None and JF_ACCESS_TOKEN not in kwargs:
+            self._token_keeper.ensure_fresh()
+
+    def _should_retry_unauthorized(self, response, kwargs) -> bool:
+        keeper = self._token_keeper
+        return (keeper is not None and keeper.retry_on_401
+                and response.status_code == 401
+                and JF_ACCESS_TOKEN not in kwargs
+                and not keeper.is_refreshing()
+                # a body streamed from an iterator has been consumed, it cannot be sent again
+                and _is_replayable(kwargs))
+
+    def _rebuild_request(self, url, args, kwargs, request_kwargs):
+        """Builds the request again (with the refreshed token), keeping the X-Request-Id
+        of the rejected request so that the server-side traces still line up.
+        """
+        headers = kwargs.get("headers")
+        headers = {key: value for key, value in headers.items()
+                if key.casefold() != HK_REQUEST_ID} if isinstance(headers, dict) else {}
+        headers[HK_REQUEST_ID] = request_kwargs["headers"][HK_REQUEST_ID]
+        return self._build_request(url, *args, **dict(kwargs, headers=headers))
+
+    def _wrap_response(self, response, timing = None):
+        wrapper = ResponseWrapper(response, session_store=self._session, account_store=self._account)
+        if timing is not None:
+            wrapper.timing = timing
+        return wrapper
+
+    def _send(self, method, call, url, *args, summarize: bool = True, **kwargs):
+        instrumentation = self._instrumentation
+        timing = instrumentation.start(method, url) if instrumentation is not None else None
+
+        request_url, request_args, request_kwargs = self._build_request(url, *args, **kwargs)
+        if timing is not None:
+            instrumentation.before(timing, request_url, request_kwargs)
+
+        try:
+            response = call(request_url, *request_args, **request_kwargs)
+            if self._should_retry_unauthorized(response, kwargs):
+                rejected_token = _extract_bearer_token(request_kwargs["headers"])
+                self._token_keeper.ensure_fresh(stale_token=rejected_token)
+                if self._account[JF_ACCESS_TOKEN] != rejected_token:
+                    request_url, request_args, request_kwargs = self._rebuild_request(url, args, kwargs, request_kwargs)
+                    response = call(request_url, *request_args, **request_kwargs)
+        except Exception as error:
+            if timing is not None:
+                instrumentation.finish(timing, error=error)
+            raise
+
+        wrapper = self._wrap_response(response, timing)
+        if timing is not None:
+            instrumentation.finish(timing, response=wrapper)
+        if self._request_log is not None:
+            self._request_log.log(wrapper)
+        if summarize and self._summary_fields is not None:
+            wrapper.summarize(*self._summary_fields)
+        return wrapper
 
     def request(self, method, url, *args, **kwargs):
-        url, args, kwargs = self._build_request(url, *args, **kwargs)
-        return self._wrap_response(self._invoker.request(method, url, *args, **kwargs))
+        return self._send(method, functools.partial(self._invoker.request, method), url, *args, **kwargs)
 
     def get(self, url, *args, **kwargs):
-        url, args, kwargs = self._build_request(url, *args, **kwargs)
-        return self._wrap_response(self._invoker.get(url, *args, **kwargs))
+        return self._send("GET", self._invoker.get, url, *args, **kwargs)
 
     def head(self, url, *args, **kwargs):
-        url, args, kwargs = self._build_request(url, *args, **kwargs)
-        return self._wrap_response(self._invoker.head(url, *args, **kwargs))
+        return self._send("HEAD", self._invoker.head, url, *args, **kwargs)
 
     def options(self, url, *args, **kwargs):
-        url, args, kwargs = self._build_request(url, *args, **kwargs)
-        return self._wrap_response(self._invoker.options(url, *args, **kwargs))
+        return self._send("OPTIONS", self._invoker.options, url, *args, **kwargs)
 
     def post(self, url, *args, **kwargs):
-        url, args, kwargs = self._build_request(url, *args, **kwargs)
-        return self._wrap_response(self._invoker.post(url, *args, **kwargs))
+        return self._send("POST", self._invoker.post, url, *args, **kwargs)
 
     def put(self, url, *args, **kwargs):
-        url, args, kwargs = self._build_request(url, *args, **kwargs)
-        return self._wrap_response(self._invoker.put(url, *args, **kwargs))
+        return self._send("PUT", self._invoker.put, url, *args, **kwargs)
 
     def patch(self, url, *args, **kwargs):
-        url, args, kwargs = self._build_request(url, *args, **kwargs)
-        return self._wrap_response(self._invoker.patch(url, *args, **kwargs))
+        return self._send("PATCH", self._invoker.patch, url, *args, **kwargs)
 
     def delete(self, url, *args, **kwargs):
-        url, args, kwargs = self._build_request(url, *args, **kwargs)
-        return self._wrap_response(self._invoker.delete(url, *args, **kwargs))
+        return self._send("DELETE", self._invoker.delete, url, *args, **kwargs)
+
+    @contextmanager
+    def stream(self, method, url, *args, **kwargs):
+        """Sends a request and yields the wrapped response as soon as its headers are
+        received, the body is read on demand with `iter_bytes()`, `iter_lines()`,
+        `iter_json_records()` or `to_file()`, then released at the end of the block:
+
+            with curli.stream("GET", "export/users") as r:
+                r.to_file("users.ndjson")
+
+        The request is built as for the other verbs (base URL, default headers and
+        access token), but it is not sent again on a 401 response.
+        """
+        instrumentation = self._instrumentation
+        timing = instrumentation.start(method, url) if instrumentation is not None else None
+
+        request_url, request_args, request_kwargs = self._build_request(url, *args, **kwargs)
+        if timing is not None:
+            instrumentation.before(timing, request_url, request_kwargs)
+
+        with ExitStack() as stack:
+            # only the errors of the request itself are recorded, not those raised in the block
+            try:
+                response = stack.enter_context(
+                        self._invoker.stream(method, request_url, *request_args, **request_kwargs))
+            except Exception as error:
+                if timing is not None:
+                    instrumentation.finish(timing, error=error)
+                raise
+            wrapper = self._wrap_response(response, timing)
+            if self._request_log is not None:
+                self._request_log.log(wrapper)
+            try:
+                yield wrapper
+            finally:
+                if timing is not None:
+                    instrumentation.finish(timing, response=wrapper)
+
+    def upload(self, url, source, method = "POST", chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs):
+        """Sends the content of a file (a path or a binary file object) as a chunked
+        request body, read `chunk_size` bytes at a time. Any iterable of bytes can
+        also be passed as `content=` to the verb methods.
+
+        The streamed body cannot be sent twice, so a 401 response is returned as is
+        instead of being retried with a refreshed token.
+        """
+        return self.request(method, url, content=iter_file_chunks(source, chunk_size), **kwargs)
+
+    def paginate(self, url, params = None, prefetch: int = 2, field_name: str = "founds",
+            page_size: int = 100, page_param: str = "page", size_param: str|None = "size",
+            first_page: int = 1, offset_param: str|None = None, max_pages: int|None = None, **kwargs):
+        """Yields the items of a paginated list endpoint one by one, following the paging
+        parameters (see `Pagination`) until the last page. The next `prefetch` pages
+        are fetched concurrently on a thread pool while the items of the current
+        page are consumed, so at most `prefetch + 1` pages are held in memory.
+
+        A server returning different full pages whatever the page number (e.g. a
+        moving window of the latest items) is walked forever: give `max_pages` to
+        bound the walk of an untrusted endpoint. With `offset_param`, a `page_size`
+        above the page size of the server skips items.
+
+        The other keyword arguments are passed to `get()`; the pages are requested
+        with the account/session profiles of the calling context.
+        """
+        pagination = Pagination(params, field_name=field_name, page_size=page_size, page_param=page_param,
+                size_param=size_param, first_page=first_page, offset_param=offset_param, max_pages=max_pages)
+        numbers = pagination.numbers()
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=max(1, prefetch))
+
+        def fetch_next():
+            number = next(numbers, None)
+            if number is not None:
+                # the pages are not summarized, their items are read
+                future = executor.submit(contextvars.copy_context().run, self._send, "GET", self._invoker.get,
+                        url, params=pagination.params_of(number), summarize=False, **kwargs)
+                pending.append((number, future))
+
+        try:
+            for _ in range(1 + max(0, prefetch)):
+                fetch_next()
+            while pending:
+                number, future = pending.popleft()
+                items = pagination.items_of(number, future.result())
+                if pagination.is_repeated(items):
+                    items = []
+                if pagination.is_last(items):
+                    pending.clear()
+                else:
+                    fetch_next()
+                yield from items
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def capture_paged_id_refs(self, url, name_of_id_refs: str|None = None, name_of_key_field = "email",
+            **kwargs):
+        """Captures the `{ key: id }` map of all of the items of a paginated list endpoint
+        into the session store, page after page (see `paginate()` for the keyword
+        arguments), without building the list of the items. It is the counterpart of
+        `ResponseWrapper.capture_id_refs()` for the items of many pages.
+        """
+        if name_of_id_refs is None:
+            name_of_id_refs = f"{ urllib.parse.urlsplit(url).path.split('/')[-1] }_ids_of"
+        if name_of_id_refs not in self._session:
+            self._session[name_of_id_refs] = dict()
+        fill_ids_map(self.paginate(url, **kwargs), name_of_key_field, self._session[name_of_id_refs])
+        self._session.touch()
+        return self._session[name_of_id_refs]
+
+    def batch(self, requests, concurrency: int = 10, timeout: float|None = None,
+            fail_fast: bool = True) -> list:
+        """Sends a list of requests concurrently on a thread pool of `concurrency`
+        workers and returns the wrapped responses in the order of the requests.
+
+        Each request is a spec accepted by `normalize_request_spec`. The `timeout`
+        (in seconds) applies to the whole batch. With `fail_fast`, the first error
+        is raised and the pending requests are cancelled; otherwise the errors are
+        collected in place of the responses.
+
+        The calls share the invoker, so use `pooled()` to reuse the connections.
+        They are sent with the account/session profiles of the calling context.
+        """
+        requests = list(requests)
+        results = [None] * len(requests)
+        for index, result in self.batch_iter(requests, concurrency=concurrency,
+                timeout=timeout, fail_fast=fail_fast):
+            results[index] = result
+        return results
+
+    def batch_iter(self, requests, concurrency: int = 10, timeout: float|None = None,
+            fail_fast: bool = True):
+        """Same as `batch()`, but yields `(index, response_or_error)` pairs as soon
+        as the requests complete.
+        """
+        specs = [normalize_request_spec(spec) for spec in requests]
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        # every call runs in a copy of the calling context, to keep the profiles selected with using()
+        futures = {executor.submit(contextvars.copy_context().run, self.request, method, url, **kwargs): index
+                for index, (method, url, kwargs) in enumerate(specs)}
+        yielded = set()
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                index = futures[future]
+                error = future.exception()
+                if error is not None and fail_fast:
+                    raise error
+                yielded.add(index)
+                yield index, (future.result() if error is None else error)
+        except TimeoutError as error:
+            if fail_fast:
+                raise
+            for index in futures.values():
+                if index not in yielded:
+                    yield index, error
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_bearer_token(headers):
+    authorization = headers.get(HK_AUTHORIZATION)
+    if isinstance(authorization, str) and authorization.startswith("Bearer "):
+        return authorization[len("Bearer "):]
+    return None
+
+
+class _RequestTemplate:
+    __slots__ = ("url_prefix", "session_headers", "headers")
+
+    def __init__(self, base_url, session_headers, access_token):
+        self.url_prefix = base_url + '/' if base_url else None
+        self.session_headers = dict(session_headers) if isinstance(session_headers, dict) else {}
+        self.headers = self.headers_with_token(access_token)
+
+    def headers_with_token(self, access_token):
+        if access_token and isinstance(access_token, str):
+            return {HK_AUTHORIZATION: f"Bearer {access_token}", **self.session_headers}
+        return self.session_headers
+
+    def join_url(self, url):
+        url = url.lstrip('/')
+        if url.startswith(('?', '#', '.')) or '/.' in url:
+            # relative references are resolved the same way as before
+            return urllib.parse.urljoin(self.url_prefix, url)
+        return self.url_prefix + url
+
+
+def _is_module_invoker(invoker):
+    while not inspect.ismodule(invoker):
+        invoker = getattr(invoker, "invoker", None)
+        if invoker is None:
+            return False
+    return True
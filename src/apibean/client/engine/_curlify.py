@@ -0,0 +1,81 @@
+import json
+
+def build_curl(method, url, headers, body = None, compressed = False, verified = True) -> str:
+    """Builds the curl command of a request from its parts, `headers` being the list of
+    the `(name, value)` pairs to send.
+    """
+    parts = [f'curl -X {method} "{url}"']
+    parts.extend(f'-H "{name}: {value}"' for name, value in headers)
+    if method != 'GET':
+        parts.append(f"-d '{'' if body is None else body}'")
+    if compressed:
+        parts.append("--compressed")
+    if not verified:
+        parts.append("--insecure")
+    return " \\\n".join(parts)
+
+
+class Curlify:
+    DEFAULT_EXCLUDE_HEADERS = [
+        "host",
+        "content-length",
+        "accept-encoding",
+        "connection",
+        "user-agent",
+    ]
+
+    def __init__(self, request, exclude_headers = DEFAULT_EXCLUDE_HEADERS,
+            compressed=False, verified=True, pretty=True):
+        self.req = request
+        self.exclude_headers = exclude_headers
+        self.compressed = compressed
+        self.verified = verified
+        self.pretty = pretty
+
+    def to_curl(self) -> str:
+        """to_curl function returns a string of curl to execute in shell.
+        """
+        return self.build()
+
+    def build(self) -> str:
+        """build curl command string
+
+        Returns:
+            str: string represents curl command
+        """
+        headers = [(k, v) for k, v in self.req.headers.items() if k not in self.exclude_headers]
+        body = self.decode_body() if self.req.method != 'GET' else None
+        return build_curl(self.req.method, self.req.url, headers, body,
+                compressed=self.compressed, verified=self.verified)
+
+    def headers(self) -> str:
+        """convert the request's headers to string
+
+        Returns:
+            str: return string of headers
+        """
+        headers = [f'"{k}: {v}"' for k, v in self.req.headers.items() if k not in self.exclude_headers]
+
+        return " -H ".join(headers)
+
+    def decode_body(self):
+        body = self.read_body()
+
+        if body and isinstance(body, bytes):
+            content_type = self.req.headers.get("content-type", None)
+            if self.pretty and content_type and content_type == "application/json":
+                return json.dumps(json.loads(body.decode()), indent=2)
+            return body.decode()
+
+        return body
+
+    def read_body(self):
+        if hasattr(self.req, "body"):
+            return self.req.body
+
+        import httpx
+        if not isinstance(getattr(self.req, "stream", None), httpx.ByteStream):
+            # a streamed (chunked) body is not kept in memory until read, it cannot be read back
+            return "<streamed body>"
+
+        return self.req.read()
@@ -1,16 +1,65 @@
 from typing import Optional
-from functools import reduce
 
 import json
-import re
+import time
+
+import httpx
 
 from ._consts import HK_REQUEST_ID
+from ._jsonstream import iter_array_items, get_top_level_field, is_json_object
+from ._utils import decoded_headers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_UNDECODED = object()
+
+def use_fast_json(enabled: bool = True) -> bool:
+    """Lets ResponseWrapper decode the JSON bodies with `orjson` when it is installed.
+    Returns whether the fast decoder is in use.
+    """
+    ResponseWrapper.JSON_LOADS = orjson.loads if enabled and orjson is not None else None
+    return ResponseWrapper.JSON_LOADS is not None
+
+
+def fill_ids_map(items, name_of_key_field, ids_map: dict) -> dict:
+    """Maps the `name_of_key_field` field (or each field of a list of field names) of
+    the items to their ids, into `ids_map`, consuming the items one by one.
+    """
+    if isinstance(name_of_key_field, str):
+        for item in items:
+            ids_map[item[name_of_key_field]] = item["id"]
+    else:
+        key_fields = tuple(name_of_key_field)
+        for item in items:
+            item_id = item["id"]
+            for key_field in key_fields:
+                ids_map[item[key_field]] = item_id
+    return ids_map
+
 
 class ResponseWrapper:
+    """Wraps an `httpx.Response` (and passes `isinstance` checks against it) to add
+    the helpers of apibean. The common attributes of the response are read
+    through direct properties, the other ones are forwarded to it.
+
+    After `summarize()`, only the requested fields of the JSON body are kept and
+    the raw body is released, for the responses held in large numbers.
+    """
+
+    __slots__ = ("_wrapped_object", "_json_body", "timing", "_session_store", "_account_store")
+
+    JSON_LOADS = None
+
     def __init__(self, wrapped_object, session_store, account_store):
-        self._wrapped_object = wrapped_object
-        self._session_store = session_store
-        self._account_store = account_store
+        set_own = object.__setattr__
+        set_own(self, "_wrapped_object", wrapped_object)
+        set_own(self, "_json_body", _UNDECODED)
+        set_own(self, "timing", None)
+        set_own(self, "_session_store", session_store)
+        set_own(self, "_account_store", account_store)
 
     def __getattr__(self, name):
         """Intercepts attribute access and forwards it to the wrapped object."""
@@ -18,9 +67,9 @@ class ResponseWrapper:
 
     def __setattr__(self, name, value):
         """Intercepts attribute assignment and forwards it to the wrapped object."""
-        if name == "_wrapped_object":
-            # Allow assignment of the wrapped object itself.
-            super().__setattr__(name, value)
+        if name in ResponseWrapper.__slots__:
+            # Allow assignment of the own attributes (wrapped object, decoded body, ...).
+            object.__setattr__(self, name, value)
         else:
             # Forward other assignments to the wrapped object.
             setattr(self._wrapped_object, name, value)
@@ -38,6 +87,68 @@ class ResponseWrapper:
         """Preserves the class of the wrapped object."""
         return self._wrapped_object.__class__
 
+    @property
+    def status_code(self):
+        return self._wrapped_object.status_code
+
+    @property
+    def is_success(self):
+        return self._wrapped_object.is_success
+
+    @property
+    def is_error(self):
+        return self._wrapped_object.is_error
+
+    @property
+    def headers(self):
+        return self._wrapped_object.headers
+
+    @property
+    def request(self):
+        return self._wrapped_object.request
+
+    @property
+    def url(self):
+        return self._wrapped_object.url
+
+    @property
+    def content(self):
+        return self._wrapped_object.content
+
+    @property
+    def text(self):
+        return self._wrapped_object.text
+
+    def summarize(self, *field_names):
+        """Keeps only the given top-level fields of the JSON body (none if omitted) and
+        releases the raw body, the other attributes of the response (status,
+        headers, request) are kept. Returns the wrapper itself.
+
+        The response is kept as is when its body is not a JSON object (e.g. an HTML
+        error page) or is malformed.
+        """
+        response = self._assert_response()
+        body = self._json_body
+        if not (isinstance(body, dict) if body is not _UNDECODED else is_json_object(response.text)):
+            return self
+        summary = None
+        if field_names:
+            summary = dict()
+            try:
+                for name in field_names:
+                    value = self.get_field(name, _UNDECODED)
+                    if value is not _UNDECODED:
+                        summary[name] = value
+            except ValueError:
+                return self
+        self._json_body = summary
+        # the network stream (if any) is not kept
+        extensions = {key: value for key, value in response.extensions.items() if key != "network_stream"}
+        self._wrapped_object = httpx.Response(response.status_code, headers=decoded_headers(response.headers),
+                request=response.request, extensions=extensions)
+        response.close()
+        return self
+
     def _assert_response(self):
         if self._wrapped_object is None:
             raise RuntimeError(
@@ -46,9 +157,43 @@ class ResponseWrapper:
         return self._wrapped_object
 
     def _assert_response_body(self):
-        body = self._assert_response().json()
+        body = self.json()
+        return body
+
+    def json(self, **kwargs):
+        """Decodes the JSON body once and returns the memoized result on the later
+        calls, so the returned object is shared and should not be modified. The
+        keyword arguments (if any) are passed to `json.loads` and bypass the cache.
+        """
+        if kwargs:
+            return self._assert_response().json(**kwargs)
+        body = self._json_body
+        if body is _UNDECODED:
+            response = self._assert_response()
+            loads = ResponseWrapper.JSON_LOADS
+            timing = self.timing
+            started = time.perf_counter() if timing is not None else None
+            body = self._json_body = loads(response.content) if loads else response.json()
+            if timing is not None:
+                timing.add_phase("decode", time.perf_counter() - started)
         return body
 
+    def get_field(self, field_name, default = None):
+        """Returns a top-level field of the JSON body. When the body has not been
+        decoded yet, only that field is decoded, the other ones (e.g. a huge `founds`
+        array) are skipped over without being materialized.
+
+        The `default` is returned when the body is not a JSON object (e.g. empty or
+        an HTML error page), whether it has been decoded or not.
+        """
+        body = self._json_body
+        if body is not _UNDECODED:
+            return body.get(field_name, default) if isinstance(body, dict) else default
+        text = self._assert_response().text
+        if not is_json_object(text):
+            return default
+        return get_top_level_field(text, field_name, default)
+
     def get_id(self):
         return self.get_value_of("id")
 
@@ -60,7 +205,15 @@ class ResponseWrapper:
             )
         return body.get(field_name)
 
-    def capture_id_refs(self, name_of_id_refs:Optional[str] = None, name_of_key_field = "email"):
+    def capture_id_refs(self, name_of_id_refs:Optional[str] = None, name_of_key_field = "email",
+            stream: bool = False):
+        """Captures the `{ key: id }` map of the returned items into the session store.
+
+        The `name_of_key_field` can be a list of field names, then each of these
+        fields of an item is mapped to the id of that item. With `stream`, the
+        items are parsed incrementally from the response body instead of decoding
+        the whole body at once.
+        """
         if not self._wrapped_object.is_success:
             self.print()
             raise RuntimeError("The response is not sussess")
@@ -68,7 +221,9 @@ class ResponseWrapper:
             name_of_id_refs = self._build_name_of_id_refs()
         if name_of_id_refs not in self._session_store:
             self._session_store[name_of_id_refs] = dict()
-        self._session_store[name_of_id_refs].update(**self._extract_ids_map(name_of_key_field))
+        self._extract_ids_map(name_of_key_field, stream=stream,
+                ids_map=self._session_store[name_of_id_refs])
+        self._session_store.touch()
         return self
 
     def _build_name_of_id_refs(self):
@@ -78,19 +233,67 @@ class ResponseWrapper:
         urlpath = r.request.url.path
         return urlpath.split('/')[-1]
 
-    def _extract_ids_map(self, name_of_key_field="email"):
-        return reduce(lambda acc, item: {**acc, item[name_of_key_field]: item["id"]},
-                self._get_list_of_items(),
-                dict())
+    def _extract_ids_map(self, name_of_key_field="email", stream=False, ids_map=None):
+        return fill_ids_map(self._iter_list_of_items(stream=stream), name_of_key_field,
+                ids_map if ids_map is not None else dict())
+
+    def _iter_list_of_items(self, stream=False):
+        if stream and self._json_body is _UNDECODED:
+            return iter_array_items(self._wrapped_object.iter_bytes(), "founds")
+        return iter(self._get_list_of_items())
 
     def _get_list_of_items(self):
-        resp_body = self._wrapped_object.json()
+        resp_body = self.json()
         if "founds" in resp_body:
             items = resp_body["founds"]
         else:
             items = [ resp_body ]
         return items
 
+    def iter_json_records(self):
+        """Yields the records of a NDJSON (newline-delimited JSON) body one by one, as
+        the body is received when the response is streamed.
+        """
+        loads = ResponseWrapper.JSON_LOADS or json.loads
+        for line in self._assert_response().iter_lines():
+            if line.strip():
+                yield loads(line)
+
+    async def aiter_json_records(self):
+        loads = ResponseWrapper.JSON_LOADS or json.loads
+        async for line in self._assert_response().aiter_lines():
+            if line.strip():
+                yield loads(line)
+
+    def to_file(self, path, chunk_size: int = 64 * 1024) -> int:
+        """Writes the body to a file (a path or a binary file object), chunk by chunk
+        when the response is streamed, and returns the number of written bytes.
+        """
+        response = self._assert_response()
+        if not hasattr(path, "write"):
+            with open(path, "wb") as file:
+                return self._write_chunks(response.iter_bytes(chunk_size), file)
+        return self._write_chunks(response.iter_bytes(chunk_size), path)
+
+    async def ato_file(self, path, chunk_size: int = 64 * 1024) -> int:
+        file = path if hasattr(path, "write") else open(path, "wb")
+        try:
+            size = 0
+            async for chunk in self._assert_response().aiter_bytes(chunk_size):
+                file.write(chunk)
+                size += len(chunk)
+            return size
+        finally:
+            if file is not path:
+                file.close()
+
+    def _write_chunks(self, chunks, file):
+        size = 0
+        for chunk in chunks:
+            file.write(chunk)
+            size += len(chunk)
+        return size
+
     def get_request_id(self, from_response=False):
         if from_response:
             headers = self._wrapped_object.headers
@@ -107,79 +310,11 @@ class ResponseWrapper:
             print(response)
         else:
             print(response)
-            print(json.dumps(response.json(), indent=2))
+            print(json.dumps(self.json(), indent=2))
 
     def print_body(self):
-        print(json.dumps(self._wrapped_object.json(), indent=2))
+        print(json.dumps(self.json(), indent=2))
 
     def print_curl(self):
+        from ._curlify import Curlify
         print(Curlify(self._wrapped_object.request).to_curl())
-
-
-class Curlify:
-    DEFAULT_EXCLUDE_HEADERS = [
-        "host",
-        "content-length",
-        "accept-encoding",
-        "connection",
-        "user-agent",
-    ]
-
-    def __init__(self, request, exclude_headers = DEFAULT_EXCLUDE_HEADERS,
-            compressed=False, verified=True):
-        self.req = request
-        self.exclude_headers = exclude_headers
-        self.compressed = compressed
-        self.verified = verified
-
-    def to_curl(self) -> str:
-        """to_curl function returns a string of curl to execute in shell.
-        """
-        return self.build()
-
-    def build(self) -> str:
-        """build curl command string
-
-        Returns:
-            str: string represents curl command
-        """
-        quote = f'curl -X {self.req.method} "{self.req.url}" -H {self.headers()}'
-        if self.req.method != 'GET':
-            quote = quote + f" -d '{self.decode_body()}'"
-
-        parts = re.split(r'\s(?=-[dH])', quote)
-
-        if self.compressed:
-            parts.append("--compressed")
-        if not self.verified:
-            parts.append("--insecure")
-
-        quote = " \\\n".join(parts)
-        return quote
-
-    def headers(self) -> str:
-        """convert the request's headers to string
-
-        Returns:
-            str: return string of headers
-        """
-        headers = [f'"{k}: {v}"' for k, v in self.req.headers.items() if k not in self.exclude_headers]
-
-        return " -H ".join(headers)
-
-    def decode_body(self):
-        body = self.read_body()
-
-        if body and isinstance(body, bytes):
-            content_type = self.req.headers.get("content-type", None)
-            if content_type and content_type == "application/json":
-                return json.dumps(json.loads(body.decode()), indent=2)
-            return body.decode()
-
-        return body
-
-    def read_body(self):
-        if hasattr(self.req, "body"):
-            return self.req.body
-
-        return self.req.read()
@@ -0,0 +1,205 @@
+import re
+import threading
+import time
+import urllib.parse
+from collections import deque
+
+from ._consts import HK_REQUEST_ID
+
+# the httpcore trace events, grouped into the phases of a request
+TRACE_PHASES = {
+    "connection.connect_tcp": "connect",
+    "connection.connect_unix_socket": "connect",
+    "connection.start_tls": "tls",
+    "http11.send_request_headers": "send",
+    "http11.send_request_body": "send",
+    "http2.send_request_headers": "send",
+    "http2.send_request_body": "send",
+    "http11.receive_response_headers": "wait",
+    "http2.receive_response_headers": "wait",
+    "http11.receive_response_body": "download",
+    "http2.receive_response_body": "download",
+}
+
+_ID_SEGMENT = re.compile(r"^(?:\d+|[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}|[0-9a-fA-F]{24,})$")
+
+def default_endpoint_of(method, url) -> str:
+    """Groups the requests by method and path, with the id-like segments of the path
+    (numbers, UUIDs, object ids) replaced by `{id}`.
+    """
+    path = urllib.parse.urlsplit(str(url)).path
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/")]
+    return f"{ method.upper() } { '/'.join(segments) }"
+
+
+class RequestTiming:
+    """The timings (in seconds) of one request sent through an instrumented Curli.
+
+    Properties:
+    - `request_id`: The X-Request-Id of the request.
+    - `endpoint`: The endpoint the request is aggregated into.
+    - `phases`: The duration of each phase: build (headers), connect (DNS + TCP),
+        tls, send, wait (server), download (body) and decode (JSON).
+    - `total`: The duration from the beginning of the call to the response.
+    """
+
+    __slots__ = ("method", "url", "endpoint", "request_id", "started", "phases",
+            "total", "status_code", "error", "_aggregator", "_pending")
+
+    def __init__(self, method, url, endpoint, aggregator):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.request_id = None
+        self.started = time.perf_counter()
+        self.phases = dict()
+        self.total = None
+        self.status_code = None
+        self.error = None
+        self._aggregator = aggregator
+        self._pending = dict()
+
+    def add_phase(self, name, duration):
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+        if self.total is not None and self._aggregator is not None:
+            # a phase measured after the response (e.g. decode) is recorded apart
+            self._aggregator.record_phase(self.endpoint, name, duration)
+
+    def trace(self, event_name, info):
+        """The callback of the httpx `trace` extension."""
+        prefix, _, stage = event_name.rpartition(".")
+        phase = TRACE_PHASES.get(prefix)
+        if phase is None:
+            return
+        if stage == "started":
+            self._pending[prefix] = time.perf_counter()
+        elif prefix in self._pending:
+            self.add_phase(phase, time.perf_counter() - self._pending.pop(prefix))
+
+    async def atrace(self, event_name, info):
+        self.trace(event_name, info)
+
+
+class LatencyAggregator:
+    """Collects the latencies of the requests per endpoint, in bounded sample windows
+    (the `max_samples` latest requests), and reports their percentiles.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self._max_samples = max_samples
+        self._series = dict()
+        self._lock = threading.Lock()
+
+    def _series_of(self, endpoint):
+        series = self._series.get(endpoint)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(endpoint, dict(count=0, errors=0, phases=dict(),
+                        total=deque(maxlen=self._max_samples)))
+        return series
+
+    def _samples_of(self, series, phase):
+        # called with the lock held
+        samples = series["phases"].get(phase)
+        if samples is None:
+            samples = series["phases"][phase] = deque(maxlen=self._max_samples)
+        return samples
+
+    def record(self, timing: RequestTiming):
+        series = self._series_of(timing.endpoint)
+        with self._lock:
+            series["count"] += 1
+            if timing.error is not None or (timing.status_code or 0) >= 400:
+                series["errors"] += 1
+            series["total"].append(timing.total)
+            for phase, duration in timing.phases.items():
+                self._samples_of(series, phase).append(duration)
+
+    def record_phase(self, endpoint, phase, duration):
+        series = self._series_of(endpoint)
+        with self._lock:
+            self._samples_of(series, phase).append(duration)
+
+    def reset(self):
+        with self._lock:
+            self._series = dict()
+
+    def snapshot(self) -> dict:
+        """Returns a plain (picklable) copy of the samples, `{ endpoint: { count, errors,
+        total: [...] } }`, e.g. to merge the aggregators of several processes.
+        """
+        with self._lock:
+            return {endpoint: dict(count=series["count"], errors=series["errors"],
+                    total=list(series["total"]))
+                    for endpoint, series in self._series.items()}
+
+    def report(self) -> dict:
+        """Returns `{ endpoint: { count, errors, p50, p95, p99, phases: { phase: {...} } } }`
+        with the latencies in seconds.
+        """
+        # the samples are copied under the lock, then sorted without holding it
+        with self._lock:
+            copies = [(endpoint, series["count"], series["errors"], tuple(series["total"]),
+                    [(phase, tuple(samples)) for phase, samples in series["phases"].items()])
+                    for endpoint, series in self._series.items()]
+        report = dict()
+        for endpoint, count, errors, total, phases in copies:
+            report[endpoint] = dict(count=count, errors=errors, **_percentiles(total),
+                    phases={phase: _percentiles(samples) for phase, samples in phases})
+        return report
+
+
+class Instrumentation:
+    """The instrumentation of a Curli object: the pre-request hooks are called with
+    `(timing, url, kwargs)` before sending (they may change the kwargs), the
+    post-request hooks with `(timing, response)` afterwards (the response is None
+    when the request has failed), and every timing is recorded by the aggregator.
+    """
+
+    def __init__(self, aggregator: LatencyAggregator|None = None, trace: bool = True,
+            endpoint_of = default_endpoint_of):
+        self.aggregator = aggregator if aggregator is not None else LatencyAggregator()
+        self.trace = trace
+        self.endpoint_of = endpoint_of
+        self.pre_hooks = []
+        self.post_hooks = []
+
+    def add_pre_hook(self, hook):
+        self.pre_hooks.append(hook)
+        return hook
+
+    def add_post_hook(self, hook):
+        self.post_hooks.append(hook)
+        return hook
+
+    def start(self, method, url) -> RequestTiming:
+        return RequestTiming(method, url, self.endpoint_of(method, url), self.aggregator)
+
+    def before(self, timing: RequestTiming, url, kwargs, is_async = False):
+        timing.add_phase("build", time.perf_counter() - timing.started)
+        timing.url = url
+        timing.request_id = kwargs["headers"].get(HK_REQUEST_ID)
+        if self.trace:
+            extensions = dict(kwargs.get("extensions") or {})
+            extensions["trace"] = timing.atrace if is_async else timing.trace
+            kwargs["extensions"] = extensions
+        for hook in self.pre_hooks:
+            hook(timing, url, kwargs)
+
+    def finish(self, timing: RequestTiming, response = None, error = None):
+        timing.total = time.perf_counter() - timing.started
+        timing.error = error
+        if response is not None:
+            timing.status_code = response.status_code
+        self.aggregator.record(timing)
+        for hook in self.post_hooks:
+            hook(timing, response)
+
+
+def _percentiles(samples) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return dict(p50=None, p95=None, p99=None)
+    last = len(ordered) - 1
+    return {name: ordered[min(last, int(round(last * rank)))]
+            for name, rank in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))}
@@ -0,0 +1,249 @@
+import asyncio
+import copy
+import threading
+import urllib.parse
+import weakref
+
+import httpx
+
+# the options of the module-level `httpx` functions which apply to a whole client
+CLIENT_OPTIONS = {"verify": True, "cert": None, "proxy": None, "proxies": None, "trust_env": True}
+
+class PooledInvoker:
+    """A drop-in replacement for the `httpx` module as the invoker of a Curli object.
+
+    Instead of opening a new connection for every call (as the module-level
+    `httpx.get()`, `httpx.post()`, ... functions do), this invoker keeps one
+    long-lived `httpx.Client` per base URL (scheme + host + port), so the
+    connections are reused across requests.
+
+    Properties:
+    - `limits`: The `httpx.Limits` object shared by all of the pooled clients.
+    - `http2`: Enables HTTP/2 (requires the `h2` package).
+
+    The client options (`verify`, `cert`, `proxy`, `trust_env`) are given to the
+    constructor, for all of the pooled clients. They are accepted per request only
+    when they match the options of the clients, otherwise a TypeError is raised.
+    """
+
+    def __init__(self, max_connections: int|None = 100,
+            max_keepalive_connections: int|None = 20,
+            keepalive_expiry: float|None = 5.0,
+            http2: bool = False,
+            **client_kwargs):
+        self._limits = httpx.Limits(max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry)
+        self._http2 = http2
+        self._client_kwargs = client_kwargs
+        self._clients = dict()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def limits(self):
+        return self._limits
+
+    @property
+    def http2(self):
+        return self._http2
+
+    @property
+    def clients(self):
+        return dict(self._clients)
+
+    def _build_client(self):
+        return httpx.Client(limits=self._limits, http2=self._http2, **self._client_kwargs)
+
+    def _get_client(self, url, kwargs):
+        if kwargs and not CLIENT_OPTIONS.keys().isdisjoint(kwargs):
+            _pop_client_options(kwargs, self._client_kwargs)
+        key = _extract_base_url(url)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The invoker has been closed.")
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = self._build_client()
+        return client
+
+    def request(self, method, url, *args, **kwargs):
+        return self._get_client(url, kwargs).request(method, url, *args, **kwargs)
+
+    def get(self, url, *args, **kwargs):
+        return self._get_client(url, kwargs).get(url, *args, **kwargs)
+
+    def head(self, url, *args, **kwargs):
+        return self._get_client(url, kwargs).head(url, *args, **kwargs)
+
+    def options(self, url, *args, **kwargs):
+        return self._get_client(url, kwargs).options(url, *args, **kwargs)
+
+    def post(self, url, *args, **kwargs):
+        return self._get_client(url, kwargs).post(url, *args, **kwargs)
+
+    def put(self, url, *args, **kwargs):
+        return self._get_client(url, kwargs).put(url, *args, **kwargs)
+
+    def patch(self, url, *args, **kwargs):
+        return self._get_client(url, kwargs).patch(url, *args, **kwargs)
+
+    def delete(self, url, *args, **kwargs):
+        return self._get_client(url, kwargs).delete(url, *args, **kwargs)
+
+    def stream(self, method, url, *args, **kwargs):
+        return self._get_client(url, kwargs).stream(method, url, *args, **kwargs)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            clients, self._clients = self._clients, dict()
+        for client in clients.values():
+            client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncPooledInvoker:
+    """The asynchronous counterpart of PooledInvoker, it keeps one long-lived
+    `httpx.AsyncClient` per base URL. All of the verb methods are coroutines.
+
+    The connections of an `httpx.AsyncClient` are bound to the event loop they
+    were opened on, so the clients are kept per event loop: the invoker can be
+    used from successive `asyncio.run()` calls, the clients of a closed loop
+    being released with it.
+    """
+
+    def __init__(self, max_connections: int|None = 1000,
+            max_keepalive_connections: int|None = 100,
+            keepalive_expiry: float|None = 5.0,
+            http2: bool = False,
+            **client_kwargs):
+        self._limits = httpx.Limits(max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry)
+        self._http2 = http2
+        self._client_kwargs = client_kwargs
+        self._clients_of_loop = weakref.WeakKeyDictionary()
+        self._loop = None
+        self._clients = dict()
+        self._closed = False
+
+    @property
+    def limits(self):
+        return self._limits
+
+    @property
+    def http2(self):
+        return self._http2
+
+    @property
+    def clients(self):
+        """The clients of the current event loop."""
+        return dict(self._clients)
+
+    def _build_client(self):
+        return httpx.AsyncClient(limits=self._limits, http2=self._http2, **self._client_kwargs)
+
+    def _get_client(self, url, kwargs):
+        if kwargs and not CLIENT_OPTIONS.keys().isdisjoint(kwargs):
+            _pop_client_options(kwargs, self._client_kwargs)
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._clients = self._clients_of_loop.setdefault(loop, dict())
+            self._loop = loop
+        # there is no await between the lookup and the assignment, so the
+        # event loop cannot interleave two creations of the same client
+        key = _extract_base_url(url)
+        client = self._clients.get(key)
+        if client is None:
+            if self._closed:
+                raise RuntimeError("The invoker has been closed.")
+            client = self._clients[key] = self._build_client()
+        return client
+
+    async def request(self, method, url, *args, **kwargs):
+        return await self._get_client(url, kwargs).request(method, url, *args, **kwargs)
+
+    async def get(self, url, *args, **kwargs):
+        return await self._get_client(url, kwargs).get(url, *args, **kwargs)
+
+    async def head(self, url, *args, **kwargs):
+        return await self._get_client(url, kwargs).head(url, *args, **kwargs)
+
+    async def options(self, url, *args, **kwargs):
+        return await self._get_client(url, kwargs).options(url, *args, **kwargs)
+
+    async def post(self, url, *args, **kwargs):
+        return await self._get_client(url, kwargs).post(url, *args, **kwargs)
+
+    async def put(self, url, *args, **kwargs):
+        return await self._get_client(url, kwargs).put(url, *args, **kwargs)
+
+    async def patch(self, url, *args, **kwargs):
+        return await self._get_client(url, kwargs).patch(url, *args, **kwargs)
+
+    async def delete(self, url, *args, **kwargs):
+        return await self._get_client(url, kwargs).delete(url, *args, **kwargs)
+
+    def stream(self, method, url, *args, **kwargs):
+        return self._get_client(url, kwargs).stream(method, url, *args, **kwargs)
+
+    async def aclose(self):
+        """Closes the clients of the current event loop, those of the other (closed)
+        loops are dropped.
+        """
+        self._closed = True
+        clients = self._clients if self._loop is asyncio.get_running_loop() else dict()
+        self._clients, self._loop = dict(), None
+        self._clients_of_loop.clear()
+        for client in clients.values():
+            await client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+def rescope_invoker(invoker, scope_of):
+    """Returns the given chain of invoker wrappers with its scoped wrappers (cache,
+    coalescing, limits) bound to another `scope_of` callable, e.g. the account
+    profile of another Curli object. The rebound wrappers are shallow copies, so
+    they share their state (cache, in-flight calls, limiter) with the original
+    ones; the chain itself is returned when it holds no scoped wrapper.
+    """
+    inner = getattr(invoker, "_invoker", None)
+    if inner is None:
+        return invoker
+    rescoped_inner = rescope_invoker(inner, scope_of)
+    is_scoped = hasattr(invoker, "_scope_of")
+    if rescoped_inner is inner and not is_scoped:
+        return invoker
+    rescoped = copy.copy(invoker)
+    rescoped._invoker = rescoped_inner
+    if is_scoped:
+        rescoped._scope_of = scope_of
+    return rescoped
+
+
+def _pop_client_options(kwargs, client_kwargs):
+    for name, default in CLIENT_OPTIONS.items():
+        if name in kwargs:
+            value = kwargs.pop(name)
+            if value != client_kwargs.get(name, default):
+                raise TypeError(f"The '{ name }' option applies to the pooled clients, pass it to the"
+                        f" invoker (e.g. `curli.pooled({ name }=...)`) instead of the request")
+
+
+def _extract_base_url(url) -> str:
+    parts = urllib.parse.urlsplit(str(url))
+    return f"{ parts.scheme }://{ parts.netloc }"
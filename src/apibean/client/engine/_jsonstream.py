@@ -0,0 +1,171 @@
+import codecs
+import json
+import re
+from json.decoder import scanstring
+
+_decoder = json.JSONDecoder()
+_WHITESPACES = " \t\n\r"
+
+class _ChunkReader:
+    def __init__(self, chunks, encoding="utf-8"):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def read_more(self) -> bool:
+        if self.exhausted:
+            return False
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                # drop the consumed part, so that the buffer stays small
+                self.buffer = self.buffer[self.pos:] + text
+                self.pos = 0
+                return True
+        self.buffer = self.buffer[self.pos:] + self._decoder.decode(b"", final=True)
+        self.pos = 0
+        self.exhausted = True
+        return False
+
+    def skip_whitespaces(self):
+        while True:
+            buffer, pos = self.buffer, self.pos
+            while pos < len(buffer) and buffer[pos] in _WHITESPACES:
+                pos += 1
+            self.pos = pos
+            if pos < len(buffer) or not self.read_more():
+                return
+
+    def next_char(self):
+        self.skip_whitespaces()
+        if self.pos >= len(self.buffer):
+            raise ValueError("Unexpected end of the JSON document")
+        char = self.buffer[self.pos]
+        self.pos += 1
+        return char
+
+    def peek_char(self):
+        self.skip_whitespaces()
+        if self.pos >= len(self.buffer):
+            raise ValueError("Unexpected end of the JSON document")
+        return self.buffer[self.pos]
+
+    def next_value(self):
+        self.skip_whitespaces()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of the buffer may be continued in the next chunk
+                if end < len(self.buffer) or self.exhausted:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self.read_more()
+
+
+def iter_array_items(chunks, field_name: str = "founds", encoding: str = "utf-8"):
+    """Parses a JSON object incrementally from an iterable of byte (or str) chunks and
+    yields the items of its top-level `field_name` array one by one, without
+    decoding the whole document at once.
+
+    When the document is not an object containing that array, the document itself
+    is yielded as the only item, the same way `ResponseWrapper._get_list_of_items`
+    does.
+    """
+    reader = _ChunkReader(chunks, encoding=encoding)
+    if reader.peek_char() != "{":
+        yield reader.next_value()
+        return
+    reader.next_char()
+    others = dict()
+    if reader.peek_char() == "}":
+        yield others
+        return
+    while True:
+        key = reader.next_value()
+        if reader.next_char() != ":":
+            raise ValueError("Invalid JSON document: ':' expected")
+        if key == field_name and reader.peek_char() == "[":
+            reader.next_char()
+            if reader.peek_char() == "]":
+                return
+            while True:
+                yield reader.next_value()
+                separator = reader.next_char()
+                if separator == "]":
+                    return
+                if separator != ",":
+                    raise ValueError("Invalid JSON document: ',' or ']' expected")
+        others[key] = reader.next_value()
+        separator = reader.next_char()
+        if separator == "}":
+            yield others
+            return
+        if separator != ",":
+            raise ValueError("Invalid JSON document: ',' or '}' expected")
+
+
+_MISSING = object()
+# everything up to the next bracket which is not inside a string
+_NON_STRUCTURAL = re.compile(r'[^"\[\]{}]*(?:"(?:[^"\\]|\\.)*"[^"\[\]{}]*)*')
+_SPACES = re.compile(r'[ \t\n\r]*')
+_OBJECT_START = re.compile(r'[ \t\n\r]*\{')
+
+def _skip_value(text: str, pos: int) -> int:
+    """Returns the end position of the JSON value starting at `pos`, without
+    materializing the nested arrays and objects of that value.
+    """
+    char = text[pos]
+    if char == '"':
+        return scanstring(text, pos + 1)[1]
+    if char not in "[{":
+        return _decoder.raw_decode(text, pos)[1]
+    depth = 0
+    while True:
+        pos = _NON_STRUCTURAL.match(text, pos).end()
+        char = text[pos:pos + 1]
+        if char == "[" or char == "{":
+            depth += 1
+        elif char == "]" or char == "}":
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        else:
+            raise ValueError("Unexpected end of the JSON document")
+        pos += 1
+
+
+def is_json_object(text: str) -> bool:
+    """Returns whether a JSON document is an object, from its first character."""
+    return _OBJECT_START.match(text) is not None
+
+
+def get_top_level_field(text: str, field_name: str, default = _MISSING):
+    """Extracts the value of a top-level field of a JSON object document, decoding
+    only that value and skipping over the other ones. It keeps the memory usage low
+    on large documents, at the price of being slower than a full `json.loads`.
+    Raises KeyError when the field is not found and no default is given.
+    """
+    pos = _SPACES.match(text, 0).end()
+    if text[pos:pos + 1] != "{":
+        raise ValueError("The JSON document is not an object")
+    pos = _SPACES.match(text, pos + 1).end()
+    while text[pos:pos + 1] == '"':
+        key, pos = scanstring(text, pos + 1)
+        pos = _SPACES.match(text, pos).end()
+        if text[pos:pos + 1] != ":":
+            raise ValueError("Invalid JSON document: ':' expected")
+        pos = _SPACES.match(text, pos + 1).end()
+        if key == field_name:
+            return _decoder.raw_decode(text, pos)[0]
+        pos = _SPACES.match(text, _skip_value(text, pos)).end()
+        if text[pos:pos + 1] != ",":
+            break
+        pos = _SPACES.match(text, pos + 1).end()
+    if default is _MISSING:
+        raise KeyError(field_name)
+    return default
@@ -0,0 +1,404 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+import threading
+import time
+import urllib.parse
+
+from ._invokers import _extract_base_url
+
+class TokenBucket:
+    """A token bucket refilled with `rate` tokens per second, holding at most `burst`
+    tokens. A request reserves a token at once and waits for the returned delay,
+    so that the waiting requests are served in order, in threads and tasks alike.
+    """
+
+    def __init__(self, rate: float, burst: float|None = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the delay (in seconds) before it is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+class InFlightLimit:
+    """A FIFO semaphore shared by threads and asyncio tasks, allowing at most `limit`
+    requests in flight: a released slot is handed over to the oldest waiter.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _try_acquire(self) -> bool:
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._try_acquire():
+                return
+            event = threading.Event()
+            waiter = _Waiter(event.set)
+            self._waiters.append(waiter)
+        try:
+            event.wait()
+        except BaseException:
+            # e.g. a KeyboardInterrupt: the slot granted meanwhile is handed over
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            future = loop.create_future()
+            waiter = _Waiter(lambda: loop.call_soon_threadsafe(_set_result, future))
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._active -= 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        waiter.wake()
+
+
+class LimitRule:
+    """The limits applied to the requests matching a `base_url` (scheme, host and
+    port), a `path_prefix` and an account `profile` (any of them when None):
+    at most `rate` requests per second (with bursts of `burst` requests) and
+    at most `max_in_flight` concurrent requests. With `per_profile`, every
+    account profile gets its own limits (e.g. for the per-token quotas).
+    """
+
+    def __init__(self, rate: float|None = None, burst: float|None = None, max_in_flight: int|None = None,
+            base_url: str|None = None, path_prefix: str|None = None, profile: str|None = None,
+            per_profile: bool = False):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.base_url = _extract_base_url(base_url) if base_url else None
+        self.path_prefix = path_prefix
+        self.profile = profile
+        self.per_profile = per_profile
+        self._states = dict()
+        self._lock = threading.Lock()
+
+    def matches(self, base_url, path, scope) -> bool:
+        return ((self.base_url is None or self.base_url == base_url)
+                and (self.path_prefix is None or path.startswith(self.path_prefix))
+                and (self.profile is None or self.profile == scope))
+
+    def state_of(self, scope) -> "_LimitState":
+        key = scope if self.per_profile else None
+        state = self._states.get(key)
+        if state is None:
+            with self._lock:
+                state = self._states.get(key)
+                if state is None:
+                    state = self._states[key] = _LimitState(self, key)
+        return state
+
+    def __repr__(self):
+        return (f"LimitRule(rate={ self.rate }, max_in_flight={ self.max_in_flight },"
+                f" base_url={ self.base_url }, path_prefix={ self.path_prefix }, profile={ self.profile })")
+
+
+class _LimitState:
+    __slots__ = ("rule", "scope", "bucket", "in_flight", "sleeping", "acquired", "waited", "wait_time",
+            "max_wait", "_lock")
+
+    def __init__(self, rule, scope):
+        self.rule = rule
+        self.scope = scope
+        self.bucket = TokenBucket(rule.rate, rule.burst) if rule.rate else None
+        self.in_flight = InFlightLimit(rule.max_in_flight) if rule.max_in_flight else None
+        self.sleeping = 0
+        self.acquired = 0
+        self.waited = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def add_sleeping(self, increment):
+        with self._lock:
+            self.sleeping += increment
+
+    def record(self, wait_time):
+        with self._lock:
+            self.acquired += 1
+            if wait_time > 0.0005:
+                self.waited += 1
+                self.wait_time += wait_time
+                self.max_wait = max(self.max_wait, wait_time)
+
+    def snapshot(self) -> dict:
+        return dict(rule=self.rule, scope=self.scope,
+                queued=self.sleeping + (self.in_flight.waiting if self.in_flight else 0),
+                in_flight=self.in_flight.active if self.in_flight else None,
+                acquired=self.acquired, waited=self.waited, wait_time=self.wait_time,
+                mean_wait=self.wait_time / self.waited if self.waited else 0.0,
+                max_wait=self.max_wait)
+
+
+class RateLimiter:
+    """A set of LimitRules applied to the requests of Curli (see `Curli.with_limits()`).
+    A request waits for every rule it matches, in the order of the rules.
+    The `stats()` expose the current queue depth and the wait times of each rule
+    (and profile).
+    """
+
+    def __init__(self):
+        self._rules = []
+
+    @property
+    def rules(self):
+        return list(self._rules)
+
+    def limit(self, rate: float|None = None, burst: float|None = None, max_in_flight: int|None = None,
+            base_url: str|None = None, path_prefix: str|None = None, profile: str|None = None,
+            per_profile: bool = False) -> LimitRule:
+        """Adds a LimitRule (see its arguments) and returns it."""
+        rule = LimitRule(rate=rate, burst=burst, max_in_flight=max_in_flight, base_url=base_url,
+                path_prefix=path_prefix, profile=profile, per_profile=per_profile)
+        self._rules = self._rules + [rule]
+        return rule
+
+    def states_of(self, url, scope = None) -> list:
+        rules = self._rules
+        if not rules:
+            return []
+        url = str(url)
+        base_url, path = _extract_base_url(url), urllib.parse.urlsplit(url).path
+        return [rule.state_of(scope) for rule in rules if rule.matches(base_url, path, scope)]
+
+    def _reserve(self, states):
+        """Reserves a token of every rate limit, returns the delay and the states waiting
+        for their tokens. The waits are concurrent, so the delay is the longest one.
+        """
+        delay, sleeping = 0.0, []
+        for state in states:
+            if state.bucket is not None:
+                state_delay = state.bucket.reserve()
+                if state_delay > 0:
+                    delay = max(delay, state_delay)
+                    sleeping.append(state)
+        return delay, sleeping
+
+    def acquire(self, url, scope = None) -> list:
+        """Waits (blocking) until the request may be sent, returns the states to release.
+        The tokens are taken before the in-flight slots, so that no slot is held
+        while waiting for a token.
+        """
+        states = self.states_of(url, scope)
+        if not states:
+            return states
+        started = time.monotonic()
+        delay, sleeping = self._reserve(states)
+        if delay > 0:
+            _add_sleeping(sleeping, 1)
+            try:
+                time.sleep(delay)
+            finally:
+                _add_sleeping(sleeping, -1)
+        acquired = []
+        try:
+            for state in states:
+                if state.in_flight is not None:
+                    state.in_flight.acquire()
+                acquired.append(state)
+                state.record(time.monotonic() - started)
+        except BaseException:
+            self.release(acquired)
+            raise
+        return acquired
+
+    async def aacquire(self, url, scope = None) -> list:
+        """The asynchronous variant of `acquire()`, the event loop is never blocked."""
+        states = self.states_of(url, scope)
+        if not states:
+            return states
+        started = time.monotonic()
+        delay, sleeping = self._reserve(states)
+        if delay > 0:
+            _add_sleeping(sleeping, 1)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                _add_sleeping(sleeping, -1)
+        acquired = []
+        try:
+            for state in states:
+                if state.in_flight is not None:
+                    await state.in_flight.aacquire()
+                acquired.append(state)
+                state.record(time.monotonic() - started)
+        except BaseException:
+            self.release(acquired)
+            raise
+        return acquired
+
+    def release(self, states):
+        for state in reversed(states):
+            if state.in_flight is not None:
+                state.in_flight.release()
+
+    def stats(self) -> list:
+        return [state.snapshot() for rule in self._rules for state in list(rule._states.values())]
+
+
+class ThrottlingInvoker:
+    """Wraps an invoker of Curli with a RateLimiter: every request waits for the rate
+    and concurrency limits it matches before being sent, and a streamed request
+    holds them until the end of its stream.
+    """
+
+    def __init__(self, invoker, limiter: RateLimiter, scope_of = None):
+        self._invoker = invoker
+        self._limiter = limiter
+        self._scope_of = scope_of
+
+    @property
+    def invoker(self):
+        return self._invoker
+
+    @property
+    def limiter(self):
+        return self._limiter
+
+    def _throttled_call(self, url, call):
+        scope = self._scope_of() if self._scope_of is not None else None
+        states = self._limiter.acquire(url, scope)
+        try:
+            return call()
+        finally:
+            self._limiter.release(states)
+
+    def request(self, method, url, *args, **kwargs):
+        return self._throttled_call(url, lambda: self._invoker.request(method, url, *args, **kwargs))
+
+    def get(self, url, *args, **kwargs):
+        return self._throttled_call(url, lambda: self._invoker.get(url, *args, **kwargs))
+
+    def head(self, url, *args, **kwargs):
+        return self._throttled_call(url, lambda: self._invoker.head(url, *args, **kwargs))
+
+    def options(self, url, *args, **kwargs):
+        return self._throttled_call(url, lambda: self._invoker.options(url, *args, **kwargs))
+
+    def post(self, url, *args, **kwargs):
+        return self._throttled_call(url, lambda: self._invoker.post(url, *args, **kwargs))
+
+    def put(self, url, *args, **kwargs):
+        return self._throttled_call(url, lambda: self._invoker.put(url, *args, **kwargs))
+
+    def patch(self, url, *args, **kwargs):
+        return self._throttled_call(url, lambda: self._invoker.patch(url, *args, **kwargs))
+
+    def delete(self, url, *args, **kwargs):
+        return self._throttled_call(url, lambda: self._invoker.delete(url, *args, **kwargs))
+
+    @contextmanager
+    def stream(self, method, url, *args, **kwargs):
+        """Streams a response once the limits are acquired, they are held until the end
+        of the stream block (an in-flight slot is taken while the body is read).
+        """
+        scope = self._scope_of() if self._scope_of is not None else None
+        states = self._limiter.acquire(url, scope)
+        try:
+            with self._invoker.stream(method, url, *args, **kwargs) as response:
+                yield response
+        finally:
+            self._limiter.release(states)
+
+    def close(self):
+        close = getattr(self._invoker, "close", None)
+        if callable(close):
+            close()
+
+
+class AsyncThrottlingInvoker(ThrottlingInvoker):
+    """The asynchronous variant of ThrottlingInvoker, wrapping an asynchronous invoker."""
+
+    async def _throttled_call(self, url, call):
+        scope = self._scope_of() if self._scope_of is not None else None
+        states = await self._limiter.aacquire(url, scope)
+        try:
+            return await call()
+        finally:
+            self._limiter.release(states)
+
+    @asynccontextmanager
+    async def stream(self, method, url, *args, **kwargs):
+        scope = self._scope_of() if self._scope_of is not None else None
+        states = await self._limiter.aacquire(url, scope)
+        try:
+            async with self._invoker.stream(method, url, *args, **kwargs) as response:
+                yield response
+        finally:
+            self._limiter.release(states)
+
+    def close(self):
+        raise RuntimeError("AsyncThrottlingInvoker must be closed with 'await invoker.aclose()'")
+
+    async def aclose(self):
+        aclose = getattr(self._invoker, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
+
+def _add_sleeping(states, increment):
+    for state in states:
+        state.add_sleeping(increment)
+
+
+def _set_result(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,399 @@
+import asyncio
+import inspect
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import httpx
+
+from ._agent import Agent
+from ._async_agent import AsyncAgent
+from ._async_curli import AsyncCurli
+from ._curli import Curli
+from ._instrument import Instrumentation, LatencyAggregator, _percentiles
+from ._invokers import AsyncPooledInvoker, PooledInvoker
+from ._limits import TokenBucket
+from ._store import Store
+
+DEFAULT_HEADERS = {
+    "accept": "application/json",
+    "Content-Type": "application/json",
+}
+
+# upper bounds (in seconds) of the buckets of the latency histograms
+HISTOGRAM_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, float("inf"))
+LOAD_MODES = frozenset(["closed", "open"])
+
+class VirtualUser:
+    """A virtual user of a load test, with its own account and session stores.
+
+    Properties:
+    - `index`: The index of the virtual user, unique across the worker processes.
+    - `curli`, `agent`: The Curli/Agent (or AsyncCurli/AsyncAgent) objects of the
+        virtual user, sharing the connection pool of the worker process.
+    - `data`: A dict the scenario can use to keep state between its iterations.
+    """
+
+    __slots__ = ("index", "curli", "agent", "data")
+
+    def __init__(self, index, curli, agent):
+        self.index = index
+        self.curli = curli
+        self.agent = agent
+        self.data = dict()
+
+
+class LoadReport:
+    """The result of a load test: the throughput, the error rates and the latency
+    percentiles and histograms, in total and per endpoint (latencies in seconds).
+    """
+
+    def __init__(self, snapshots, elapsed):
+        self.elapsed = elapsed
+        self.iterations = sum(snapshot["iterations"] for snapshot in snapshots)
+        self.failed_iterations = sum(snapshot["failed_iterations"] for snapshot in snapshots)
+        self.dropped_iterations = sum(snapshot["dropped_iterations"] for snapshot in snapshots)
+        self.failures = dict()
+        endpoints = dict()
+        for snapshot in snapshots:
+            for name, count in snapshot["failures"].items():
+                self.failures[name] = self.failures.get(name, 0) + count
+            for endpoint, series in snapshot["endpoints"].items():
+                merged = endpoints.setdefault(endpoint, dict(count=0, errors=0, total=[]))
+                merged["count"] += series["count"]
+                merged["errors"] += series["errors"]
+                merged["total"].extend(series["total"])
+        self.endpoints = {endpoint: self._summarize(series) for endpoint, series in endpoints.items()}
+        self.requests = sum(series["count"] for series in endpoints.values())
+        self.errors = sum(series["errors"] for series in endpoints.values())
+
+    def _summarize(self, series):
+        samples = series["total"]
+        histogram = [0] * len(HISTOGRAM_BUCKETS)
+        for latency in samples:
+            for index, bound in enumerate(HISTOGRAM_BUCKETS):
+                if latency <= bound:
+                    histogram[index] += 1
+                    break
+        return dict(count=series["count"], errors=series["errors"],
+                error_rate=series["errors"] / series["count"] if series["count"] else 0.0,
+                throughput=series["count"] / self.elapsed if self.elapsed else 0.0,
+                mean=sum(samples) / len(samples) if samples else None,
+                max=max(samples) if samples else None,
+                **_percentiles(samples),
+                histogram=dict(zip(HISTOGRAM_BUCKETS, histogram)))
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def to_dict(self) -> dict:
+        return dict(elapsed=self.elapsed, iterations=self.iterations,
+                failed_iterations=self.failed_iterations, dropped_iterations=self.dropped_iterations,
+                failures=dict(self.failures), requests=self.requests, errors=self.errors,
+                throughput=self.throughput, error_rate=self.error_rate,
+                endpoints=dict(self.endpoints))
+
+    def print(self):
+        print(f"{ self.requests } requests in { self.elapsed:.2f}s: { self.throughput:.1f} req/s, "
+                f"error rate { self.error_rate:.2%}, iterations { self.iterations } "
+                f"(failed { self.failed_iterations }, dropped { self.dropped_iterations })")
+        for endpoint, stats in sorted(self.endpoints.items()):
+            print(f"  { endpoint }: { stats['count'] } requests, { stats['throughput']:.1f} req/s, "
+                    f"errors { stats['error_rate']:.2%}, p50 { _ms(stats['p50']) }, "
+                    f"p95 { _ms(stats['p95']) }, p99 { _ms(stats['p99']) }")
+        for name, count in sorted(self.failures.items()):
+            print(f"  failure { name }: { count }")
+
+
+class LoadRunner:
+    """Runs a scenario across virtual users to generate load on an API.
+
+    The scenario is a callable receiving a VirtualUser, which uses its `curli`
+    and `agent` to script a user flow (login, call APIs, refresh, logout). A
+    coroutine function is run on asyncio with AsyncCurli/AsyncAgent, otherwise
+    every virtual user runs on a thread with Curli/Agent.
+
+    - Closed-loop (`mode="closed"`, the default without `rps`): every virtual user
+      runs the scenario back to back. With `rps`, the iterations are paced by a
+      token bucket shared by the virtual users, so that they start at most at the
+      target rate (a slow backend lowers the rate instead of queueing work).
+    - Open-loop (`mode="open"`, the default with `rps`): the iterations start at
+      the target rate, on the free virtual users; when none is free, the
+      iteration is dropped.
+
+    The test stops after `duration` seconds or when `iterations` iterations
+    have started. With `processes` > 1, the virtual users (and the rate) are
+    split across worker processes, then the scenario and the invoker arguments
+    must be picklable. The `invoker_kwargs` are passed to the pooled invoker,
+    e.g. `transport=httpx.ASGITransport(app)` to test a local ASGI app with a
+    coroutine scenario, or `transport=httpx.WSGITransport(app)` (or an
+    `httpx.MockTransport`) with a synchronous one: a transport which does not
+    fit the scenario raises a TypeError.
+    """
+
+    def __init__(self, scenario, users: int = 10, duration: float|None = 10.0,
+            iterations: int|None = None, rps: float|None = None, processes: int = 1,
+            base_url: str|None = None, headers: dict|None = None,
+            invoker_kwargs: dict|None = None, max_samples: int = 100000, mode: str|None = None):
+        if duration is None and iterations is None:
+            raise ValueError("Either duration or iterations must be given")
+        if mode is None:
+            mode = "closed" if rps is None else "open"
+        if mode not in LOAD_MODES:
+            raise ValueError(f"The mode must be one of { sorted(LOAD_MODES) }")
+        if mode == "open" and not rps:
+            raise ValueError("The open-loop mode requires a target rps")
+        _check_transport(scenario, (invoker_kwargs or {}).get("transport"))
+        self.scenario = scenario
+        self.users = users
+        self.duration = duration
+        self.iterations = iterations
+        self.rps = rps
+        self.mode = mode
+        self.processes = max(1, min(processes, users))
+        self.base_url = base_url
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.invoker_kwargs = dict(invoker_kwargs or {})
+        self.max_samples = max_samples
+
+    def _worker_configs(self):
+        configs = []
+        first = 0
+        for worker in range(self.processes):
+            users = self.users // self.processes + (1 if worker < self.users % self.processes else 0)
+            share = users / self.users
+            configs.append(dict(scenario=self.scenario, first=first, users=users,
+                    duration=self.duration,
+                    iterations=None if self.iterations is None else max(1, round(self.iterations * share)),
+                    rps=None if self.rps is None else self.rps * share, mode=self.mode,
+                    base_url=self.base_url, headers=self.headers,
+                    invoker_kwargs=self.invoker_kwargs, max_samples=self.max_samples))
+            first += users
+        return configs
+
+    def run(self) -> LoadReport:
+        configs = self._worker_configs()
+        started = time.perf_counter()
+        if len(configs) == 1:
+            snapshots = [_run_worker(configs[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=len(configs)) as executor:
+                snapshots = list(executor.map(_run_worker, configs))
+        return LoadReport(snapshots, time.perf_counter() - started)
+
+
+class _Counters:
+    def __init__(self, iterations):
+        self.remaining = iterations
+        self.iterations = 0
+        self.failed_iterations = 0
+        self.dropped_iterations = 0
+        self.failures = dict()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.remaining is not None:
+                if self.remaining <= 0:
+                    return False
+                self.remaining -= 1
+            self.iterations += 1
+            return True
+
+    def fail(self, error):
+        with self._lock:
+            self.failed_iterations += 1
+            name = type(error).__name__
+            self.failures[name] = self.failures.get(name, 0) + 1
+
+    def drop(self):
+        with self._lock:
+            self.dropped_iterations += 1
+
+    def snapshot(self, aggregator):
+        return dict(iterations=self.iterations, failed_iterations=self.failed_iterations,
+                dropped_iterations=self.dropped_iterations, failures=dict(self.failures),
+                endpoints=aggregator.snapshot())
+
+
+def _build_users(config, instrumentation, is_async):
+    users = max(1, config["users"])
+    if is_async:
+        invoker = AsyncPooledInvoker(max_connections=None, max_keepalive_connections=users,
+                **config["invoker_kwargs"])
+        curli_class, agent_class = AsyncCurli, AsyncAgent
+    else:
+        invoker = PooledInvoker(max_connections=None, max_keepalive_connections=users,
+                **config["invoker_kwargs"])
+        curli_class, agent_class = Curli, Agent
+    virtual_users = []
+    for index in range(config["first"], config["first"] + config["users"]):
+        profile = f"vu{ index }"
+        curli = curli_class(invoker, session_store=Store(profile=profile), account_store=Store(profile=profile))
+        curli.default(headers=config["headers"])
+        if config["base_url"]:
+            curli.in_session(base_url=config["base_url"])
+        curli.instrumentation = instrumentation
+        virtual_users.append(VirtualUser(index, curli, agent_class(curli)))
+    return invoker, virtual_users
+
+
+def _run_worker(config) -> dict:
+    aggregator = LatencyAggregator(max_samples=config["max_samples"])
+    instrumentation = Instrumentation(aggregator=aggregator, trace=False)
+    counters = _Counters(config["iterations"])
+    if inspect.iscoroutinefunction(config["scenario"]):
+        asyncio.run(_run_async_worker(config, instrumentation, counters))
+    else:
+        _run_sync_worker(config, instrumentation, counters)
+    return counters.snapshot(aggregator)
+
+
+def _deadline_of(config):
+    return None if config["duration"] is None else time.perf_counter() + config["duration"]
+
+
+def _run_sync_worker(config, instrumentation, counters):
+    invoker, virtual_users = _build_users(config, instrumentation, is_async=False)
+    scenario, deadline = config["scenario"], _deadline_of(config)
+
+    def _iterate(user):
+        try:
+            scenario(user)
+        except Exception as error:
+            counters.fail(error)
+
+    def _is_running():
+        return deadline is None or time.perf_counter() < deadline
+
+    try:
+        if config["mode"] == "closed":
+            pacer = TokenBucket(config["rps"], burst=1) if config["rps"] else None
+
+            def _pace():
+                if pacer is not None:
+                    delay = pacer.reserve()
+                    if delay > 0:
+                        time.sleep(delay)
+                return _is_running()
+
+            def _loop(user):
+                while _pace() and counters.acquire():
+                    _iterate(user)
+            threads = [threading.Thread(target=_loop, args=(user,), daemon=True) for user in virtual_users]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            free_users = list(virtual_users)
+            lock = threading.Lock()
+
+            def _run(user):
+                try:
+                    _iterate(user)
+                finally:
+                    with lock:
+                        free_users.append(user)
+
+            interval = 1.0 / config["rps"]
+            next_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(virtual_users)) as executor:
+                while _is_running():
+                    delay = next_start - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_start += interval
+                    with lock:
+                        user = free_users.pop() if free_users else None
+                    if user is None:
+                        counters.drop()
+                        continue
+                    if not counters.acquire():
+                        break
+                    executor.submit(_run, user)
+    finally:
+        invoker.close()
+
+
+async def _run_async_worker(config, instrumentation, counters):
+    invoker, virtual_users = _build_users(config, instrumentation, is_async=True)
+    scenario, deadline = config["scenario"], _deadline_of(config)
+
+    async def _iterate(user):
+        try:
+            await scenario(user)
+        except Exception as error:
+            counters.fail(error)
+
+    def _is_running():
+        return deadline is None or time.perf_counter() < deadline
+
+    try:
+        if config["mode"] == "closed":
+            pacer = TokenBucket(config["rps"], burst=1) if config["rps"] else None
+
+            async def _pace():
+                if pacer is not None:
+                    delay = pacer.reserve()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                return _is_running()
+
+            async def _loop(user):
+                while await _pace() and counters.acquire():
+                    await _iterate(user)
+                    # let the other virtual users run, even when the transport never suspends
+                    await asyncio.sleep(0)
+            await asyncio.gather(*[_loop(user) for user in virtual_users])
+        else:
+            free_users = list(virtual_users)
+            tasks = set()
+
+            async def _run(user):
+                try:
+                    await _iterate(user)
+                finally:
+                    free_users.append(user)
+
+            interval = 1.0 / config["rps"]
+            next_start = time.perf_counter()
+            while _is_running():
+                delay = next_start - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_start += interval
+                if not free_users:
+                    counters.drop()
+                    continue
+                if not counters.acquire():
+                    break
+                task = asyncio.ensure_future(_run(free_users.pop()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+    finally:
+        await invoker.aclose()
+
+
+def _check_transport(scenario, transport):
+    if transport is None:
+        return
+    if inspect.iscoroutinefunction(scenario):
+        if not isinstance(transport, httpx.AsyncBaseTransport):
+            raise TypeError("A coroutine scenario requires an asynchronous transport"
+                    " (e.g. httpx.ASGITransport or httpx.MockTransport)")
+    elif not isinstance(transport, httpx.BaseTransport):
+        raise TypeError("A synchronous scenario requires a synchronous transport"
+                " (e.g. httpx.WSGITransport or httpx.MockTransport), use a coroutine scenario"
+                " with httpx.ASGITransport")
+
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{ value * 1000:.1f}ms"
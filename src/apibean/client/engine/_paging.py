@@ -0,0 +1,69 @@
+import itertools
+
+class Pagination:
+    """The paging parameters of a list endpoint, shared by `Curli.paginate()` and
+    `AsyncCurli.paginate()`.
+
+    The pages are requested with `page_param` (the page number, from
+    `first_page`) or with `offset_param` (the index of the first item) when
+    given, and with `size_param` set to `page_size`. The items are read from
+    the `field_name` array of each page.
+
+    An empty page is the last one, and so is a page shorter than `page_size` and
+    than the longest page so far: a server capping the size of its pages below
+    `page_size` is walked until its first short (or empty) page. A page holding
+    the same items as the previous one (a server ignoring the paging
+    parameters) ends the walk too, without its items.
+    """
+
+    __slots__ = ("params", "field_name", "page_size", "page_param", "size_param", "first_page",
+            "offset_param", "max_pages", "_previous", "_longest")
+
+    def __init__(self, params = None, field_name: str = "founds", page_size: int = 100,
+            page_param: str = "page", size_param: str|None = "size", first_page: int = 1,
+            offset_param: str|None = None, max_pages: int|None = None):
+        self.params = dict(params or {})
+        self.field_name = field_name
+        self.page_size = page_size
+        self.page_param = page_param
+        self.size_param = size_param
+        self.first_page = first_page
+        self.offset_param = offset_param
+        self.max_pages = max_pages
+        self._previous = None
+        self._longest = 0
+
+    def numbers(self):
+        if self.max_pages is None:
+            return itertools.count(self.first_page)
+        return iter(range(self.first_page, self.first_page + self.max_pages))
+
+    def params_of(self, number) -> dict:
+        params = dict(self.params)
+        if self.offset_param:
+            params[self.offset_param] = (number - self.first_page) * self.page_size
+        else:
+            params[self.page_param] = number
+        if self.size_param:
+            params[self.size_param] = self.page_size
+        return params
+
+    def items_of(self, number, page) -> list:
+        if not page.is_success:
+            raise RuntimeError(f"The page { number } of { page.request.url } has failed"
+                    f" with status { page.status_code }")
+        # the whole page is decoded: its items are all read anyway
+        body = page.json()
+        items = body.get(self.field_name) if isinstance(body, dict) else None
+        return items if isinstance(items, list) else []
+
+    def is_repeated(self, items) -> bool:
+        """Tells whether the page holds the same (non-empty) items as the previous one."""
+        repeated = bool(items) and items == self._previous
+        self._previous = items
+        return repeated
+
+    def is_last(self, items) -> bool:
+        size, longest = len(items), self._longest
+        self._longest = max(longest, size)
+        return size == 0 or (size < self.page_size and size < longest)
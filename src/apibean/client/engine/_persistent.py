@@ -0,0 +1,170 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from ._store import Store
+
+class PersistentStore(Store):
+    """A Store whose profiles are persisted into a local SQLite file, so that many
+    processes can share the same accounts (tokens, expiration) and the captured
+    `*_ids_of` maps instead of logging in again.
+
+    - The profiles are loaded lazily, on the first access of each profile.
+    - Every change is written through to the file, unless it is made inside a
+      `with store.batched():` block, then the changed profiles are written once
+      at the end of the block.
+    - SQLite locks the file on writes, so the processes can read and write it
+      concurrently. Only the keys changed since the profile was loaded (or last
+      written) are merged into the saved profile, so that two processes changing
+      different keys of the same profile keep both changes; the last writer wins
+      on the same key. Use `reload()` to pick up the changes made by the other
+      processes.
+    - The default values are not persisted, and the values must be JSON
+      serializable.
+
+    Properties:
+    - `path`: The path of the SQLite file.
+    - `namespace`: Separates the stores sharing the same file (e.g. "account"
+        and "session").
+    """
+
+    __slots__ = ("_path", "_namespace", "_connection", "_lock", "_dirty", "_batch_depth", "_saved")
+
+    def __init__(self, path, profile="main", namespace="main", timeout: float = 30.0):
+        super().__init__(profile=None)
+        self._path = str(path)
+        self._namespace = namespace
+        self._lock = threading.RLock()
+        self._dirty = set()
+        self._batch_depth = 0
+        # the last loaded or written values of each profile, to find the changed keys
+        self._saved = dict()
+        self._connection = sqlite3.connect(self._path, timeout=timeout, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                "namespace TEXT NOT NULL, profile TEXT NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, profile))")
+        self._profile = profile
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def namespace(self):
+        return self._namespace
+
+    @property
+    def profiles(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT profile FROM profiles WHERE namespace = ?", (self._namespace,)).fetchall()
+        profiles = [row[0] for row in rows]
+        return profiles + [profile for profile in self._storage.keys() if profile not in profiles]
+
+    def _load(self, profile):
+        with self._lock:
+            data = self._select(profile)
+            self._saved[profile] = json.loads(data) if data else dict()
+        return json.loads(data) if data else dict()
+
+    def _select(self, profile):
+        row = self._connection.execute(
+                "SELECT data FROM profiles WHERE namespace = ? AND profile = ?",
+                (self._namespace, str(profile))).fetchone()
+        return row[0] if row else None
+
+    def _get_storage_of_profile(self):
+        profile = self.profile
+        storage = self._storage.get(profile)
+        if storage is None:
+            storage = self._storage[profile] = self._load(profile)
+        return storage
+
+    def reload(self, profile = None):
+        """Drops the loaded storage of the given profile (or of all of the profiles),
+        so that it is read again from the file on the next access.
+        """
+        with self._lock:
+            self.flush()
+            profiles = list(self._storage.keys()) if profile is None else [profile]
+            for name in profiles:
+                self._storage.pop(name, None)
+                self._saved.pop(name, None)
+        for name in profiles:
+            super()._changed(name)
+
+    def _changed(self, profile):
+        super()._changed(profile)
+        if profile is None:
+            return
+        with self._lock:
+            self._dirty.add(profile)
+            if self._batch_depth == 0:
+                self.flush()
+
+    @contextmanager
+    def batched(self):
+        """Defers writing the changed profiles to the end of the block."""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            profiles = [profile for profile in self._dirty if profile in self._storage]
+            self._dirty = set()
+            with self._connection:
+                # the saved profiles are read and written back under the write lock of the file
+                self._connection.execute("BEGIN IMMEDIATE")
+                for profile in profiles:
+                    self._merge(profile)
+
+    def _merge(self, profile):
+        """Writes the keys of a profile changed since it was loaded (or last written) into
+        the saved profile, keeping the other keys written by the other processes.
+        """
+        storage, saved = self._storage[profile], self._saved.get(profile, dict())
+        data = self._select(profile)
+        data = json.loads(data) if data else dict()
+        for key in saved.keys() - storage.keys():
+            data.pop(key, None)
+        data.update((key, value) for key, value in storage.items() if key not in saved or saved[key] != value)
+        self._connection.execute(
+                "INSERT OR REPLACE INTO profiles (namespace, profile, data) VALUES (?, ?, ?)",
+                (self._namespace, str(profile), json.dumps(data)))
+        self._saved[profile] = json.loads(json.dumps(storage))
+
+    def reset(self):
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                super().reset()
+            finally:
+                self._batch_depth -= 1
+            self._dirty = set()
+            self._saved = dict()
+            with self._connection:
+                self._connection.execute("DELETE FROM profiles WHERE namespace = ?", (self._namespace,))
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,324 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from ._invokers import _extract_base_url
+from ._utils import get_now
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"])
+HK_IDEMPOTENCY_KEY = 'Idempotency-Key'.lower()
+
+class CircuitOpenError(RuntimeError):
+    """Raised without sending the request while the circuit of a host is open."""
+
+    def __init__(self, host, retry_in: float):
+        super().__init__(f"The circuit of { host } is open, retry in { retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    """Decides whether and when a failed request is sent again.
+
+    - The requests are retried on the transport errors and on the `retry_statuses`
+      responses, at most `max_retries` times.
+    - Only the idempotent methods (or the requests carrying an `Idempotency-Key`
+      header) are retried, except on connection errors where the request has not
+      been sent at all.
+    - The delay grows exponentially from `backoff_base` up to `backoff_max`, with
+      full jitter; the `Retry-After` header of the response takes precedence (up to
+      `max_retry_after` seconds).
+    """
+
+    def __init__(self, max_retries: int = 3,
+            backoff_base: float = 0.1,
+            backoff_max: float = 10.0,
+            jitter: bool = True,
+            retry_statuses = (429, 502, 503, 504),
+            retry_methods = IDEMPOTENT_METHODS,
+            respect_retry_after: bool = True,
+            max_retry_after: float = 60.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_methods = frozenset(method.upper() for method in retry_methods)
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+
+    def is_retryable_method(self, method, headers) -> bool:
+        if method.upper() in self.retry_methods:
+            return True
+        return isinstance(headers, dict) and any(key.lower() == HK_IDEMPOTENCY_KEY for key in headers)
+
+    def should_retry_error(self, method, headers, error, attempt) -> bool:
+        if attempt >= self.max_retries or not isinstance(error, httpx.TransportError):
+            return False
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        return self.is_retryable_method(method, headers)
+
+    def should_retry_response(self, method, headers, response, attempt) -> bool:
+        if attempt >= self.max_retries or response.status_code not in self.retry_statuses:
+            return False
+        return self.is_retryable_method(method, headers)
+
+    def backoff(self, attempt) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def retry_delay(self, response, attempt) -> float:
+        if self.respect_retry_after:
+            retry_after = _parse_retry_after(response.headers.get("retry-after"))
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+        return self.backoff(attempt)
+
+
+class CircuitBreaker:
+    """A circuit breaker per host (scheme + host + port).
+
+    After `failure_threshold` consecutive failures (transport errors or
+    `failure_statuses` responses), the circuit of the host opens and the requests
+    fail fast with CircuitOpenError for `reset_timeout` seconds. Then a single
+    trial request is let through: its success closes the circuit, its failure
+    opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+            failure_statuses = (429, 500, 502, 503, 504)):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_statuses = frozenset(failure_statuses)
+        self._failures = dict()
+        self._opened_at = dict()
+        self._trials = set()
+        self._lock = threading.Lock()
+
+    def state_of(self, host) -> str:
+        opened_at = self._opened_at.get(host)
+        if opened_at is None:
+            return "closed"
+        if time.monotonic() - opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def before_request(self, host):
+        if host not in self._opened_at:
+            return
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            elapsed = time.monotonic() - opened_at
+            if elapsed < self.reset_timeout or host in self._trials:
+                raise CircuitOpenError(host, max(0.0, self.reset_timeout - elapsed))
+            self._trials.add(host)
+
+    def is_failure(self, response) -> bool:
+        return response.status_code in self.failure_statuses
+
+    def record_success(self, host):
+        if self._failures.get(host) or host in self._opened_at:
+            with self._lock:
+                self._failures.pop(host, None)
+                self._opened_at.pop(host, None)
+                self._trials.discard(host)
+
+    def record_failure(self, host):
+        with self._lock:
+            failures = self._failures[host] = self._failures.get(host, 0) + 1
+            if host in self._trials or failures >= self.failure_threshold:
+                self._opened_at[host] = time.monotonic()
+                self._trials.discard(host)
+
+    def release_trial(self, host):
+        """Lets another trial request through, when the trial request of a half-open
+        circuit has been interrupted (e.g. cancelled) without any outcome.
+        """
+        if host in self._trials:
+            with self._lock:
+                self._trials.discard(host)
+
+    def record(self, host, response):
+        if self.is_failure(response):
+            self.record_failure(host)
+        else:
+            self.record_success(host)
+
+
+class RetryingInvoker:
+    """Wraps an invoker of Curli with a RetryPolicy and an optional CircuitBreaker.
+
+    The retried request is sent with the same arguments, so the `X-Request-Id`
+    built by Curli is preserved across the attempts.
+    """
+
+    def __init__(self, invoker, policy: RetryPolicy|None = None, breaker: CircuitBreaker|None = None,
+            sleep = time.sleep):
+        self._invoker = invoker
+        self._policy = policy if policy is not None else RetryPolicy()
+        self._breaker = breaker
+        self._sleep = sleep
+
+    @property
+    def invoker(self):
+        return self._invoker
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def breaker(self):
+        return self._breaker
+
+    def _invoke(self, method, url, kwargs, call):
+        policy, breaker = self._policy, self._breaker
+        headers, replayable = kwargs.get("headers"), _is_replayable(kwargs)
+        host = _extract_base_url(url) if breaker is not None else None
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_request(host)
+            try:
+                response = call()
+            except httpx.TransportError as error:
+                if breaker is not None:
+                    breaker.record_failure(host)
+                if not replayable or not policy.should_retry_error(method, headers, error, attempt):
+                    raise
+                delay = policy.backoff(attempt)
+            except Exception:
+                # any other error (e.g. too many redirects) fails the request and its host
+                if breaker is not None:
+                    breaker.record_failure(host)
+                raise
+            except BaseException:
+                if breaker is not None:
+                    breaker.release_trial(host)
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record(host, response)
+                if not replayable or not policy.should_retry_response(method, headers, response, attempt):
+                    return response
+                delay = policy.retry_delay(response, attempt)
+                response.close()
+            attempt += 1
+            self._sleep(delay)
+
+    def request(self, method, url, *args, **kwargs):
+        return self._invoke(method, url, kwargs,
+                lambda: self._invoker.request(method, url, *args, **kwargs))
+
+    def get(self, url, *args, **kwargs):
+        return self._invoke("GET", url, kwargs,
+                lambda: self._invoker.get(url, *args, **kwargs))
+
+    def head(self, url, *args, **kwargs):
+        return self._invoke("HEAD", url, kwargs,
+                lambda: self._invoker.head(url, *args, **kwargs))
+
+    def options(self, url, *args, **kwargs):
+        return self._invoke("OPTIONS", url, kwargs,
+                lambda: self._invoker.options(url, *args, **kwargs))
+
+    def post(self, url, *args, **kwargs):
+        return self._invoke("POST", url, kwargs,
+                lambda: self._invoker.post(url, *args, **kwargs))
+
+    def put(self, url, *args, **kwargs):
+        return self._invoke("PUT", url, kwargs,
+                lambda: self._invoker.put(url, *args, **kwargs))
+
+    def patch(self, url, *args, **kwargs):
+        return self._invoke("PATCH", url, kwargs,
+                lambda: self._invoker.patch(url, *args, **kwargs))
+
+    def delete(self, url, *args, **kwargs):
+        return self._invoke("DELETE", url, kwargs,
+                lambda: self._invoker.delete(url, *args, **kwargs))
+
+    def stream(self, method, url, *args, **kwargs):
+        return self._invoker.stream(method, url, *args, **kwargs)
+
+    def close(self):
+        close = getattr(self._invoker, "close", None)
+        if callable(close):
+            close()
+
+
+class AsyncRetryingInvoker(RetryingInvoker):
+    """The asynchronous variant of RetryingInvoker, wrapping an asynchronous invoker."""
+
+    def __init__(self, invoker, policy: RetryPolicy|None = None, breaker: CircuitBreaker|None = None,
+            sleep = asyncio.sleep):
+        super().__init__(invoker, policy=policy, breaker=breaker, sleep=sleep)
+
+    async def _invoke(self, method, url, kwargs, call):
+        policy, breaker = self._policy, self._breaker
+        headers, replayable = kwargs.get("headers"), _is_replayable(kwargs)
+        host = _extract_base_url(url) if breaker is not None else None
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_request(host)
+            try:
+                response = await call()
+            except httpx.TransportError as error:
+                if breaker is not None:
+                    breaker.record_failure(host)
+                if not replayable or not policy.should_retry_error(method, headers, error, attempt):
+                    raise
+                delay = policy.backoff(attempt)
+            except Exception:
+                # any other error (e.g. too many redirects) fails the request and its host
+                if breaker is not None:
+                    breaker.record_failure(host)
+                raise
+            except BaseException:
+                if breaker is not None:
+                    breaker.release_trial(host)
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record(host, response)
+                if not replayable or not policy.should_retry_response(method, headers, response, attempt):
+                    return response
+                delay = policy.retry_delay(response, attempt)
+                await response.aclose()
+            attempt += 1
+            await self._sleep(delay)
+
+    def close(self):
+        raise RuntimeError("AsyncRetryingInvoker must be closed with 'await invoker.aclose()'")
+
+    async def aclose(self):
+        aclose = getattr(self._invoker, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
+
+def _is_replayable(kwargs) -> bool:
+    # a request streaming its body from an iterator cannot be sent twice
+    content = kwargs.get("content")
+    return content is None or isinstance(content, (bytes, str))
+
+
+def _parse_retry_after(value) -> float|None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - get_now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
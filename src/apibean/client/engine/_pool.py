@@ -0,0 +1,185 @@
+import asyncio
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ._agent import Agent
+from ._async_agent import AsyncAgent
+from ._async_curli import AsyncCurli
+from ._curli import Curli
+from ._invokers import rescope_invoker
+from ._store import Store
+
+class AccountContext:
+    """The request context bound to one account of an AccountPool: its own Curli and
+    Agent objects over its own account store, so that no profile is switched.
+    """
+
+    __slots__ = ("name", "curli", "agent")
+
+    def __init__(self, name, curli, agent):
+        self.name = name
+        self.curli = curli
+        self.agent = agent
+
+    @property
+    def account(self):
+        return self.curli._account
+
+
+class AccountPool:
+    """A pool of authenticated accounts, driven concurrently from one process.
+
+    Every account gets an AccountContext sharing the invoker (connection pool),
+    the session store and the instrumentation of the given Curli (or AsyncCurli)
+    object, but with its own account store built by `store_factory(name)` (a
+    PersistentStore can be used to share the tokens across processes). The
+    cache, coalescing and limits wrappers of the invoker are rebound to the
+    profile of that account store. The
+    tokens are refreshed `refresh_skew` seconds before they expire, on demand
+    and by the background refresher.
+    """
+
+    def __init__(self, curli: Curli, store_factory = None, refresh_skew: float = 60.0):
+        self._curli = curli
+        self._store_factory = store_factory if store_factory is not None else (lambda name: Store(profile=name))
+        self._refresh_skew = refresh_skew
+        self._contexts = dict()
+        self._cycle = None
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stopping = None
+
+    @property
+    def is_async(self) -> bool:
+        return isinstance(self._curli, AsyncCurli)
+
+    @property
+    def names(self):
+        return list(self._contexts.keys())
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def __contains__(self, name):
+        return name in self._contexts
+
+    def __getitem__(self, name) -> AccountContext:
+        return self._contexts[name]
+
+    def __iter__(self):
+        return iter(list(self._contexts.values()))
+
+    def add(self, name) -> AccountContext:
+        """Returns the context of the given account, creating it if needed."""
+        context = self._contexts.get(name)
+        if context is not None:
+            return context
+        with self._lock:
+            context = self._contexts.get(name)
+            if context is None:
+                curli_class, agent_class = (AsyncCurli, AsyncAgent) if self.is_async else (Curli, Agent)
+                curli = curli_class(self._curli.invoker, session_store=self._curli._session,
+                        account_store=self._store_factory(name))
+                curli.invoker = rescope_invoker(self._curli.invoker, _profile_of(curli._account))
+                curli.instrumentation = self._curli.instrumentation
+                agent = agent_class(curli).enable_auto_refresh(skew=self._refresh_skew)
+                context = self._contexts[name] = AccountContext(name, curli, agent)
+                self._cycle = None
+        return context
+
+    def acquire(self) -> AccountContext:
+        """Returns the contexts of the authenticated accounts in turn (round robin)."""
+        with self._lock:
+            if self._cycle is None:
+                self._cycle = itertools.cycle(list(self._contexts.values()))
+            for _ in range(len(self._contexts)):
+                context = next(self._cycle)
+                if context.agent.is_authenticated():
+                    return context
+        raise RuntimeError("There is no authenticated account in the pool")
+
+    def login_all(self, credentials: dict, concurrency: int = 10, **kwargs) -> dict:
+        """Logs in the accounts concurrently, `credentials` maps the name of each account
+        to the keyword arguments of `Agent.login()` (username, password, ...). Returns
+        the login response (or the raised error) of each account.
+        """
+        results = dict()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {name: executor.submit(self.add(name).agent.login, **dict(kwargs, **params))
+                    for name, params in credentials.items()}
+            for name, future in futures.items():
+                error = future.exception()
+                results[name] = future.result() if error is None else error
+        return results
+
+    async def alogin_all(self, credentials: dict, concurrency: int = 100, **kwargs) -> dict:
+        """The asynchronous variant of `login_all()`, for an AsyncCurli object."""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _login(name, params):
+            async with semaphore:
+                try:
+                    return await self.add(name).agent.login(**dict(kwargs, **params))
+                except Exception as error:
+                    return error
+
+        names = list(credentials.keys())
+        responses = await asyncio.gather(*[_login(name, credentials[name]) for name in names])
+        return dict(zip(names, responses))
+
+    def refresh_expiring(self) -> int:
+        """Refreshes the tokens of the accounts about to expire, returns their number.
+        A failed refresh is skipped, it is retried on the next call or on demand.
+        """
+        refreshed = 0
+        for context in self:
+            try:
+                if context.curli.token_keeper.ensure_fresh() is not None:
+                    refreshed += 1
+            except Exception:
+                pass
+        return refreshed
+
+    async def arefresh_expiring(self) -> int:
+        responses = await asyncio.gather(*[context.curli.token_keeper.aensure_fresh() for context in self],
+                return_exceptions=True)
+        return len([response for response in responses if response is not None
+                and not isinstance(response, Exception)])
+
+    def start_refresher(self, interval: float = 10.0):
+        """Refreshes the expiring tokens every `interval` seconds in the background, on
+        a daemon thread (or on an asyncio task for an AsyncCurli object, then it must
+        be called from a running event loop).
+        """
+        self.stop_refresher()
+        if self.is_async:
+            self._refresher = asyncio.ensure_future(self._arefresh_forever(interval))
+            return
+        self._stopping = threading.Event()
+        self._refresher = threading.Thread(target=self._refresh_forever, args=(interval, self._stopping),
+                name="apibean-account-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        refresher, self._refresher = self._refresher, None
+        if refresher is None:
+            return
+        if isinstance(refresher, threading.Thread):
+            self._stopping.set()
+            refresher.join()
+        else:
+            refresher.cancel()
+
+    def _refresh_forever(self, interval, stopping):
+        while not stopping.wait(interval):
+            self.refresh_expiring()
+
+    async def _arefresh_forever(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.arefresh_expiring()
+
+
+def _profile_of(store):
+    return lambda: store.profile
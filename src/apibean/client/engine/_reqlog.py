@@ -0,0 +1,190 @@
+import gzip
+import json
+import queue
+import random
+import threading
+import time
+import warnings
+
+import httpx
+
+from ._consts import HK_REQUEST_ID
+from ._curlify import Curlify, build_curl
+
+REQUEST_LOG_FORMATS = frozenset(["ndjson", "curl"])
+DEFAULT_REDACTED_HEADERS = frozenset(["authorization", "cookie", "set-cookie", "proxy-authorization",
+        "x-api-key"])
+
+_CLOSE = object()
+
+class RequestLog:
+    """A request log written asynchronously, for the high-volume traffic.
+
+    The calling thread only enqueues the (already sent) requests; a background
+    thread formats them as NDJSON records or curl commands, and writes them by
+    batches of `batch_size` (at least every `flush_interval` seconds) to
+    `target`, a path (gzip-compressed with `compress`, or when it ends with
+    `.gz`) or a text file object.
+
+    - The values of the `redacted_headers` are replaced with `***`.
+    - The request bodies longer than `max_body` bytes are truncated.
+    - The queue holds at most `max_queue` records. When it is full, the new records
+      are dropped (`on_pressure="drop"`); with `on_pressure="sample"`, only a
+      `sample_rate` ratio of them is kept as soon as the queue is half full.
+    - The `stats` are the numbers of logged, written, dropped and sampled out
+      records, and of the records lost on a failed write (`write_errors`), the
+      writer going on with the next ones.
+    """
+
+    def __init__(self, target, format: str = "ndjson", compress: bool|None = None,
+            max_queue: int = 10000, batch_size: int = 256, flush_interval: float = 1.0,
+            on_pressure: str = "drop", sample_rate: float = 0.1,
+            redacted_headers = DEFAULT_REDACTED_HEADERS, max_body: int = 64 * 1024):
+        if format not in REQUEST_LOG_FORMATS:
+            raise ValueError(f"The format must be one of { sorted(REQUEST_LOG_FORMATS) }")
+        if on_pressure not in ("drop", "sample"):
+            raise ValueError("The on_pressure policy must be 'drop' or 'sample'")
+        self.format = format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_pressure = on_pressure
+        self.sample_rate = sample_rate
+        self.redacted_headers = frozenset(name.lower() for name in redacted_headers)
+        self.max_body = max_body
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._high_water = max(1, max_queue // 2)
+        self._stats = dict(logged=0, written=0, dropped=0, sampled_out=0, write_errors=0)
+        self._lock = threading.Lock()
+        # set by close() when the writer is still busy: the writer closes the file at its end
+        self._detached = False
+        self._finished = False
+        self._file, self._owns_file = self._open(target, compress)
+        self._writer = threading.Thread(target=self._write_forever, name="apibean-request-log", daemon=True)
+        self._writer.start()
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats, queued=self._queue.qsize())
+
+    def _open(self, target, compress):
+        if hasattr(target, "write"):
+            return target, False
+        if compress is None:
+            compress = str(target).endswith(".gz")
+        if compress:
+            return gzip.open(target, "at", encoding="utf-8"), True
+        return open(target, "a", encoding="utf-8", buffering=1024 * 1024), True
+
+    def log(self, response):
+        """Enqueues the request of a response (ResponseWrapper or httpx.Response)."""
+        if self.on_pressure == "sample" and self._queue.qsize() >= self._high_water \
+                and random.random() >= self.sample_rate:
+            self._count("sampled_out")
+            return False
+        try:
+            self._queue.put_nowait((time.time(), response.request, response.status_code))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("logged")
+        return True
+
+    def _count(self, stat, increment = 1):
+        with self._lock:
+            self._stats[stat] += increment
+
+    def _write_forever(self):
+        closing = False
+        while not closing:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is _CLOSE:
+                        closing = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                        break
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                # the close marker may not have fit in a full queue
+                closing = self._detached
+            if batch:
+                try:
+                    self._file.write("".join(self._format(record) for record in batch))
+                    self._file.flush()
+                except Exception:
+                    # the batch is lost, the writer stays alive for the next ones
+                    self._count("write_errors", len(batch))
+                else:
+                    self._count("written", len(batch))
+        with self._lock:
+            self._finished = True
+            if self._detached:
+                self._close_file()
+
+    def _format(self, record) -> str:
+        logged_at, request, status_code = record
+        method, url, body = request.method, str(request.url), _body_of(request)
+        redacted = self.redacted_headers
+        headers = [(name, "***" if name.lower() in redacted else value)
+                for name, value in request.headers.multi_items()]
+        if isinstance(body, bytes):
+            body = body[:self.max_body].decode("utf-8", errors="replace")
+        if self.format == "curl":
+            headers = [(name, value) for name, value in headers if name not in Curlify.DEFAULT_EXCLUDE_HEADERS]
+            return f"# { time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(logged_at)) } { status_code }\n" \
+                    f"{ build_curl(method, url, headers, body) }\n"
+        request_id = next((value for name, value in headers if name.lower() == HK_REQUEST_ID), None)
+        return json.dumps(dict(ts=logged_at, request_id=request_id, method=method, url=url,
+                status=status_code, headers=dict(headers), body=body), ensure_ascii=False) + "\n"
+
+    def close(self, timeout: float|None = 10.0) -> int:
+        """Writes the queued records and closes the log (and its file, when opened from
+        a path). The writer is waited for at most `timeout` seconds.
+
+        Returns the number of the records not written yet when the timeout expires,
+        with a `RuntimeWarning`: the writer goes on writing them in the background
+        and closes the file after the last one.
+        """
+        if self._writer is None:
+            return 0
+        started = time.monotonic()
+        try:
+            self._queue.put(_CLOSE, timeout=timeout)
+        except queue.Full:
+            pass
+        self._writer.join(None if timeout is None else max(0.0, timeout - (time.monotonic() - started)))
+        self._writer = None
+        with self._lock:
+            if not self._finished:
+                self._detached = True
+                stats = self._stats
+                pending = stats["logged"] - stats["written"] - stats["write_errors"]
+                warnings.warn(f"The request log is still writing { pending } records after { timeout }s,"
+                        " they are written in the background", RuntimeWarning, stacklevel=2)
+                return pending
+            self._close_file()
+        return 0
+
+    def _close_file(self):
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _body_of(request):
+    try:
+        return request.content or None
+    except httpx.RequestNotRead:
+        # a streamed body is not kept in memory, it cannot be read back
+        return "<streamed body>"
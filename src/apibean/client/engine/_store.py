@@ -1,44 +1,138 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from ._decorators import deprecated
 
+_UNSET = object()
+# the profiles selected with Store.using() in the current context, keyed by store:
+# the mapping is copied on write, so that it is never shared between contexts
+_local_profiles = ContextVar("apibean_store_profiles", default={})
+
 class Store():
+    """A dict of dicts, one storage per profile, falling back to the default values.
+
+    Every change made through the Store API increases the version of the changed
+    profile (or of the default values) and notifies the subscribers, so that the
+    values derived from a Store can be cached and validated with one comparison
+    of `version`. In-place changes of nested values are not tracked, call
+    `touch()` after making them.
+
+    The current profile can be selected for the current context only (thread or
+    asyncio task) with `with store.using(profile):`, without affecting the
+    other contexts sharing the Store.
+    """
+
+    __slots__ = ("_default", "_storage", "_profile", "_default_version", "_versions", "_subscribers")
+
+    MUTATING_METHODS = frozenset(["clear", "pop", "popitem", "setdefault"])
+
     def __init__(self, profile="main"):
         self._default = dict()
         self._storage = dict()
         self._profile = profile
+        self._default_version = 0
+        self._versions = dict()
+        self._subscribers = tuple()
         if self._profile:
             self._storage[self._profile] = dict()
 
     @property
     def profile(self):
-        return self._profile
+        profile = _local_profiles.get().get(self, _UNSET)
+        return self._profile if profile is _UNSET else profile
 
     @profile.setter
     def profile(self, value):
-        self._profile = value
+        # inside a using() scope, only the profile of that scope is switched
+        profiles = _local_profiles.get()
+        if self not in profiles:
+            self._profile = value
+        else:
+            _local_profiles.set({**profiles, self: value})
+
+    @contextmanager
+    def using(self, profile):
+        """Selects the profile for the current context (thread or asyncio task) only,
+        until the end of the block.
+        """
+        token = _local_profiles.set({**_local_profiles.get(), self: profile})
+        try:
+            yield self
+        finally:
+            _local_profiles.reset(token)
 
     @property
     def profiles(self):
         return list(self._storage.keys())
 
+    @property
+    def default_version(self) -> int:
+        return self._default_version
+
+    @property
+    def version(self) -> int:
+        """The version of the values visible from the current profile: it increases
+        whenever the storage of the current profile or the default values change.
+        """
+        return self._default_version + self._versions.get(self.profile, 0)
+
+    def version_of(self, profile) -> int:
+        return self._versions.get(profile, 0)
+
+    def subscribe(self, callback):
+        """Registers a `callback(store, profile)` called after every change, with
+        `profile` being None when the default values have changed.
+        """
+        if callback not in self._subscribers:
+            self._subscribers = self._subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        self._subscribers = tuple(item for item in self._subscribers if item != callback)
+
+    def touch(self, profile = None):
+        """Marks the storage of the given (or current) profile as changed."""
+        self._changed(self.profile if profile is None else profile)
+
+    def _changed(self, profile):
+        if profile is None:
+            self._default_version += 1
+        else:
+            self._versions[profile] = self._versions.get(profile, 0) + 1
+        for callback in self._subscribers:
+            callback(self, profile)
+
     @deprecated
     def globals(self, **kwargs):
         self.default(**kwargs)
 
     def default(self, **kwargs):
         self._default.update(**kwargs)
+        self._changed(None)
 
     def reset(self):
+        profiles = list(self._storage.keys())
         self._storage = dict()
-        if self._profile:
-            self._storage[self._profile] = dict()
+        if self.profile:
+            self._storage[self.profile] = dict()
+        for profile in profiles:
+            self._changed(profile)
 
     def _get_storage_of_profile(self):
-        if self._profile not in self._storage:
-            self._storage[self._profile] = dict()
-        return self._storage[self._profile]
+        profile = self.profile
+        storage = self._storage.get(profile)
+        if storage is None:
+            storage = self._storage[profile] = dict()
+        return storage
 
     def update(self, *args, **kwargs):
-        self._get_storage_of_profile().update(*args, **kwargs)
+        """Updates the storage of the current profile, its version is increased only
+        when a value is added or changed.
+        """
+        storage = self._get_storage_of_profile()
+        values = dict(*args, **kwargs)
+        if any(key not in storage or storage[key] != value for key, value in values.items()):
+            storage.update(values)
+            self._changed(self.profile)
 
     def __contains__(self, item):
         return item in self._get_storage_of_profile()
@@ -49,12 +143,22 @@ class Store():
     def __setitem__(self, key, value):
         _storage = self._get_storage_of_profile()
         _storage[key] = value
+        self._changed(self.profile)
 
     def __delitem__(self, key):
         _storage = self._get_storage_of_profile()
         if key in _storage:
             del _storage[key]
+            self._changed(self.profile)
 
     def __getattr__(self, name):
         """Intercepts attribute access and forwards it to the storage of current profile."""
-        return getattr(self._get_storage_of_profile(), name)
+        attr = getattr(self._get_storage_of_profile(), name)
+        if name not in Store.MUTATING_METHODS:
+            return attr
+        profile = self.profile
+        def mutate(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            self._changed(profile)
+            return result
+        return mutate
@@ -0,0 +1,37 @@
+import asyncio
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+def iter_file_chunks(source, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Yields the content of a file (a path or a binary file object) chunk by chunk,
+    to be sent as a streamed (chunked) request body with bounded memory.
+    """
+    if hasattr(source, "read"):
+        yield from _iter_chunks(source, chunk_size)
+        return
+    with open(source, "rb") as file:
+        yield from _iter_chunks(file, chunk_size)
+
+
+async def aiter_file_chunks(source, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """The asynchronous variant of `iter_file_chunks()`, the file is read on a worker
+    thread so that the event loop is never blocked by the disk.
+    """
+    file = source if hasattr(source, "read") else await asyncio.to_thread(open, source, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(file.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if file is not source:
+            await asyncio.to_thread(file.close)
+
+
+def _iter_chunks(file, chunk_size):
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
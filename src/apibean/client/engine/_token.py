@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from datetime import timedelta
+
+from ._consts import JF_EMAIL
+from ._consts import JF_ACCESS_TOKEN
+from ._consts import JF_REFRESH_TOKEN
+
+from ._utils import get_now
+
+_refreshing = ContextVar("apibean_token_refreshing", default=False)
+
+class TokenKeeper:
+    """Refreshes the access_token of the current account of an Agent before it
+    expires, on behalf of the Curli object the Agent is bound to.
+
+    The refresh is single-flight per account profile: the concurrent callers
+    (threads with `ensure_fresh()`, or asyncio tasks with `aensure_fresh()`) wait
+    for the one in-flight refresh instead of refreshing the token themselves.
+
+    Properties:
+    - `skew`: How many seconds before the expiration the token is refreshed.
+    - `retry_on_401`: Whether a request rejected with 401 is sent again once
+        after the token has been refreshed.
+    - `failure_backoff`: How many seconds a failed refresh (an error response or
+        an exception) is remembered: meanwhile the requests of that account are
+        sent with the current token instead of refreshing it again.
+    """
+
+    def __init__(self, agent, skew: float = 30.0, retry_on_401: bool = True,
+            url: str = "auth/refresh-token", failure_backoff: float = 5.0):
+        self._agent = agent
+        self._skew = timedelta(seconds=skew)
+        self._retry_on_401 = retry_on_401
+        self._url = url
+        self._failure_backoff = failure_backoff
+        self._failed_until = dict()
+        self._locks = dict()
+        self._async_locks = dict()
+        self._guard = threading.Lock()
+
+    @property
+    def skew(self) -> float:
+        return self._skew.total_seconds()
+
+    @property
+    def retry_on_401(self) -> bool:
+        return self._retry_on_401
+
+    def is_refreshing(self) -> bool:
+        """Returns True inside the refresh call itself, so that the request sending
+        the refresh_token does not try to refresh the token again.
+        """
+        return _refreshing.get()
+
+    def can_refresh(self) -> bool:
+        account = self._agent._account
+        return bool(account.get(JF_EMAIL)) and bool(account.get(JF_REFRESH_TOKEN))
+
+    def needs_refresh(self) -> bool:
+        if not self.can_refresh():
+            return False
+        expires = self._agent.get_expiration()
+        if expires is None:
+            return False
+        return expires - self._skew <= get_now()
+
+    def _is_stale(self, stale_token = None) -> bool:
+        if self._failed_until and self._is_backing_off():
+            return False
+        if stale_token is not None:
+            return self.can_refresh() and self._agent._account.get(JF_ACCESS_TOKEN) == stale_token
+        return self.needs_refresh()
+
+    def _is_backing_off(self) -> bool:
+        failed_until = self._failed_until.get(self._agent._account.profile)
+        return failed_until is not None and time.monotonic() < failed_until
+
+    def _record_result(self, response):
+        profile = self._agent._account.profile
+        if response is not None and response.is_success:
+            self._failed_until.pop(profile, None)
+        else:
+            self._failed_until[profile] = time.monotonic() + self._failure_backoff
+
+    def _lock_of(self, registry, factory):
+        profile = self._agent._account.profile
+        lock = registry.get(profile)
+        if lock is None:
+            with self._guard:
+                lock = registry.setdefault(profile, factory())
+        return lock
+
+    def ensure_fresh(self, stale_token = None):
+        """Refreshes the token if it is about to expire, or, when `stale_token` is
+        given, if the current token is still that rejected one.
+        """
+        if _refreshing.get() or not self._is_stale(stale_token):
+            return None
+        with self._lock_of(self._locks, threading.Lock):
+            if not self._is_stale(stale_token):
+                return None
+            marker = _refreshing.set(True)
+            response = None
+            try:
+                response = self._agent.refresh_token(url=self._url)
+                return response
+            finally:
+                _refreshing.reset(marker)
+                self._record_result(response)
+
+    async def aensure_fresh(self, stale_token = None):
+        """The asynchronous variant of `ensure_fresh()`, for an AsyncAgent."""
+        if _refreshing.get() or not self._is_stale(stale_token):
+            return None
+        async with self._lock_of(self._async_locks, asyncio.Lock):
+            if not self._is_stale(stale_token):
+                return None
+            marker = _refreshing.set(True)
+            response = None
+            try:
+                response = await self._agent.refresh_token(url=self._url)
+                return response
+            finally:
+                _refreshing.reset(marker)
+                self._record_result(response)
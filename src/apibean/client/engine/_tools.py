@@ -1,9 +1,13 @@
 import json
-import httpx
+from typing import TYPE_CHECKING
 
-from ._helpers import Curlify
+if TYPE_CHECKING:
+    import httpx
 
 class Tools:
+    """Printing helpers for the interactive sessions. The curl export machinery is
+    imported on first use only.
+    """
 
     def print_json(self, data):
         print(json.dumps(data, indent=2))
@@ -12,12 +16,14 @@ class Tools:
         self.print_json(response.json())
 
     def print_response(self, response):
-        if response.status_code == httpx.codes.OK:
+        if response.status_code == 200:
             print(json.dumps(response.json(), indent=2))
         else:
             print(f"Error: { json.dumps(response.json(), indent=2) }")
 
-    def print_curl(self, req_or_resp: httpx.Request|httpx.Response):
+    def print_curl(self, req_or_resp: "httpx.Request|httpx.Response"):
+        import httpx
+        from ._curlify import Curlify
         request = req_or_resp
         if isinstance(req_or_resp, httpx.Response):
             request = req_or_resp.request
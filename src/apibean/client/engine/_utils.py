@@ -13,10 +13,10 @@ def get_now() -> datetime:
 
 def normalize_header(headers: dict[str, str], canonical_key: str) -> dict[str, str]:
     normalized = {}
+    canonical_folded = canonical_key.casefold()
     for key, value in headers.items():
-        if key.casefold() == canonical_key.casefold():
+        if key.casefold() == canonical_folded:
             normalized[canonical_key] = value
-            break
         else:
             normalized[key] = value
     return normalized
@@ -33,3 +33,11 @@ def normalize_headers(headers: dict[str, str], canonical_keys: list[str]) -> dic
             # Không khớp: giữ nguyên key gốc
             normalized[key] = value
     return normalized
+
+
+def decoded_headers(headers) -> list[tuple[str, str]]:
+    """Returns the headers of a response to rebuild it from its decoded content: the
+    `content-encoding` and `content-length` headers no longer apply to that content.
+    """
+    return [(key, value) for key, value in headers.multi_items()
+            if key.lower() not in ("content-encoding", "content-length")]
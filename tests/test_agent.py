@@ -0,0 +1,140 @@
+import asyncio
+import itertools
+import json
+
+import pytest
+
+import httpx
+
+from apibean.client.engine import Agent, AsyncAgent, AsyncCurli, Curli, Store
+
+USERS = {"u1": "code-1", "u2": "code-2", "u3": "code-3"}
+
+
+def _handler(calls):
+    def handler(request):
+        path = request.url.path
+        calls.append((request.method, path))
+        if path.startswith("/user") and request.headers.get("authorization") != "Bearer tok-root":
+            return httpx.Response(401, json={"detail": "not authenticated"})
+        if path == "/user":
+            # u3 is not listed, its activation code is fetched on its own
+            page = int(request.url.params["page"])
+            listed = [{"id": "u1", "activation_code": "code-1"}, {"id": "u2", "activation_code": "code-2"}]
+            return httpx.Response(200, json={"founds": listed if page == 1 else []})
+        if path.startswith("/user/"):
+            user_id = path.split("/")[-1]
+            if user_id not in USERS:
+                return httpx.Response(404, json={"detail": "not found"})
+            return httpx.Response(200, json={"id": user_id, "activation_code": USERS[user_id]})
+        body = json.loads(request.content)
+        if path == "/auth/activate":
+            user_id = {code: user_id for user_id, code in USERS.items()}[body["activation_code"]]
+        else:
+            user_id = body["username"]
+        return httpx.Response(200, json={"id": user_id, "access_token": f"tok-{ user_id }"})
+    return handler
+
+
+def _build_agent(calls, is_async = False):
+    client_class, curli_class, agent_class = (httpx.AsyncClient, AsyncCurli, AsyncAgent) if is_async \
+            else (httpx.Client, Curli, Agent)
+    curli = curli_class(client_class(transport=httpx.MockTransport(_handler(calls))),
+            session_store=Store(), account_store=Store(profile="anon"))
+    curli.in_session(base_url="http://api.test")
+    curli.as_account("root", access_token="tok-root").as_account("anon")
+    return agent_class(curli)
+
+
+def test_activate_many_fetches_the_activation_codes_in_bulk():
+    calls = []
+    agent = _build_agent(calls)
+    results = agent.activate_many(["u1", "u2", "u3", "u4"], password="pw", list_url="user")
+    assert sorted(results) == ["u1", "u2", "u3", "u4"]
+    assert all(results[user_id].is_success for user_id in ["u1", "u2", "u3"])
+    assert isinstance(results["u4"], RuntimeError)
+    # the prefetched pages of the listing may or may not be sent before its end
+    assert ("GET", "/user") in calls
+    assert sorted(path for method, path in calls if method == "GET" and path != "/user") == ["/user/u3", "/user/u4"]
+    with agent.using(account="u3"):
+        assert agent._account["access_token"] == "tok-u3"
+
+
+def test_activate_many_does_not_list_the_users_by_default():
+    calls = []
+    results = _build_agent(calls).activate_many(["u1", "u2"], password="pw")
+    assert all(r.is_success for r in results.values())
+    assert sorted(path for method, path in calls if method == "GET") == ["/user/u1", "/user/u2"]
+
+
+def test_activate_many_bounds_a_listing_ignoring_the_page_params():
+    calls, counter = [], itertools.count()
+    handler = _handler(calls)
+    def listing_handler(request):
+        if request.url.path != "/user":
+            return handler(request)
+        calls.append((request.method, request.url.path))
+        # a new window of (unknown) users, whatever the page
+        return httpx.Response(200, json={"founds": [{"id": f"x{ next(counter) }", "activation_code": "?"}]})
+
+    agent = _build_agent([])
+    agent._curli.invoker = httpx.Client(transport=httpx.MockTransport(listing_handler))
+    results = agent.activate_many(["u1"], password="pw", list_url="user", list_max_pages=5)
+    assert results["u1"].is_success
+    assert calls.count(("GET", "/user")) == 5
+
+
+def test_activate_many_warns_when_the_listing_fails():
+    calls = []
+    agent = _build_agent(calls)
+    with pytest.warns(RuntimeWarning, match="listing of users has failed"):
+        results = agent.activate_many(["u1"], password="pw", list_url="users")
+    assert results["u1"].is_success
+    assert ("GET", "/user/u1") in calls
+
+
+def test_login_many_captures_the_tokens_per_profile():
+    agent = _build_agent([])
+    results = agent.login_many({"a": dict(username="alice", password="pw"),
+            "b": dict(username="bob", password="pw")})
+    assert [results[profile].json()["id"] for profile in ("a", "b")] == ["alice", "bob"]
+    with agent.using(account="b"):
+        assert agent._account["access_token"] == "tok-bob"
+
+
+def test_async_activate_many_and_login_many():
+    calls = []
+    agent = _build_agent(calls, is_async=True)
+
+    async def run():
+        activated = await agent.activate_many({"u1": "pw", "u3": "pw"}, list_url="user")
+        logged_in = await agent.login_many({"a": dict(username="alice", password="pw")})
+        return activated, logged_in
+
+    activated, logged_in = asyncio.run(run())
+    assert {user_id: r.status_code for user_id, r in activated.items()} == {"u1": 200, "u3": 200}
+    assert logged_in["a"].json()["access_token"] == "tok-alice"
+    with agent.using(account="u1"):
+        assert agent._account["access_token"] == "tok-u1"
+
+
+def test_agent_calls_are_not_summarized():
+    calls = []
+    agent = _build_agent(calls)
+    agent._curli.summarized("id")
+    agent.as_account("alice")
+    assert agent.login("alice", "pw").is_success
+    assert agent._account["access_token"] == "tok-alice"
+    assert agent.activate_many(["u1"], password="pw")["u1"].is_success
+    assert agent.login_many({"bob": dict(username="bob", password="pw")})["bob"].is_success
+
+
+def test_capture_with_summarized_responses():
+    agent = _build_agent([])
+    curli = agent._curli.summarized("id")
+    with curli.using(account="root"):
+        assert curli.get("user", params={"page": 1}).json() == {}
+        curli.get("user", params={"page": 1}, summarize=False).capture_id_refs(name_of_key_field="id")
+        assert curli.capture_paged_id_refs("user", name_of_id_refs="paged_ids", name_of_key_field="id") \
+                == {"u1": "u1", "u2": "u2"}
+    assert curli._session["user_ids_of"] == {"u1": "u1", "u2": "u2"}
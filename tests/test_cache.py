@@ -0,0 +1,79 @@
+import gzip
+import json
+import time
+
+import httpx
+
+from apibean.client.engine import Curli, ResponseCache, Store
+
+
+def _build_curli(handler, profile = "alice"):
+    curli = Curli(httpx.Client(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store(profile=profile))
+    curli.in_session(base_url="http://api.test")
+    return curli
+
+
+def _echo_token(request):
+    return httpx.Response(200, json={"me": request.headers.get("authorization")})
+
+
+def test_gzip_response_is_decoded_once_when_served_from_the_cache():
+    def handler(request):
+        return httpx.Response(200, content=gzip.compress(b'{"id": 1}'),
+                headers={"content-type": "application/json", "content-encoding": "gzip"})
+
+    curli = _build_curli(handler)
+    curli.with_cache()
+    assert curli.get("item").json() == {"id": 1}
+    cached = curli.get("item")
+    assert cached.extensions.get("apibean_cache") == "hit"
+    assert cached.json() == {"id": 1}
+
+
+def test_same_profile_with_another_token_is_not_served_the_cached_response():
+    curli = _build_curli(_echo_token)
+    cache = curli.with_cache()
+    curli.as_account(access_token="tok-1")
+    assert curli.get("me").json() == {"me": "Bearer tok-1"}
+    curli.as_account(access_token="tok-2")
+    assert curli.get("me").json() == {"me": "Bearer tok-2"}
+    assert cache.stats["hits"] == 0
+    curli.as_account(access_token="tok-1")
+    assert curli.get("me").json() == {"me": "Bearer tok-1"}
+    assert cache.stats["hits"] == 1
+
+
+def test_saved_cache_is_json_with_wall_clock_expirations(tmp_path):
+    path = tmp_path / "cache.json"
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        max_age = 60 if request.url.path == "/fresh" else 0
+        return httpx.Response(200, json={"path": request.url.path},
+                headers={"cache-control": f"max-age={ max_age }"})
+
+    curli = _build_curli(handler)
+    cache = curli.with_cache(path=str(path))
+    curli.get("fresh")
+    curli.get("stale")
+    cache.save()
+
+    saved = json.loads(path.read_text())
+    expires_at = {entry["key"][2]: entry["expires_at"] for entry in saved["entries"]}
+    assert abs(expires_at["http://api.test/fresh"] - (time.time() + 60)) < 5
+
+    reloaded = _build_curli(handler)
+    reloaded_cache = reloaded.with_cache(ResponseCache(path=str(path)))
+    assert len(reloaded_cache) == 2
+    assert reloaded.get("fresh").extensions.get("apibean_cache") == "hit"
+    reloaded.get("stale")
+    assert calls == ["/fresh", "/stale", "/stale"]
+
+
+def test_unreadable_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "cache.bin"
+    path.write_bytes(b"\x80\x04\x95 not a json document")
+    cache = ResponseCache(path=str(path))
+    assert len(cache) == 0
@@ -0,0 +1,38 @@
+import httpx
+import pytest
+
+from apibean.client.engine import Cassette, CassetteMissError, Curli, Store
+
+
+def _build_curli(handler):
+    curli = Curli(httpx.Client(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store())
+    curli.in_session(base_url="http://api.test")
+    return curli
+
+
+def test_recorded_responses_are_replayed_from_json_frames(tmp_path):
+    path = str(tmp_path / "api.cassette")
+
+    def handler(request):
+        return httpx.Response(201, content=b"\x00\xff" + request.content, headers={"x-served": "yes"})
+
+    recorder = _build_curli(handler)
+    recorder.with_cassette(Cassette(path, match_headers=("authorization",)), mode="record")
+    recorded = recorder.post("item", params={"b": 2, "a": 1}, json={"id": 7}, headers={"authorization": "tok"})
+    recorder.close()
+
+    with open(path, "rb") as file:
+        data = file.read()
+    assert data.startswith(b"APIBEAN-CASSETTE-2\n")
+    assert b'"status_code": 201' in data
+
+    def offline(request):
+        raise AssertionError("no request is sent in replay mode")
+
+    player = _build_curli(offline)
+    player.with_cassette(Cassette(path, match_headers=("authorization",)), mode="replay")
+    r = player.post("item", params={"a": 1, "b": 2}, json={"id": 7}, headers={"authorization": "tok"})
+    assert (r.status_code, r.content, r.headers["x-served"]) == (201, recorded.content, "yes")
+    with pytest.raises(CassetteMissError):
+        player.post("item", json={"id": 7}, headers={"authorization": "other"})
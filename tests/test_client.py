@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+from apibean.client import Space
+from apibean.client.engine import Store
+
+
+def test_importing_the_client_does_not_import_httpx():
+    code = "import sys, apibean.client; assert 'httpx' not in sys.modules, 'httpx imported'"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
+
+
+def test_space_stores_are_class_attributes_built_once():
+    account = Space.account
+    assert isinstance(account, Store)
+    assert account.profile == "anon"
+    assert Space.account is account and Space().account is account
+    assert Space.session.profile == "main"
+
+
+def test_all_lists_the_lazy_exports():
+    import apibean.client as client
+    import apibean.client.engine as engine
+    assert set(engine.__all__) == set(engine._MODULE_OF)
+    assert set(client.__all__) == {"STORE_PATH", "Space", *client._BUILDERS, *client._ENGINE_NAMES}
+
+
+def test_star_import_resolves_every_name():
+    code = "from apibean.client.engine import *; from apibean.client import *; assert curli and LoadRunner"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
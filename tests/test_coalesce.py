@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import httpx
+import pytest
+
+from apibean.client.engine._coalesce import AsyncCoalescingInvoker, CoalescingInvoker
+
+URL = "http://api.test/item"
+
+
+def _blocking_invoker(calls, release, error = None):
+    def handler(request):
+        calls.append(request.method)
+        release.wait(5)
+        if error is not None:
+            raise error
+        return httpx.Response(200, json={"calls": len(calls)})
+    return CoalescingInvoker(httpx.Client(transport=httpx.MockTransport(handler)))
+
+
+def _send_concurrently(invoker, release, count, send):
+    """Sends `count` calls on threads and releases the leader once the followers wait."""
+    executor = ThreadPoolExecutor(max_workers=count)
+    futures = [executor.submit(send) for _ in range(count)]
+    deadline = time.monotonic() + 5
+    while invoker.stats["coalesced"] < count - 1 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    release.set()
+    executor.shutdown()
+    return futures
+
+
+def test_followers_share_the_response_of_the_leader():
+    calls, release = [], threading.Event()
+    invoker = _blocking_invoker(calls, release)
+    futures = _send_concurrently(invoker, release, 5, lambda: invoker.get(URL, headers={"x-request-id": "any"}))
+    responses = [future.result() for future in futures]
+    assert calls == ["GET"]
+    assert {response.json()["calls"] for response in responses} == {1}
+    assert sum(bool(response.extensions.get("apibean_coalesced")) for response in responses) == 4
+    assert invoker.stats == dict(leaders=1, coalesced=4, in_flight=0)
+
+
+def test_followers_get_the_error_of_the_leader():
+    calls, release = [], threading.Event()
+    invoker = _blocking_invoker(calls, release, error=httpx.ConnectError("refused"))
+    futures = _send_concurrently(invoker, release, 3, lambda: invoker.get(URL))
+    assert calls == ["GET"]
+    assert all(isinstance(future.exception(), httpx.ConnectError) for future in futures)
+    assert invoker.stats["in_flight"] == 0
+
+
+def test_unsafe_requests_and_other_scopes_are_not_coalesced():
+    scope = threading.local()
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(200)
+
+    invoker = CoalescingInvoker(httpx.Client(transport=httpx.MockTransport(handler)),
+            scope_of=lambda: getattr(scope, "profile", None))
+    invoker.post(URL)
+    invoker.post(URL)
+    assert calls == ["POST", "POST"] and invoker.stats["leaders"] == 0
+    scope.profile = "alice"
+    key_of_alice = invoker.key_of("GET", URL, {})
+    scope.profile = "bob"
+    assert invoker.key_of("GET", URL, {}) != key_of_alice
+
+
+def test_async_followers_share_the_call_and_its_error():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.02)
+        if request.url.path == "/broken":
+            raise httpx.ConnectError("refused")
+        return httpx.Response(200, json={"calls": len(calls)})
+
+    invoker = AsyncCoalescingInvoker(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        responses = await asyncio.gather(*[invoker.get(URL) for _ in range(4)])
+        errors = await asyncio.gather(*[invoker.get("http://api.test/broken") for _ in range(3)],
+                return_exceptions=True)
+        return responses, errors
+
+    responses, errors = asyncio.run(run())
+    assert calls == ["/item", "/broken"]
+    assert {response.json()["calls"] for response in responses} == {1}
+    assert all(isinstance(error, httpx.ConnectError) for error in errors)
+    assert invoker.stats == dict(leaders=2, coalesced=5, in_flight=0)
@@ -0,0 +1,45 @@
+import httpx
+import pytest
+
+from apibean.client.engine import ResponseWrapper
+
+
+def _wrap(content, status_code = 200, content_type = "application/json"):
+    response = httpx.Response(status_code, content=content, headers={"content-type": content_type},
+            request=httpx.Request("GET", "http://api.test/item"))
+    return ResponseWrapper(response, session_store=None, account_store=None)
+
+
+@pytest.mark.parametrize("content", [b"", b"[1, 2]", b'"text"', b"null", b"  42"])
+@pytest.mark.parametrize("decoded", [False, True])
+def test_get_field_of_non_object_body_returns_default(content, decoded):
+    wrapper = _wrap(content)
+    if decoded and content:
+        wrapper.json()
+    assert wrapper.get_field("id", "missing") == "missing"
+
+
+@pytest.mark.parametrize("decoded", [False, True])
+def test_get_field_of_object_body(decoded):
+    wrapper = _wrap(b' {"id": 7, "founds": [{"id": 1}]}')
+    if decoded:
+        wrapper.json()
+    assert wrapper.get_field("id") == 7
+    assert wrapper.get_field("name", "missing") == "missing"
+
+
+def test_get_field_of_html_body_returns_default():
+    wrapper = _wrap(b"<html><body>Bad Gateway</body></html>", status_code=502, content_type="text/html")
+    assert wrapper.get_field("id") is None
+
+
+@pytest.mark.parametrize("content", [b"<html><body>Bad Gateway</body></html>", b"[1, 2]", b'{"id" 7}'])
+def test_summarize_keeps_the_response_when_the_body_is_not_a_json_object(content):
+    wrapper = _wrap(content, status_code=502).summarize("id")
+    assert wrapper.content == content
+
+
+def test_summarize_keeps_only_the_given_fields():
+    wrapper = _wrap(b'{"id": 7, "founds": [{"id": 1}]}').summarize("id")
+    assert wrapper.json() == {"id": 7}
+    assert wrapper.content == b""
@@ -0,0 +1,61 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import httpx
+import pytest
+
+from apibean.client.engine import PooledInvoker
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        # the client port tells the connections apart
+        self.server.ports.append(self.client_address[1])
+        self.send_response(200)
+        self.send_header("content-length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.ports = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url_of(server, path = "item"):
+    return f"http://127.0.0.1:{ server.server_address[1] }/{ path }"
+
+
+def test_pooled_invoker_reuses_the_connections(server):
+    with PooledInvoker() as invoker:
+        for _ in range(5):
+            assert invoker.get(_url_of(server)).status_code == 200
+        assert len(invoker.clients) == 1
+    assert len(server.ports) == 5 and len(set(server.ports)) == 1
+
+
+def test_module_invoker_opens_a_connection_per_request(server):
+    for _ in range(3):
+        httpx.get(_url_of(server))
+    assert len(set(server.ports)) == 3
+
+
+def test_closed_pooled_invoker_releases_its_clients(server):
+    invoker = PooledInvoker()
+    invoker.get(_url_of(server))
+    client = next(iter(invoker.clients.values()))
+    invoker.close()
+    assert client.is_closed and invoker.clients == {}
+    with pytest.raises(RuntimeError):
+        invoker.get(_url_of(server))
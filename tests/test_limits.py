@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import httpx
+
+from apibean.client.engine import AsyncCurli, Curli, Store
+from apibean.client.engine._limits import InFlightLimit
+
+
+class _Interrupted(BaseException):
+    pass
+
+
+def test_interrupted_waiter_does_not_leak_its_slot(monkeypatch):
+    limit = InFlightLimit(1)
+    limit.acquire()
+
+    def interrupted_wait(event, timeout = None):
+        # the slot is granted while the waiter is being interrupted
+        limit.release()
+        raise _Interrupted()
+
+    monkeypatch.setattr(threading.Event, "wait", interrupted_wait)
+    try:
+        limit.acquire()
+    except _Interrupted:
+        pass
+    assert (limit.active, limit.waiting) == (0, 0)
+    monkeypatch.undo()
+    limit.acquire()
+    assert limit.active == 1
+
+
+def _in_flight(limiter):
+    return [state["in_flight"] for state in limiter.stats()]
+
+
+def test_a_stream_holds_its_in_flight_slot_until_its_end():
+    handler = lambda request: httpx.Response(200, content=b"chunk" * 10)
+    curli = Curli(httpx.Client(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store())
+    curli.in_session(base_url="http://api.test")
+    limiter = curli.with_limits()
+    limiter.limit(max_in_flight=1)
+    with curli.stream("GET", "export") as r:
+        assert _in_flight(limiter) == [1]
+        assert b"".join(r.iter_bytes()) == b"chunk" * 10
+    assert _in_flight(limiter) == [0]
+
+
+def test_an_async_stream_holds_its_in_flight_slot_until_its_end():
+    async def handler(request):
+        return httpx.Response(200, content=b"chunk" * 10)
+
+    curli = AsyncCurli(httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store())
+    curli.in_session(base_url="http://api.test")
+    limiter = curli.with_limits()
+    limiter.limit(max_in_flight=1)
+
+    async def run():
+        async with curli.stream("GET", "export") as r:
+            assert _in_flight(limiter) == [1]
+            assert b"".join([chunk async for chunk in r.aiter_bytes()]) == b"chunk" * 10
+        assert _in_flight(limiter) == [0]
+
+    asyncio.run(run())
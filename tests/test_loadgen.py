@@ -0,0 +1,64 @@
+import threading
+
+import httpx
+import pytest
+
+from apibean.client.engine import LoadRunner
+
+
+def _transport(paths):
+    lock = threading.Lock()
+
+    def handler(request):
+        with lock:
+            paths.append(request.url.path)
+        return httpx.Response(200, json={"ok": True})
+    return httpx.MockTransport(handler)
+
+
+def test_closed_loop_runs_the_given_iterations():
+    paths = []
+
+    def scenario(user):
+        user.curli.get("item")
+        if user.data.setdefault("runs", 0) == 1:
+            raise KeyError("scenario")
+        user.data["runs"] += 1
+
+    runner = LoadRunner(scenario, users=4, duration=None, iterations=20, base_url="http://api.test",
+            invoker_kwargs=dict(transport=_transport(paths)))
+    report = runner.run()
+    assert (report.iterations, report.requests, report.errors) == (20, 20, 0)
+    assert report.failures == {"KeyError": report.failed_iterations} and report.failed_iterations > 0
+    assert set(paths) == {"/item"} and len(paths) == 20
+
+
+def test_async_closed_loop_runs_the_given_iterations():
+    paths = []
+
+    async def scenario(user):
+        await user.curli.get("item")
+
+    report = LoadRunner(scenario, users=3, duration=None, iterations=9, base_url="http://api.test",
+            invoker_kwargs=dict(transport=_transport(paths))).run()
+    assert (report.iterations, report.requests) == (9, 9)
+
+
+def test_open_loop_starts_the_iterations_at_the_target_rate():
+    paths = []
+
+    def scenario(user):
+        user.curli.get("item")
+
+    report = LoadRunner(scenario, users=2, duration=0.3, rps=50, base_url="http://api.test",
+            invoker_kwargs=dict(transport=_transport(paths))).run()
+    assert 5 <= report.iterations + report.dropped_iterations <= 20
+    assert report.requests == report.iterations == len(paths)
+
+
+def test_sync_scenario_rejects_an_asgi_transport():
+    async def app(scope, receive, send):
+        pass
+
+    with pytest.raises(TypeError, match="WSGITransport"):
+        LoadRunner(lambda user: None, invoker_kwargs=dict(transport=httpx.ASGITransport(app)))
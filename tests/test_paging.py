@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+
+from apibean.client.engine import AsyncCurli, Curli, Store
+
+
+def _build_curli(handler, is_async = False):
+    if is_async:
+        async def async_handler(request):
+            return handler(request)
+        client, curli_class = httpx.AsyncClient(transport=httpx.MockTransport(async_handler)), AsyncCurli
+    else:
+        client, curli_class = httpx.Client(transport=httpx.MockTransport(handler)), Curli
+    curli = curli_class(client, session_store=Store(), account_store=Store())
+    curli.in_session(base_url="http://api.test")
+    return curli
+
+
+def _list(curli, *args, **kwargs):
+    if isinstance(curli, AsyncCurli):
+        async def run():
+            return [item async for item in curli.paginate(*args, **kwargs)]
+        return asyncio.run(run())
+    return list(curli.paginate(*args, **kwargs))
+
+
+def _users_handler(total, cap, pages):
+    def handler(request):
+        page, size = int(request.url.params["page"]), min(int(request.url.params["size"]), cap)
+        pages.append(page)
+        return httpx.Response(200, json={"founds": [{"id": index}
+                for index in range((page - 1) * size, min(page * size, total))]})
+    return handler
+
+
+
+def test_pages_are_not_summarized():
+    def handler(request):
+        page = int(request.url.params["page"])
+        return httpx.Response(200, json={"founds": [{"id": page}] if page < 3 else []})
+
+    curli = Curli(httpx.Client(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store())
+    curli.in_session(base_url="http://api.test").summarized("total")
+    assert [item["id"] for item in curli.paginate("user", page_size=1)] == [1, 2]
+
+
+def test_capture_paged_id_refs_maps_the_items_of_all_pages():
+    def handler(request):
+        page = int(request.url.params["page"])
+        if page == 3:
+            return httpx.Response(200, content=b"[]")
+        return httpx.Response(200, json={"founds": [{"id": page, "email": f"user{ page }@test"}]})
+
+    curli = Curli(httpx.Client(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store())
+    curli.in_session(base_url="http://api.test")
+    assert curli.capture_paged_id_refs("user", page_size=1) == {"user1@test": 1, "user2@test": 2}
+    assert curli._session["user_ids_of"] == {"user1@test": 1, "user2@test": 2}
+
+
+def test_a_capped_page_size_does_not_end_the_walk():
+    for is_async in (False, True):
+        pages = []
+        curli = _build_curli(_users_handler(total=25, cap=10, pages=pages), is_async)
+        assert [item["id"] for item in _list(curli, "user", page_size=100, prefetch=0)] == list(range(25))
+        assert pages == [1, 2, 3]
+
+
+def test_the_walk_ends_on_an_empty_page():
+    for is_async in (False, True):
+        pages = []
+        curli = _build_curli(_users_handler(total=20, cap=10, pages=pages), is_async)
+        assert [item["id"] for item in _list(curli, "user", page_size=10, prefetch=0)] == list(range(20))
+        assert pages == [1, 2, 3]
+
+
+def test_a_server_ignoring_the_page_param_ends_the_walk():
+    calls = []
+    def handler(request):
+        calls.append(request.url.params["page"])
+        return httpx.Response(200, json={"founds": [{"id": 1}, {"id": 2}]})
+
+    for is_async in (False, True):
+        calls.clear()
+        curli = _build_curli(handler, is_async)
+        assert [item["id"] for item in _list(curli, "user", page_size=2, prefetch=0)] == [1, 2]
+        assert calls == ["1", "2"]
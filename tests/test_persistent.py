@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+from apibean.client.engine import PersistentStore
+
+
+def _run_in_another_process(path, code):
+    script = ("from apibean.client.engine import PersistentStore\n"
+            f"store = PersistentStore({ str(path)!r}, profile='alice', namespace='account')\n"
+            f"{ code }\n"
+            "store.close()\n")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", script], check=True, env=env)
+
+
+def test_processes_changing_other_keys_of_a_profile_keep_both_changes(tmp_path):
+    path = tmp_path / "store.db"
+    store = PersistentStore(path, profile="alice", namespace="account")
+    store.update(access_token="tok-1", refresh_token="ref-1", email="alice@test")
+
+    _run_in_another_process(path, "store.update(access_token='tok-2', refresh_token='ref-2')")
+    store.update(email="alice@test")
+    store["note"] = "seen"
+    store.close()
+
+    reopened = PersistentStore(path, profile="alice", namespace="account")
+    assert {key: reopened[key] for key in ("access_token", "refresh_token", "email", "note")} == {
+            "access_token": "tok-2", "refresh_token": "ref-2", "email": "alice@test", "note": "seen"}
+    reopened.close()
+
+
+def test_removed_keys_are_removed_from_the_file(tmp_path):
+    path = tmp_path / "store.db"
+    store = PersistentStore(path, profile="alice", namespace="account")
+    store.update(access_token="tok-1", note="old")
+    del store["note"]
+    store.close()
+
+    _run_in_another_process(path, "assert 'note' not in store and store['access_token'] == 'tok-1'")
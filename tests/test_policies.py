@@ -0,0 +1,87 @@
+import time
+
+import httpx
+import pytest
+
+from apibean.client.engine._policies import CircuitBreaker, CircuitOpenError, RetryingInvoker, RetryPolicy
+
+HOST = "http://api.test"
+URL = f"{ HOST }/item"
+
+
+def _build_invoker(statuses, breaker = None, **policy_kwargs):
+    """An invoker answering with the given statuses in turn (the last one repeated)."""
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1])
+
+    sleeps = []
+    invoker = RetryingInvoker(httpx.Client(transport=httpx.MockTransport(handler)),
+            policy=RetryPolicy(jitter=False, **policy_kwargs), breaker=breaker, sleep=sleeps.append)
+    return invoker, calls, sleeps
+
+
+def test_idempotent_request_is_retried_with_exponential_backoff():
+    invoker, calls, sleeps = _build_invoker([503, 502, 200], backoff_base=0.1)
+    assert invoker.get(URL).status_code == 200
+    assert calls == ["GET"] * 3 and sleeps == [0.1, 0.2]
+
+
+def test_non_idempotent_request_is_not_retried():
+    invoker, calls, _ = _build_invoker([503, 200])
+    assert invoker.post(URL, json={}).status_code == 503
+    assert calls == ["POST"]
+
+
+def test_open_circuit_stops_the_retries():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    invoker, calls, _ = _build_invoker([503], breaker=breaker, max_retries=5)
+    with pytest.raises(CircuitOpenError):
+        invoker.get(URL)
+    assert len(calls) == 2 and breaker.state_of(HOST) == "open"
+    with pytest.raises(CircuitOpenError):
+        invoker.get(URL)
+    assert len(calls) == 2
+
+
+def _open_breaker(reset_timeout = 0.05):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure(HOST)
+    time.sleep(reset_timeout)
+    assert breaker.state_of(HOST) == "half-open"
+    return breaker
+
+
+def test_half_open_circuit_lets_a_single_trial_through():
+    breaker = _open_breaker()
+    breaker.before_request(HOST)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(HOST)
+    breaker.record_success(HOST)
+    assert breaker.state_of(HOST) == "closed"
+    breaker.before_request(HOST)
+
+
+def test_failed_trial_opens_the_circuit_again():
+    breaker = _open_breaker()
+    invoker, calls, _ = _build_invoker([503], breaker=breaker, max_retries=0)
+    assert invoker.get(URL).status_code == 503
+    assert breaker.state_of(HOST) == "open"
+    with pytest.raises(CircuitOpenError):
+        invoker.get(URL)
+    assert len(calls) == 1
+
+
+def test_interrupted_trial_lets_another_trial_through():
+    breaker = _open_breaker()
+
+    def interrupted(request):
+        raise KeyboardInterrupt()
+
+    invoker = RetryingInvoker(httpx.Client(transport=httpx.MockTransport(interrupted)), breaker=breaker)
+    with pytest.raises(KeyboardInterrupt):
+        invoker.get(URL)
+    assert breaker.state_of(HOST) == "half-open"
+    breaker.before_request(HOST)
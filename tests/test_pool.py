@@ -0,0 +1,56 @@
+import json
+
+import httpx
+
+from apibean.client.engine import AccountPool, Curli, Store
+
+
+def _handler(request):
+    if request.url.path == "/auth/login":
+        name = json.loads(request.content)["username"]
+        return httpx.Response(200, json={"id": name, "access_token": f"tok-{ name }",
+                "refresh_token": f"ref-{ name }", "expiration": "2099-01-01T00:00:00"})
+    return httpx.Response(200, json={"me": request.headers.get("authorization")},
+            headers={"cache-control": "max-age=60"})
+
+
+def _build_pool():
+    curli = Curli(httpx.Client(transport=httpx.MockTransport(_handler)),
+            session_store=Store(), account_store=Store(profile="anon"))
+    curli.in_session(base_url="http://api.test")
+    return curli, AccountPool(curli)
+
+
+def test_pooled_accounts_do_not_share_cached_responses():
+    curli, pool = _build_pool()
+    cache = curli.with_cache()
+    results = pool.login_all({"alice": dict(username="alice", password="pw"),
+            "bob": dict(username="bob", password="pw")})
+    assert all(response.is_success for response in results.values())
+
+    assert pool["alice"].curli.get("me").json() == {"me": "Bearer tok-alice"}
+    assert pool["bob"].curli.get("me").json() == {"me": "Bearer tok-bob"}
+    assert pool["alice"].curli.get("me").extensions.get("apibean_cache") == "hit"
+    assert {key[0] for key in cache._entries} == {"alice", "bob"}
+
+
+def test_pooled_accounts_are_throttled_under_their_own_profiles():
+    curli, pool = _build_pool()
+    limiter = curli.with_limits()
+    limiter.limit(max_in_flight=1, path_prefix="/me", per_profile=True)
+    pool.login_all({"alice": dict(username="alice", password="pw"),
+            "bob": dict(username="bob", password="pw")})
+    pool["alice"].curli.get("me")
+    pool["bob"].curli.get("me")
+    assert {stats["scope"] for stats in limiter.stats()} == {"alice", "bob"}
+
+
+def test_batch_requests_use_the_profile_selected_for_the_calling_context():
+    curli, pool = _build_pool()
+    pool.login_all({"alice": dict(username="alice", password="pw")})
+    curli.as_account("alice", access_token="tok-alice")
+    curli.as_account("anon")
+    with curli._account.using("alice"):
+        results = curli.batch([("GET", "me"), ("GET", "me")], concurrency=2)
+    assert [response.json() for response in results] == [{"me": "Bearer tok-alice"}] * 2
+    assert curli.get("me").json() == {"me": None}
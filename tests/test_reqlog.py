@@ -0,0 +1,62 @@
+import io
+import json
+import time
+
+import httpx
+import pytest
+
+from apibean.client.engine import RequestLog
+
+
+class _FailingFile(io.StringIO):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def write(self, text):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        return super().write(text)
+
+
+def _response(path):
+    return httpx.Response(200, request=httpx.Request("GET", f"http://api.test/{ path }",
+            headers={"authorization": "Bearer secret"}))
+
+
+def test_writer_survives_a_failed_write():
+    target = _FailingFile(failures=1)
+    request_log = RequestLog(target, batch_size=1, flush_interval=0.01)
+    request_log.log(_response("lost"))
+    deadline = time.monotonic() + 5
+    while request_log.stats["write_errors"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    request_log.log(_response("kept"))
+    request_log.close()
+    assert request_log.stats["write_errors"] == 1
+    assert request_log.stats["written"] == 1
+    record = json.loads(target.getvalue())
+    assert (record["url"], record["headers"]["authorization"]) == ("http://api.test/kept", "***")
+
+
+def test_close_keeps_the_file_of_a_slow_writer_open(tmp_path):
+    path = tmp_path / "requests.ndjson"
+    request_log = RequestLog(path, batch_size=1, flush_interval=0.01)
+    format_record = request_log._format
+    def slow_format(record):
+        time.sleep(0.2)
+        return format_record(record)
+    request_log._format = slow_format
+    writer = request_log._writer
+    for index in range(3):
+        request_log.log(_response(f"slow{ index }"))
+    with pytest.warns(RuntimeWarning, match="still writing"):
+        pending = request_log.close(timeout=0.05)
+    assert pending > 0
+    assert not request_log._file.closed
+    writer.join(5)
+    assert request_log._file.closed
+    assert request_log.stats["written"] == 3
+    assert [json.loads(line)["url"] for line in path.read_text().splitlines()] == \
+            [f"http://api.test/slow{ index }" for index in range(3)]
@@ -0,0 +1,20 @@
+from apibean.client.engine import Store
+
+
+def test_update_without_change_keeps_the_version():
+    store = Store(profile="alice")
+    changes = []
+    store.subscribe(lambda store, profile: changes.append(profile))
+    store.update(access_token="tok-1")
+    version = store.version
+    store.update()
+    store.update(access_token="tok-1")
+    assert store.version == version and changes == ["alice"]
+    store.update(access_token="tok-2")
+    assert store.version == version + 1 and store["access_token"] == "tok-2"
+
+
+def test_update_of_a_new_key_with_none_is_a_change():
+    store = Store(profile="alice")
+    store.update(access_token=None)
+    assert store.version == 1 and "access_token" in store
@@ -0,0 +1,74 @@
+import io
+import json
+
+import httpx
+import pytest
+
+from apibean.client.engine import Agent, Curli, Store
+
+
+def _build_curli():
+    def handler(request):
+        return httpx.Response(200, content=b'{"id": 1}\n{"id": 2}\n')
+
+    curli = Curli(httpx.Client(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store())
+    curli.in_session(base_url="http://api.test")
+    return curli
+
+
+def test_error_raised_in_the_block_is_not_recorded_as_a_request_error():
+    curli = _build_curli()
+    instrumentation = curli.instrument()
+    with pytest.raises(KeyError):
+        with curli.stream("GET", "export") as r:
+            assert r.status_code == 200
+            raise KeyError("id")
+    report = instrumentation.aggregator.report()
+    assert [(series["count"], series["errors"]) for series in report.values()] == [(1, 0)]
+
+
+def test_streamed_requests_are_logged():
+    curli = _build_curli()
+    target = io.StringIO()
+    curli.log_requests(target, flush_interval=0.01)
+    with curli.stream("POST", "export", content=iter([b"chunk"])) as r:
+        assert [record["id"] for record in r.iter_json_records()] == [1, 2]
+    curli.unlog_requests()
+    record = json.loads(target.getvalue())
+    assert (record["method"], record["url"]) == ("POST", "http://api.test/export")
+
+
+def _build_agent():
+    calls = []
+
+    def handler(request):
+        if request.url.path == "/auth/refresh-token":
+            calls.append("refresh")
+            return httpx.Response(200, json={"id": "u1", "access_token": "tok-1", "refresh_token": "ref",
+                    "expiration": "2099-01-01T00:00:00"})
+        if request.headers.get("authorization") != "Bearer tok-1":
+            return httpx.Response(401)
+        calls.append(request.read())
+        return httpx.Response(200)
+
+    curli = Curli(httpx.Client(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store(profile="u1"))
+    curli.in_session(base_url="http://api.test")
+    curli.as_account(id="u1", email="u1@test", access_token="tok-0", refresh_token="ref",
+            expiration="2099-01-01T00:00:00")
+    return Agent(curli).enable_auto_refresh(), calls
+
+
+def test_upload_rejected_with_401_is_not_sent_again_without_its_body(tmp_path):
+    agent, calls = _build_agent()
+    source = tmp_path / "users.ndjson"
+    source.write_bytes(b'{"id": 1}\n' * 1000)
+    assert agent._curli.upload("import", str(source), chunk_size=1024).status_code == 401
+    assert calls == []
+
+
+def test_request_rejected_with_401_is_sent_again_with_the_refreshed_token():
+    agent, calls = _build_agent()
+    assert agent._curli.post("import", content=b"payload").status_code == 200
+    assert calls == ["refresh", b"payload"]
@@ -0,0 +1,78 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import httpx
+
+from apibean.client.engine import Agent, AsyncAgent, AsyncCurli, Curli, Store
+
+EXPIRED = "2000-01-01T00:00:00"
+
+
+def _refresh_response(calls):
+    calls.append("refresh")
+    return httpx.Response(200, json={"id": "u1", "access_token": f"tok-{ len(calls) }",
+            "refresh_token": "ref", "expiration": "2099-01-01T00:00:00"})
+
+
+def _build_agent(handler, is_async = False):
+    client_class, curli_class, agent_class = (httpx.AsyncClient, AsyncCurli, AsyncAgent) if is_async \
+            else (httpx.Client, Curli, Agent)
+    curli = curli_class(client_class(transport=httpx.MockTransport(handler)),
+            session_store=Store(), account_store=Store(profile="u1"))
+    curli.in_session(base_url="http://api.test")
+    curli.as_account(id="u1", email="u1@test", access_token="tok-0", refresh_token="ref", expiration=EXPIRED)
+    return agent_class(curli).enable_auto_refresh()
+
+
+def test_concurrent_threads_share_one_refresh():
+    calls = []
+    lock = threading.Lock()
+
+    def handler(request):
+        if request.url.path == "/auth/refresh-token":
+            time.sleep(0.05)
+            with lock:
+                return _refresh_response(calls)
+        return httpx.Response(200, json={"me": request.headers.get("authorization")})
+
+    agent = _build_agent(handler)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(lambda _: agent._curli.get("me"), range(8)))
+    assert calls == ["refresh"]
+    assert {r.json()["me"] for r in responses} == {"Bearer tok-1"}
+
+
+def test_concurrent_tasks_share_one_refresh():
+    calls = []
+
+    async def handler(request):
+        if request.url.path == "/auth/refresh-token":
+            await asyncio.sleep(0.05)
+            return _refresh_response(calls)
+        return httpx.Response(200, json={"me": request.headers.get("authorization")})
+
+    agent = _build_agent(handler, is_async=True)
+
+    async def run():
+        return await asyncio.gather(*[agent._curli.get("me") for _ in range(8)])
+
+    responses = asyncio.run(run())
+    assert calls == ["refresh"]
+    assert {r.json()["me"] for r in responses} == {"Bearer tok-1"}
+
+
+def test_failed_refresh_is_not_retried_during_the_backoff():
+    calls = []
+
+    def handler(request):
+        if request.url.path == "/auth/refresh-token":
+            calls.append("refresh")
+            return httpx.Response(503)
+        return httpx.Response(200, json={"me": request.headers.get("authorization")})
+
+    agent = _build_agent(handler)
+    assert agent._curli.get("me").json() == {"me": "Bearer tok-0"}
+    assert agent._curli.get("me").json() == {"me": "Bearer tok-0"}
+    assert calls == ["refresh"]